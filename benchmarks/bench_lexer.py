@@ -0,0 +1,105 @@
+"""
+Compares the single-pass lexer against the previous engine that tried every
+pattern of Lexer.codes one after another at each position.
+
+	python benchmarks/bench_lexer.py --size 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cclr_py_scripts.lexer import Lexer, Token, TokenList, TokenTypes
+
+def tokenize_sequential(script:str) -> TokenList:
+	"""
+	The lexer loop used before the master pattern, kept here as the baseline.
+	"""
+	tokens:list = []
+	i:int = 0
+	r:int = 0
+	c:int = 0
+	while i != len(script):
+		for pattern, type in Lexer.codes.items():
+			m = pattern.match(script, i)
+			if m:
+				text_length:int = m.end(0) - m.start(0)
+				if type != TokenTypes.NONE:
+					tokens.append( Token(script[i:i+text_length], i, r, c, type) )
+				i += text_length
+				c += text_length
+				if type == TokenTypes.NEWLINE:
+					c = 0
+					r += 1
+				break
+		if tokens[-1].type == TokenTypes.ERROR:
+			return TokenList([])
+	return TokenList(tokens)
+
+def make_script(size:int, seed:int=0) -> str:
+	rng = random.Random(seed)
+	lines:list = []
+	length:int = 0
+	while length < size:
+		n:int = rng.randrange(4)
+		if n == 0:
+			line = "alc(static const) name_%d:int = %d * (%d + var_%d) - %d / 4;" % (
+				length, rng.randrange(1000), rng.randrange(1000), rng.randrange(100), rng.randrange(1000))
+		elif n == 1:
+			line = "\talc value%d:float = .%d;" % (length, rng.randrange(1000))
+		elif n == 2:
+			line = "// comment number %d with some words" % length
+		else:
+			line = "a >= b == c <= d | e ^ f % g & h ? i : j;"
+		lines.append(line)
+		length += len(line) + 1
+	return "\n".join(lines) + "\n"
+
+def bench(function, script:str, repeat:int) -> tuple:
+	best:float = float("inf")
+	tokens = None
+	for _ in range(repeat):
+		start:float = time.perf_counter()
+		tokens = function(script)
+		best = min(best, time.perf_counter() - start)
+	return best, tokens
+
+def memory(function, script:str) -> int:
+	tracemalloc.start()
+	tokens = function(script)
+	size:int = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	del tokens
+	return size
+
+def main() -> None:
+	args = argparse.ArgumentParser(description=__doc__)
+	args.add_argument("--size", type=float, default=4, help="Input size in MB.")
+	args.add_argument("--repeat", type=int, default=3)
+	args.add_argument("--seed", type=int, default=0)
+	options = args.parse_args()
+
+	script:str = make_script(int(options.size * 1024 * 1024), options.seed)
+	before, old_tokens = bench(tokenize_sequential, script, options.repeat)
+	after, new_tokens = bench(Lexer().tokenize, script, options.repeat)
+
+	assert [(t.text, t.idx, t.row, t.col, t.type) for t in old_tokens] == \
+		[(t.text, t.idx, t.row, t.col, t.type) for t in new_tokens], "Lexers disagree"
+
+	count:int = len(new_tokens)
+	print("Input: {:.1f} MB, {} tokens".format(len(script) / 1024 / 1024, count))
+	print("Sequential patterns : {:>12,.0f} tokens/sec ({:.2f}s)".format(count / before, before))
+	print("Master pattern      : {:>12,.0f} tokens/sec ({:.2f}s)".format(count / after, after))
+	print("Speedup             : {:.2f}x".format(before / after))
+
+	before = memory(tokenize_sequential, script) / count
+	after = memory(Lexer().tokenize, script) / count
+	print("Sequential patterns : {:>8.1f} bytes/token".format(before))
+	print("Master pattern      : {:>8.1f} bytes/token".format(after))
+
+if __name__ == "__main__":
+	main()
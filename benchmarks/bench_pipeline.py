@@ -0,0 +1,77 @@
+"""
+Builds a folder of scripts from corpus.py with the serial driver and with the pipelined one, see
+Pipeline, and prints the throughput of both. --latency adds a sleep before every read and every
+write of a script, like a network drive or a cold cache would.
+
+	python benchmarks/bench_pipeline.py
+	python benchmarks/bench_pipeline.py --files 200 --size 20KB --latency 5
+"""
+import argparse
+import contextlib
+import functools
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus, parse_size
+from cclr_py_scripts import entry
+
+DRIVERS:tuple = ("serial", "pipeline")
+
+def with_latency(function, seconds:float):
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		time.sleep(seconds)
+		return function(*args, **kwargs)
+	return wrapper
+
+def add_latency(seconds:float) -> None:
+	"""Makes every script read and every output write of a build wait *seconds* first."""
+	for name in ("read_script", "save_outputs", "write_outputs"):
+		setattr(entry, name, with_latency(getattr(entry, name), seconds))
+
+def build(folder:str, driver:str) -> float:
+	start:float = time.perf_counter()
+	with contextlib.redirect_stdout(io.StringIO()):
+		code:int = entry.build(folder, os.path.join(folder, "__cclr__"), True, False, force=True, jobs=1,
+			pipeline=driver == "pipeline")
+	assert code == 0, "The corpus failed to build"
+	return time.perf_counter() - start
+
+def main() -> None:
+	args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args.add_argument("--files", type=int, default=100)
+	args.add_argument("--size", default="10KB", help="Size of each script.")
+	args.add_argument("--latency", type=float, default=0, help="Milliseconds added to every read and write.")
+	args.add_argument("--seed", type=int, default=0)
+	args.add_argument("--repeat", type=int, default=3, help="Each time is the best of this many builds.")
+	options = args.parse_args()
+
+	if options.latency:
+		add_latency(options.latency / 1000)
+
+	with tempfile.TemporaryDirectory() as folder:
+		total:int = 0
+		for i in range(options.files):
+			script:str = make_corpus(parse_size(options.size), options.seed + i)
+			total += len(script)
+			with open(os.path.join(folder, "s%s.cclr" % i), "w") as file:
+				file.write(script)
+
+		best:dict = {}
+		for driver in DRIVERS:
+			best[driver] = min([build(folder, driver) for _ in range(options.repeat)])
+
+	print("{} scripts of {}, {:.0f} ms latency".format(options.files, options.size, options.latency))
+	print("{:<10}{:>10}{:>12}{:>10}".format("driver", "seconds", "scripts/s", "MB/s"))
+	for driver in DRIVERS:
+		seconds:float = best[driver]
+		print("{:<10}{:>10.3f}{:>12.1f}{:>10.2f}".format(driver, seconds, options.files / seconds, total / seconds / 1024**2))
+	print("Speedup: {:.2f}x".format(best["serial"] / best["pipeline"]))
+
+if __name__ == "__main__":
+	main()
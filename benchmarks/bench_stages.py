@@ -0,0 +1,218 @@
+"""
+Times the lexer, parser and compiler, and the whole build, also in low memory mode, on scripts from corpus.py, then compares
+the results with baseline.json. Times are divided by a calibration loop first, so a baseline saved
+on one machine can be checked on another. A stage is flagged when it got slower or bigger than the
+baseline allows, or when its time grows faster with the input size than the allowed exponent.
+Exits with 1 when anything is flagged.
+
+	python benchmarks/bench_stages.py
+	python benchmarks/bench_stages.py --sizes 1KB 1MB 100MB --repeat 1
+	python benchmarks/bench_stages.py --save-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus, parse_size
+from cclr_py_scripts import entry
+from cclr_py_scripts.commands import CmdScript
+from cclr_py_scripts.compiler import Compiler
+from cclr_py_scripts.lexer import Lexer
+from cclr_py_scripts.parser import Parser
+
+STAGES:tuple = ("lex", "parse", "compile", "build", "lowmem")
+SIZES:tuple = ("1KB", "10KB", "100KB", "1MB")
+BASELINE:str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+THRESHOLDS:dict = {
+	"seconds"		: 1.25,		# Slowest allowed time, relative to the baseline
+	"peak_bytes"	: 1.25,		# Biggest allowed peak memory, relative to the baseline
+	"exponent"		: 1.2,		# Time may grow at most like size ** exponent
+	"min_seconds"	: 0.005,	# Shorter times are too noisy to compare or fit
+}
+
+def calibrate() -> float:
+	"""Times a fixed pure Python workload, the unit every stage time is measured in."""
+	best:float = float("inf")
+	for _ in range(5):
+		start:float = time.perf_counter()
+		total:int = 0
+		for i in range(200000):
+			total += i % 7
+		"".join([str(i) for i in range(20000)])
+		best = min(best, time.perf_counter() - start)
+	return best
+
+class StageRunner:
+	"""
+	Runs each stage on one script, every stage gets the output of the stage before it.
+	"""
+	script:str = ""
+	folder:str = ""
+	path:str = ""
+	tokens = None
+	cmd_script:CmdScript = None
+
+	def __init__(self, script:str, folder:str) -> None:
+		self.script = script
+		self.folder = folder
+		self.tokens = None
+		self.cmd_script = None
+		self.path = os.path.join(folder, "bench.cclr")
+		with open(self.path, "w") as file:
+			file.write(script)
+
+	def build(self) -> None:
+		with contextlib.redirect_stdout(io.StringIO()):
+			code:int = entry.build(self.path, os.path.join(self.folder, "__cclr__"), False, False, force=True, jobs=1)
+		assert code == 0, "The corpus failed to build"
+
+	def lowmem(self) -> None:
+		with contextlib.redirect_stdout(io.StringIO()):
+			code:int = entry.build(self.path, os.path.join(self.folder, "__cclr__"), False, False, force=True, low_memory=True)
+		assert code == 0, "The corpus failed to build in low memory mode"
+
+	def compile(self) -> None:
+		Compiler().emit(self.cmd_script, io.StringIO(), io.StringIO())
+
+	def lex(self) -> None:
+		self.tokens = Lexer().tokenize(self.script)
+
+	def parse(self) -> None:
+		self.cmd_script = Parser().parse(self.tokens)
+		assert isinstance(self.cmd_script, CmdScript), "The corpus failed to parse"
+
+	def measure(self, stage:str, repeat:int) -> dict:
+		run = getattr(self, stage)
+		best:float = float("inf")
+		for _ in range(repeat):
+			start:float = time.perf_counter()
+			run()
+			best = min(best, time.perf_counter() - start)
+
+		tracemalloc.start()
+		before:int = tracemalloc.get_traced_memory()[0]
+		run()
+		peak:int = tracemalloc.get_traced_memory()[1] - before
+		tracemalloc.stop()
+
+		return {
+			"seconds"		: best,
+			"tokens_per_sec": len(self.tokens) / best if best > 0 else 0,
+			"peak_bytes"	: peak,
+		}
+
+def run(sizes:list, seed:int, repeat:int) -> tuple:
+	"""Returns the results of every stage and the token count, both by size."""
+	results:dict = {stage: {} for stage in STAGES}
+	tokens:dict = {}
+	with tempfile.TemporaryDirectory() as folder:
+		for size in sizes:
+			runner:StageRunner = StageRunner(make_corpus(parse_size(size), seed), folder)
+			for stage in STAGES:
+				results[stage][size] = runner.measure(stage, repeat)
+			tokens[size] = len(runner.tokens)
+	return results, tokens
+
+def fit_exponent(points:list) -> float:
+	"""Least squares slope of log(seconds) over log(size), None with fewer than two points."""
+	if len(points) < 2:
+		return None
+	xs:list = [math.log(size) for size, _ in points]
+	ys:list = [math.log(seconds) for _, seconds in points]
+	mean_x:float = sum(xs) / len(xs)
+	mean_y:float = sum(ys) / len(ys)
+	spread:float = sum((x - mean_x) ** 2 for x in xs)
+	if spread == 0:
+		return None
+	return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+def check(report:dict, baseline:dict, thresholds:dict) -> list:
+	"""Returns a message for every regression in *report* compared with *baseline*."""
+	problems:list = []
+	for stage in STAGES:
+		points:list = [(parse_size(size), result["seconds"]) for size, result in report["results"][stage].items()
+			if result["seconds"] >= thresholds["min_seconds"]]
+		exponent:float = fit_exponent(points)
+		report["exponents"][stage] = exponent
+		if exponent != None and exponent > thresholds["exponent"]:
+			problems.append("{} scales as size^{:.2f}, above size^{}".format(stage, exponent, thresholds["exponent"]))
+
+		if baseline == None:
+			continue
+		for size, result in report["results"][stage].items():
+			base:dict = baseline["results"].get(stage, {}).get(size)
+			if base == None:
+				continue
+			if base["seconds"] >= thresholds["min_seconds"]:
+				ratio:float = (result["seconds"] / report["calibration"]) / (base["seconds"] / baseline["calibration"])
+				if ratio > thresholds["seconds"]:
+					problems.append("{} at {} takes {:.2f}x the baseline time".format(stage, size, ratio))
+			if base["peak_bytes"] > 0:
+				ratio = result["peak_bytes"] / base["peak_bytes"]
+				if ratio > thresholds["peak_bytes"]:
+					problems.append("{} at {} peaks at {:.2f}x the baseline memory".format(stage, size, ratio))
+	return problems
+
+def print_report(report:dict) -> None:
+	print("{:<8} {:>8} {:>10} {:>16} {:>12}".format("stage", "size", "seconds", "tokens/sec", "peak MB"))
+	for stage in STAGES:
+		for size, result in report["results"][stage].items():
+			print("{:<8} {:>8} {:>10.4f} {:>16,.0f} {:>12.2f}".format(stage, size, result["seconds"],
+				result["tokens_per_sec"], result["peak_bytes"] / 1024 / 1024))
+	for stage, exponent in report["exponents"].items():
+		if exponent != None:
+			print("{} scales as size^{:.2f}".format(stage, exponent))
+
+def main() -> None:
+	args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args.add_argument("--sizes", nargs="+", default=list(SIZES), help="Corpus sizes, from 1KB up to 100MB.")
+	args.add_argument("--seed", type=int, default=0)
+	args.add_argument("--repeat", type=int, default=3, help="Each time is the best of this many runs.")
+	args.add_argument("--baseline", default=BASELINE)
+	args.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+	args.add_argument("--json", help="Also write the results to this file.")
+	options = args.parse_args()
+
+	baseline:dict = None
+	if os.path.isfile(options.baseline):
+		with open(options.baseline, "r") as file:
+			baseline = json.load(file)
+	thresholds:dict = dict(THRESHOLDS, **(baseline or {}).get("thresholds", {}))
+
+	results, tokens = run(options.sizes, options.seed, options.repeat)
+	report:dict = {
+		"python"		: platform.python_version(),
+		"seed"			: options.seed,
+		"calibration"	: calibrate(),
+		"thresholds"	: thresholds,
+		"tokens"		: tokens,
+		"results"		: results,
+		"exponents"		: {},
+	}
+	problems:list = check(report, None if options.save_baseline else baseline, thresholds)
+	print_report(report)
+
+	if options.json:
+		with open(options.json, "w") as file:
+			json.dump(report, file, indent="\t")
+	if options.save_baseline:
+		with open(options.baseline, "w") as file:
+			json.dump(report, file, indent="\t")
+		print("Saved the baseline to '{}'".format(options.baseline))
+
+	for problem in problems:
+		print("REGRESSION: " + problem)
+	sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+	main()
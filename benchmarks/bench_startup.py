@@ -0,0 +1,71 @@
+"""
+Measures how long starting the CLI spends importing, with python -X importtime, and fails when
+importing cclr_py_scripts.entry takes longer than the budget or loads a module that only some
+commands need. Each run is a fresh interpreter, the time kept is the best of all runs.
+
+	python benchmarks/bench_startup.py
+	python benchmarks/bench_startup.py --budget 80 --runs 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE:str = "cclr_py_scripts.entry"
+BUDGET_MS:float = 100
+DEFERRED:tuple = ( # Only imported by the commands or options that use them
+	"tqdm",
+	"asyncio",
+	"concurrent.futures.process",
+	"cclr_py_scripts.watch",
+	"cclr_py_scripts.profiling",
+	"cclr_py_scripts.pipeline",
+	"cclr_py_scripts.distributed",
+)
+
+def import_times(module:str) -> dict:
+	"""Imports *module* in a fresh interpreter, returns the cumulative microseconds of every module it loaded."""
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+		cwd=ROOT, capture_output=True, text=True, check=True)
+	times:dict = {}
+	for line in result.stderr.splitlines():
+		if not line.startswith("import time:") or "|" not in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		if cumulative.strip().isdigit():
+			times[name.strip()] = int(cumulative)
+	return times
+
+def main() -> None:
+	args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args.add_argument("--budget", type=float, default=BUDGET_MS, help="Slowest allowed import, in milliseconds.")
+	args.add_argument("--runs", type=int, default=10)
+	args.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list.")
+	options = args.parse_args()
+
+	import_times(MODULE) # Writes the bytecode caches, so every measured run starts the same
+	best:dict = None
+	for _ in range(options.runs):
+		times:dict = import_times(MODULE)
+		if best == None or times[MODULE] < best[MODULE]:
+			best = times
+
+	print("{:>10}  {}".format("ms", "module"))
+	for name, micros in sorted(best.items(), key=lambda item: -item[1])[:options.top]:
+		print("{:>10.1f}  {}".format(micros / 1000, name))
+
+	problems:list = []
+	total:float = best[MODULE] / 1000
+	if total > options.budget:
+		problems.append("importing {} takes {:.1f} ms, above the {:.0f} ms budget".format(MODULE, total, options.budget))
+	for name in DEFERRED:
+		if name in best:
+			problems.append("importing {} loads {}".format(MODULE, name))
+
+	for problem in problems:
+		print("REGRESSION: " + problem)
+	sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,117 @@
+"""
+Seeded generator of synthetic .cclr scripts for the benchmarks. The same size and seed always
+give the same script, which mixes deep expressions, alc declarations with and without options,
+comments and a deep indent on every line.
+
+	python benchmarks/corpus.py --size 10MB --seed 1 -o big.cclr
+"""
+import argparse
+import random
+import re
+
+SIZE_UNITS:dict = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+INDENTS:tuple = ("\t\t\t\t", " " * 16, "\t" * 8)
+BINARY_OPS:tuple = ("+", "-", "*", "/", "%", "|", "^", "&", "==", ">", "<", ">=", "<=")
+TYPES:tuple = ("int", "float", "bool", "long")
+OPTIONS:tuple = ("static", "const")
+
+def parse_size(size:str) -> int:
+	"""Reads sizes like 512, 1KB or 100MB."""
+	m = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([KMG]?B?)\s*", size.upper())
+	if m == None:
+		raise ValueError("Invalid size '%s'" % size)
+	return int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+
+class Corpus:
+	"""
+	Writes lines of a synthetic script, *max_depth* is how deep parenthesis are nested at most.
+	"""
+	rng:random.Random = None
+	max_depth:int = 24
+	indent:str = ""
+	names:int = 0
+
+	def __init__(self, seed:int=0, max_depth:int=24) -> None:
+		self.rng = random.Random(seed)
+		self.max_depth = max_depth
+		self.indent = self.rng.choice(INDENTS)
+		self.names = 0
+
+	def comment(self) -> str:
+		if self.rng.randrange(2):
+			return "// comment %d about the next few declarations" % self.rng.randrange(10**6)
+		return "/* block comment %d */" % self.rng.randrange(10**6)
+
+	def declaration(self) -> str:
+		rng = self.rng
+		self.names += 1
+		line:str = "alc"
+		if rng.randrange(3) == 0:
+			line += "( %s )" % " ".join(rng.sample(OPTIONS, rng.randrange(1, 3)))
+		line += " name_%d:%s" % (self.names, rng.choice(TYPES))
+		if rng.randrange(4) != 0:
+			# Mostly short expressions, with a deep one now and then
+			depth:int = rng.randrange(self.max_depth + 1) if rng.randrange(16) == 0 else rng.randrange(3)
+			line += " = " + self.expression(depth)
+		line += ";"
+		if rng.randrange(8) == 0:
+			line += " " + self.comment()
+		return line
+
+	def expression(self, depth:int) -> str:
+		rng = self.rng
+		operands:list = []
+		for _ in range(rng.randrange(1, 4)):
+			operands.append(self.operand())
+		if depth > 0:
+			operands.insert(rng.randrange(len(operands)+1), "( %s )" % self.expression(depth-1))
+		expression:str = operands[0]
+		for operand in operands[1:]:
+			expression += " %s %s" % (rng.choice(BINARY_OPS), operand)
+		return expression
+
+	def line(self) -> str:
+		n:int = self.rng.randrange(16)
+		if n == 0:
+			return ""
+		elif n < 3:
+			return self.indent + self.comment()
+		elif n == 3:
+			return self.indent + self.expression(self.rng.randrange(4))
+		return self.indent + self.declaration()
+
+	def operand(self) -> str:
+		rng = self.rng
+		n:int = rng.randrange(5)
+		if n == 0:
+			return "-%d" % rng.randrange(1000)
+		elif n < 3:
+			return "name_%d" % rng.randrange(1, self.names + 2)
+		return str(rng.randrange(10**6))
+
+	def script(self, size:int) -> str:
+		"""Returns a script of at least *size* characters, ending with a line break."""
+		lines:list = []
+		length:int = 0
+		while length < size:
+			line:str = self.line()
+			lines.append(line)
+			length += len(line) + 1
+		return "\n".join(lines) + "\n"
+
+def make_corpus(size:int, seed:int=0, max_depth:int=24) -> str:
+	return Corpus(seed, max_depth).script(size)
+
+def main() -> None:
+	args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	args.add_argument("--size", default="1MB", help="Size of the script, like 1KB or 100MB.")
+	args.add_argument("--seed", type=int, default=0)
+	args.add_argument("--depth", type=int, default=24, help="Deepest nesting of parenthesis.")
+	args.add_argument("-o", "--output", default="corpus.cclr")
+	options = args.parse_args()
+
+	with open(options.output, "w") as file:
+		file.write(make_corpus(parse_size(options.size), options.seed, options.depth))
+
+if __name__ == "__main__":
+	main()
@@ -1,5 +1,14 @@
-from cclr_py_scripts import compiler
-from cclr_py_scripts import lexer
-from cclr_py_scripts import parser
-from cclr_py_scripts import commands
-from cclr_py_scripts import entry
\ No newline at end of file
+__version__ = "0.0.1B"
+
+import importlib
+
+# Submodules are imported the first time they are used, so starting the CLI only loads what a command needs
+SUBMODULES:tuple = ("commands", "compiler", "cxx", "dependencies", "distributed", "entry", "lexer", "manifest", "outputs", "parsecache", "parser", "pipeline", "profiling", "progress", "watch")
+
+def __getattr__(name:str):
+	if name in SUBMODULES:
+		return importlib.import_module("." + name, __name__)
+	raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+def __dir__() -> list:
+	return sorted(list(globals()) + list(SUBMODULES))
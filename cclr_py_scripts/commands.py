@@ -1,10 +1,9 @@
 
+from array import array
+from bisect import bisect_right
 from enum import IntEnum, auto
 
-try:
-	from cclr_py_scripts.lexer import Token
-except:
-	from lexer import Token
+from .lexer import Token
 
 
 class CmdTypes(IntEnum):
@@ -18,6 +17,7 @@ class CmdTypes(IntEnum):
 	VARIABLE:int			= auto()
 	ASSIGNMENT:int			= auto()
 	DECLARATION:int			= auto()
+	IMPORT:int				= auto()
 	NO_TYPE:int				= auto()
 	
 
@@ -32,9 +32,6 @@ class Command:
 		if type != -1:
 			self.type = type
 
-		if self.type == CmdTypes.ERROR:
-			breakpoint()
-
 		self.scope = scope
 		self.message = msg
 
@@ -59,8 +56,8 @@ class CommandList:
 	def __getitem__(self, key):
 		return self.commands[key]
 
-	def __init__(self, commands:list=[]) -> None:
-		self.commands = commands
+	def __init__(self, commands:list=None) -> None:
+		self.commands = commands if commands != None else []
 
 	def __iter__(self):
 		return self.commands.__iter__()
@@ -86,14 +83,10 @@ class CmdBinaryExpression(Command):
 	left:Command = CmdEmpty()
 	right:Command = CmdEmpty()
 
-	def __init__(self, op:Token="", left:Command=CmdEmpty(), right:Command=CmdEmpty()) -> None:
+	def __init__(self, op:Token="", left:Command=None, right:Command=None) -> None:
 		self.op = op
-		
-		if left != None:
-			self.left = left
-
-		if right != None:
-			self.right = right
+		self.left = left if left != None else CmdEmpty()
+		self.right = right if right != None else CmdEmpty()
 
 	def __str__(self) -> str:
 		string:str = ""
@@ -119,8 +112,6 @@ class CmdError(Command):
 	def __init__(self, token:Token, msg:str="") -> None:
 		self.msg = msg
 		self.token = token
-		print(str(self))
-		breakpoint()
 
 	def __str__(self) -> str:
 		return "Error in line %s col %s : %s"%(self.token.row, self.token.col, self.msg)
@@ -132,28 +123,34 @@ class CmdGroup(Command):
 	pos_op:str = "NA"
 	op:str = "NA"
 
-	def __init__(self, type:int=CmdTypes.NO_TYPE, left:Command=CmdEmpty(), right:Command=CmdEmpty(), pre_op:str="NA", pos_op:str="NA", op:str="NA") -> None:
+	def __init__(self, type:int=CmdTypes.NO_TYPE, left:Command=None, right:Command=None, pre_op:str="NA", pos_op:str="NA", op:str="NA") -> None:
 		self.type = type
-		self.left = left
-		self.right = right
+		self.left = left if left != None else CmdEmpty()
+		self.right = right if right != None else CmdEmpty()
 		self.pre_op = pre_op
 		self.pos_op = pos_op
 		self.op = op
 
 	def __str__(self) -> str:
-		string:str = ""
-		if self.pre_op != "NA":
-			string += self.pre_op + " "
-		if not self.left.is_empty():
-			string += str(self.left) + " "
-		if self.op != "NA":
-			string += self.op + " "
-		if not self.right.is_empty():
-			string += str(self.right) + " "
-		if self.pos_op != "NA":
-			string += self.pos_op + " "
-		string = string[:-1]
-		return string
+		# Walks nested groups with a stack instead of recursion, so long expressions can be printed
+		parts:list = []
+		stack:list = [self]
+		while stack:
+			item = stack.pop()
+			if isinstance(item, CmdGroup):
+				if item.pos_op != "NA":
+					stack.append(item.pos_op)
+				if not item.right.is_empty():
+					stack.append(item.right)
+				if item.op != "NA":
+					stack.append(item.op)
+				if not item.left.is_empty():
+					stack.append(item.left)
+				if item.pre_op != "NA":
+					stack.append(item.pre_op)
+			else:
+				parts.append(str(item))
+		return " ".join(parts)
 
 	def source(self) -> list:
 		assert(False, "Not implemented")
@@ -185,12 +182,117 @@ class CmdNumericLiteral(Command):
 	def source(self) -> list:
 		return [self.value]
 
+class CommandEnds:
+	"""
+	The index of the token after each top level command, in order. Parser.reparse moves every end
+	after an edit by the same number of tokens, that is only recorded as a pending shift, like the
+	starts of a CompactTokenList, so the ends after an edit aren't rewritten on every edit.
+	"""
+	values:array = None
+	shift_keys:list = []	# Index of the first end of each pending shift, see splice
+	shift_values:list = []	# Tokens added to each end from the matching key on
+
+	MAX_SHIFTS:int = 64		# Pending shifts kept before they are written into *values*
+
+	def __eq__(self, other) -> bool:
+		return list(self) == list(other)
+
+	def __getitem__(self, key:int) -> int:
+		if key < 0:
+			key += len(self.values)
+		value:int = self.values[key]
+		if self.shift_keys:
+			value += self.shift_at(key)
+		return value
+
+	def __init__(self, values=()) -> None:
+		self.values = array("q", values)
+		self.shift_keys = []
+		self.shift_values = []
+
+	def __iter__(self):
+		self.compact()
+		return iter(self.values)
+
+	def __len__(self) -> int:
+		return len(self.values)
+
+	def __repr__(self) -> str:
+		return repr(list(self))
+
+	def bisect_left(self, value:int) -> int:
+		"""Returns the index of the first end at or after *value*."""
+		low:int = 0
+		high:int = len(self.values)
+		while low < high:
+			middle:int = (low + high) // 2
+			if self[middle] < value:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def compact(self) -> None:
+		"""Writes every pending shift into *values*."""
+		keys:list = self.shift_keys + [len(self.values)]
+		for i, shift in enumerate(self.shift_values):
+			first, stop = keys[i], keys[i+1]
+			if shift:
+				self.values[first:stop] = array("q", [value + shift for value in self.values[first:stop]])
+		self.shift_keys = []
+		self.shift_values = []
+
+	def shift_at(self, key:int) -> int:
+		"""Returns the pending shift of the end at *key*."""
+		i:int = bisect_right(self.shift_keys, key) - 1
+		if i < 0:
+			return 0
+		return self.shift_values[i]
+
+	def splice(self, first:int, stop:int, values:list, shift:int) -> None:
+		"""
+		Replaces the ends *first* to *stop* with *values*, the ends after *stop* move by *shift*
+		tokens. That is only recorded as a pending shift, see CompactTokenList.splice.
+		"""
+		count:int = len(values)
+		moved:int = count - (stop - first)
+		after:int = self.shift_at(stop) + shift
+
+		keys:list = []
+		shifts:list = []
+		for key, value in zip(self.shift_keys, self.shift_values):
+			if key >= first:
+				break
+			keys.append(key)
+			shifts.append(value)
+		if count and shifts and shifts[-1] != 0:
+			# The new ends already hold their final value
+			keys.append(first)
+			shifts.append(0)
+		if after != (shifts[-1] if shifts else 0):
+			keys.append(first + count)
+			shifts.append(after)
+		for key, value in zip(self.shift_keys, self.shift_values):
+			if key > stop:
+				keys.append(key + moved)
+				shifts.append(value + shift)
+
+		self.values[first:stop] = array("q", values)
+		self.shift_keys = keys
+		self.shift_values = shifts
+		if len(self.shift_keys) > self.MAX_SHIFTS:
+			self.compact()
+
 class CmdScript(Command):
 	type:int = CmdTypes.SCRIPT
 	commands:list = []
+	ends:CommandEnds = None	# Index of the token after each command, set by Parser.parse
+	states:list = []		# Parser state before each command and after the last one, see Parser.state
 
-	def __init__(self, commands:list=[]) -> None:
-		self.commands = commands
+	def __init__(self, commands:list=None) -> None:
+		self.commands = commands if commands != None else []
+		self.ends = CommandEnds()
+		self.states = []
 
 	def __str__(self) -> str:
 		ret:str = ""
@@ -202,8 +304,8 @@ class CmdTokenList(Command):
 	type:int = -1
 	keys:list = []
 
-	def __init__(self, keys:list=[]) -> None:
-		self.keys = keys
+	def __init__(self, keys:list=None) -> None:
+		self.keys = keys if keys != None else []
 
 	def __str__(self) -> str:
 		ret:str = ""
@@ -222,12 +324,11 @@ class CmdVarDeclaration(Command):
 	cmd_type:Command = CmdEmpty()
 	cmd_asignment:Command = CmdEmpty()
 
-	def __init__(self, cmd_options=CmdEmpty(), cmd_name=CmdEmpty(), 
-		cmd_type=CmdEmpty(), cmd_asignment=CmdEmpty()) -> None:
-		self.cmd_options = cmd_options
-		self.cmd_name = cmd_name
-		self.cmd_type = cmd_type
-		self.cmd_asignment = cmd_asignment
+	def __init__(self, cmd_options=None, cmd_name=None, cmd_type=None, cmd_asignment=None) -> None:
+		self.cmd_options = cmd_options if cmd_options != None else CmdEmpty()
+		self.cmd_name = cmd_name if cmd_name != None else CmdEmpty()
+		self.cmd_type = cmd_type if cmd_type != None else CmdEmpty()
+		self.cmd_asignment = cmd_asignment if cmd_asignment != None else CmdEmpty()
 
 	def __str__(self) -> str:
 		string:str = "alc"+str(self.cmd_options)+" "+str(self.cmd_name)+":"+str(self.cmd_type)
@@ -237,4 +338,31 @@ class CmdVarDeclaration(Command):
 
 	def source(self) -> list:
 		return ["alc"] + self.cmd_options.source() + self.cmd_name.source() + \
-			[":"] + self.cmd_type.source() + self.cmd_asignment.source() + [";"]
\ No newline at end of file
+			[":"] + self.cmd_type.source() + self.cmd_asignment.source() + [";"]
+
+class CmdImport(Command):
+	type:int = CmdTypes.IMPORT
+	keyword:Token = None	# "import" or "inherit"
+	names:list = []			# Tokens of the dotted path, without the dots
+
+	def __init__(self, keyword:Token=None, names:list=None) -> None:
+		self.keyword = keyword
+		self.names = names if names != None else []
+
+	def __str__(self) -> str:
+		return str(self.keyword) + " " + self.name() + ";\n"
+
+	def name(self) -> str:
+		return ".".join([token.text for token in self.names])
+
+	def source(self) -> list:
+		parts:list = [self.keyword]
+		for i, token in enumerate(self.names):
+			if i != 0:
+				parts.append(".")
+			parts.append(token)
+		return parts + [";"]
+
+def script_errors(commands) -> list:
+	"""Returns (row, col, message) for each error in *commands*, in order."""
+	return [(cmd.token.row, cmd.token.col, str(cmd)) for cmd in commands if cmd.is_error()]
@@ -1,44 +1,155 @@
 
-try: 
-	from commands import *
-except: 
-	from cclr_py_scripts.commands import *
-	
+from .commands import *
+from .lexer import Lexer
+from .parser import Parser
+from .progress import progress
+
+import io
+import threading
 from enum import IntEnum, auto
-from typing import Dict
-from tqdm import tqdm
 
 class Compiler:
+	includes:dict = {} # Imported script name -> path of its header as written in #include
+
+	def __init__( self, includes:dict=None ) -> None:
+		self.includes = includes if includes != None else {}
+
+	def include_path( self, name:str ) -> str:
+		if name in self.includes:
+			return self.includes[name]
+		return name.replace(".", "/") + ".h"
 
 	def compile( self, cmd_script:CmdScript, show_pbar:bool=False ) -> str:
-		compiled:str = ""
+		compiled:io.StringIO = io.StringIO()
+		self.emit(cmd_script, compiled, show_pbar=show_pbar)
+		return compiled.getvalue()
+
+	def compile_command( self, command:Command ) -> tuple:
+		"""
+		Compiles a single top level command, so commands from Parser.iter_parse can be written out as they arrive.
+		Returns (declaration, definition), the code for the header and for the source. A variable is 
+		declared extern in the header and defined in the source, unless it is static, then it is only 
+		in the source. An import is included by both.
+		"""
+		declaration:str = ""
+		definition:str = ""
+
+		if command.type == CmdTypes.DECLARATION:
+			cmd_options:Command = command.cmd_options
+			cmd_name:Command = command.cmd_name
+			cmd_type:Command = command.cmd_type
+			cmd_asignment:Command = command.cmd_asignment
+
+			options:list = []
+			if not cmd_options.is_empty():
+				options = [str(dec_option) for dec_option in cmd_options.right.keys]
+
+			if cmd_type.is_empty() or cmd_name.is_empty():
+				assert(False)
+			name:str = str(cmd_type.value) + " " + str(cmd_name.value)
+
+			definition = "".join([dec_option + " " for dec_option in options]) + name
+			if not cmd_asignment.is_empty():
+				definition += " = " + str(cmd_asignment.right)
+			definition += ";\n"
+
+			if "static" not in options:
+				declaration = "extern " + "".join([dec_option + " " for dec_option in options]) + name + ";\n"
+				if "const" in options:
+					definition = "extern " + definition # A const is only seen by other files when it is extern
+
+		elif command.type == CmdTypes.IMPORT:
+			declaration = definition = '#include "{}"\n'.format(self.include_path(command.name()))
+
+		return declaration, definition
+
+	def emit( self, cmd_script, source, header=None, show_pbar:bool=False ) -> None:
+		"""
+		Generates the code of every command in a single pass, writing its definition to *source* and 
+		its declaration to *header* as each command is compiled. The sinks can be anything with a 
+		write method, like an open file or io.StringIO. *cmd_script* can also be any iterable of 
+		commands, such as Parser.iter_parse. The header starts with #pragma once, so a header 
+		imported by many scripts is only read once.
+		"""
+		commands = cmd_script.commands if isinstance(cmd_script, CmdScript) else cmd_script
+		write_source = source.write
+		write_header = header.write if header != None else None
+		if write_header != None:
+			write_header("#pragma once\n")
+
+		for command in progress(commands, desc="Compile C++ files", unit="command", disable=not show_pbar):
+			declaration, definition = self.compile_command(command)
+			write_source(definition)
+			if write_header != None:
+				write_header(declaration)
+
+class SourceCompiler:
+	"""
+	Compiles .cclr text in memory for programs that embed the compiler, see compile_source. The
+	Lexer and the Compiler keep nothing between calls and are shared. A Parser does, so each call
+	takes an idle one, or makes one if there is none, and gives it back when it is done. Any
+	number of threads can compile at once, and a call made during another one never sees its state.
+	"""
+	lexer:Lexer = None
+	compiler:Compiler = None
+	parsers:list = []	# Idle parsers
+	lock = None			# Guards *parsers*
+
+	def __init__(self) -> None:
+		self.lexer = Lexer()
+		self.compiler = Compiler()
+		self.parsers = []
+		self.lock = threading.Lock()
 
-		for command in tqdm(cmd_script.commands, desc="Compile C++ files", unit="command", disable=not show_pbar):
-			if command.type == CmdTypes.DECLARATION:
-				cmd_options:Command = command.cmd_options
-				cmd_name:Command = command.cmd_name
-				cmd_type:Command = command.cmd_type
-				cmd_asignment:Command = command.cmd_asignment
+	def take_parser(self) -> Parser:
+		with self.lock:
+			if self.parsers:
+				return self.parsers.pop()
+		return Parser()
 
-				if not cmd_options.is_empty():
-					dec_option:str = ""
-					for dec_option in cmd_options.right.keys:
-						compiled += dec_option + " "
+	def give_parser(self, parser:Parser) -> None:
+		parser.release()
+		with self.lock:
+			self.parsers.append(parser)
 
-				if not cmd_type.is_empty():
-					compiled += str(cmd_type.value) + " "
-				else:
-					assert(False)
+	def compile(self, text:str, includes:dict=None) -> tuple:
+		"""
+		Compiles the script *text*. Returns (cpp, h, diagnostics), *diagnostics* being (row, col,
+		message) for every lexer and parser error, like a build reports them. When there are any,
+		*cpp* and *h* are empty. *includes* is the same as for Compiler.
+		"""
+		compiler:Compiler = self.compiler if includes == None else Compiler(includes)
+		parser:Parser = self.take_parser()
+		try:
+			commands:CmdScript = parser.parse(self.lexer.tokenize(text, recover=True), recover=True)
+		finally:
+			self.give_parser(parser)
 
-				if not cmd_name.is_empty():
-					compiled += str(cmd_name.value)
-				else:
-					assert(False)
+		diagnostics:list = script_errors(commands.commands)
+		if diagnostics:
+			return "", "", diagnostics
+		cpp_file, h_file = io.StringIO(), io.StringIO()
+		compiler.emit(commands, cpp_file, h_file)
+		return cpp_file.getvalue(), h_file.getvalue(), []
 
-				if not cmd_asignment.is_empty():
-					compiled += " = " + str(cmd_asignment.right)
+	def compile_all(self, texts, includes:dict=None, threads:int=1) -> list:
+		"""
+		Returns what *compile* returns for each of *texts*, in order, compiling up to *threads* of
+		them at once. One thread reuses a single parser for every text.
+		"""
+		texts = list(texts)
+		if threads > 1 and len(texts) > 1:
+			from concurrent.futures import ThreadPoolExecutor
+			with ThreadPoolExecutor(max_workers=min(threads, len(texts))) as executor:
+				return list(executor.map(lambda text: self.compile(text, includes), texts))
+		return [self.compile(text, includes) for text in texts]
 
-				compiled += ";\n"
+SOURCE_COMPILER:SourceCompiler = SourceCompiler()	# Used by compile_source and compile_sources
 
-		return compiled
+def compile_source(text:str, includes:dict=None) -> tuple:
+	"""Compiles the .cclr text *text* in memory, returns (cpp, h, diagnostics), see SourceCompiler.compile."""
+	return SOURCE_COMPILER.compile(text, includes)
 
+def compile_sources(texts, includes:dict=None, threads:int=1) -> list:
+	"""Compiles each of *texts* in memory, returns a (cpp, h, diagnostics) for each, see SourceCompiler.compile_all."""
+	return SOURCE_COMPILER.compile_all(texts, includes, threads)
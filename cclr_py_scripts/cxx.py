@@ -0,0 +1,113 @@
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+
+from .outputs import same_content
+
+class CxxError(Exception):
+	"""Raised when the C++ compiler fails, holds what it printed."""
+	pass
+
+class ObjectCache:
+	"""
+	Compiles C++ files to object files with an outside compiler such as g++. Every object is kept
+	in the cache folder, named after the hash of the compiler command, its flags and the
+	preprocessed source, so a source that preprocesses to the same text with the same flags is
+	never given to the compiler again.
+	"""
+	FOLDER_NAME:str = "objects"
+
+	folder:str = ""
+	command:list = []	# The compiler and any arguments that come with it, like ["ccache", "g++"]
+	flags:list = []
+
+	def __init__(self, cache:str, cxx:str, flags:str="") -> None:
+		self.folder = os.path.join(cache, self.FOLDER_NAME)
+		self.command = shlex.split(cxx)
+		self.flags = shlex.split(flags)
+
+	def build(self, sources:list, jobs:int=1) -> tuple:
+		"""
+		Compiles every (source, object) pair in *sources* with up to *jobs* compilers running at
+		once. Returns (compiled, cached, failed), *failed* being a list of (source, message) in the
+		order of *sources*.
+		"""
+		compiled:int = 0
+		cached:int = 0
+		failed:list = []
+		if not sources:
+			return compiled, cached, failed
+
+		def run(pair:tuple):
+			try:
+				return self.compile(*pair)
+			except (CxxError, OSError) as e:
+				return e
+
+		if jobs > 1 and len(sources) > 1:
+			from concurrent.futures import ThreadPoolExecutor # The work is done by the compiler processes
+			with ThreadPoolExecutor(max_workers=min(jobs, len(sources))) as executor:
+				results:list = list(executor.map(run, sources))
+		else:
+			results = [run(pair) for pair in sources]
+
+		for (source, _), result in zip(sources, results):
+			if isinstance(result, Exception):
+				failed.append( (source, str(result)) )
+			elif result:
+				compiled += 1
+			else:
+				cached += 1
+		return compiled, cached, failed
+
+	def compile(self, source:str, output:str) -> bool:
+		"""
+		Makes the object file *output* from the C++ file *source*, from the cache if it can.
+		Returns True if the compiler had to run. Raises a CxxError if it failed.
+		"""
+		key:str = self.key(source)
+		path:str = self.path(key)
+		ran:bool = False
+		if not os.path.isfile(path):
+			os.makedirs(self.folder, exist_ok=True)
+			temp:str = self.temp_path(path)
+			try:
+				self.run(["-c", source, "-o", temp])
+				os.replace(temp, path)
+			finally:
+				if os.path.exists(temp):
+					os.remove(temp)
+			ran = True
+
+		# Like the .cpp files, an object with the same bytes is left untouched for the linker
+		if not same_content(path, output):
+			temp = self.temp_path(output)
+			shutil.copyfile(path, temp)
+			os.replace(temp, output)
+		return ran
+
+	def key(self, source:str) -> str:
+		"""Hashes the compiler command, the flags and *source* after the preprocessor."""
+		preprocessed:bytes = self.run(["-E", source])
+		digest = hashlib.sha256()
+		for part in self.command + self.flags:
+			digest.update(part.encode("utf-8") + b"\0")
+		digest.update(preprocessed)
+		return digest.hexdigest()
+
+	def path(self, key:str) -> str:
+		return os.path.join(self.folder, key + ".o")
+
+	def run(self, arguments:list) -> bytes:
+		"""Runs the compiler with the flags and *arguments*, returning what it wrote to stdout."""
+		result = subprocess.run(self.command + self.flags + arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		if result.returncode != 0:
+			raise CxxError(result.stderr.decode("utf-8", "replace").strip()
+				or "'{}' exited with {}".format(" ".join(self.command), result.returncode))
+		return result.stdout
+
+	def temp_path(self, path:str) -> str:
+		return "%s.%s.%s.tmp" % (path, os.getpid(), threading.get_ident())
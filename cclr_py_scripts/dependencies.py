@@ -0,0 +1,130 @@
+import os
+import re
+
+from .lexer import LazyClassAttribute
+
+class DependencyGraph:
+	"""
+	The scripts of a build and the scripts each of them imports or inherits. *scan* finds the
+	imports of every script with a single pattern over its text, without lexing or parsing it,
+	and adds the imported scripts too. *waves* orders the scripts so every script comes after
+	the scripts it imports.
+	"""
+	@LazyClassAttribute
+	def RE_IMPORT(cls) -> re.Pattern:
+		"""An import or inherit directive at the start of a line, the group is its dotted name."""
+		return re.compile(r"^[ \t]*(?:import|inherit)[ \t]+([A-Za-z_][A-Za-z0-9_]*(?:[ \t]*\.[ \t]*[A-Za-z_][A-Za-z0-9_]*)*)[ \t]*;", flags=re.MULTILINE)
+
+	paths:dict = {}		# Absolute path -> path as it was given or found
+	imports:dict = {}	# Absolute path -> {imported name: path as found}
+	missing:dict = {}	# Absolute path -> imported names that have no script
+
+	def __init__(self) -> None:
+		self.paths = {}
+		self.imports = {}
+		self.missing = {}
+
+	def dependencies(self, key:str) -> list:
+		"""Returns the absolute paths of the scripts imported by the script at the absolute path *key*."""
+		return [os.path.abspath(dep) for dep in self.imports.get(key, {}).values()]
+
+	@classmethod
+	def find_imports(cls, script:str) -> list:
+		"""Returns the dotted names imported by the text *script*, in order."""
+		return [re.sub(r"[ \t]", "", name) for name in cls.RE_IMPORT.findall(script)]
+
+	@classmethod
+	def read_imports(cls, file, block_size:int=1<<16) -> list:
+		"""
+		Returns the names imported by the text file *file*, reading it *block_size* characters at a 
+		time. Blocks are cut after a line break, no directive spans more than one line.
+		"""
+		names:list = []
+		rest:str = ""
+		while True:
+			block:str = file.read(block_size)
+			if not block:
+				return names + cls.find_imports(rest)
+			block = rest + block
+			stop:int = block.rfind("\n") + 1
+			names += cls.find_imports(block[:stop])
+			rest = block[stop:]
+
+	def resolve(self, importer:str, name:str, roots:list) -> str:
+		"""
+		Returns the path of the script *name* imported by *importer*, looking next to *importer*
+		first and then in each of *roots*, or None if there is no such script.
+		"""
+		relative:str = os.path.join(*name.split(".")) + ".cclr"
+		for root in [os.path.dirname(importer)] + roots:
+			path:str = os.path.join(root, relative)
+			if os.path.isfile(path):
+				return path
+		return None
+
+	def scan(self, paths:list, roots:list=None, known=None) -> None:
+		"""
+		Adds the scripts at *paths* and every script they import, directly or not. *known* is
+		called with a path and may return its {name: path} imports from an earlier build,
+		otherwise the script is read to find them. A script that can't be read imports nothing.
+		"""
+		pending:list = list(reversed(paths))
+		while pending:
+			path:str = pending.pop()
+			key:str = os.path.abspath(path)
+			if key in self.paths:
+				continue
+			self.paths[key] = path
+
+			imports:dict = known(path) if known != None else None
+			if imports == None or not all([os.path.isfile(dep) for dep in imports.values()]):
+				imports = {}
+				try:
+					with open(path, "r") as file:
+						names:list = self.read_imports(file)
+				except (OSError, UnicodeDecodeError): # Left to the build of the script to report
+					names = []
+				for name in names:
+					dep:str = self.resolve(path, name, roots or [])
+					if dep == None:
+						self.missing.setdefault(key, []).append(name)
+					else:
+						imports[name] = dep
+
+			self.imports[key] = imports
+			pending += reversed([dep for dep in imports.values() if os.path.abspath(dep) not in self.paths])
+
+	def includes(self, key:str, outputs_of) -> dict:
+		"""
+		Returns the includes of the Compiler for the script at the absolute path *key*, the path 
+		of the header of each script it imports relative to its own outputs. *outputs_of* returns 
+		the [.cpp, .h] outputs of a script path.
+		"""
+		folder:str = os.path.dirname(outputs_of(self.paths[key])[0])
+		return {name: os.path.relpath(outputs_of(dep)[1], folder) for name, dep in self.imports[key].items()}
+
+	def import_trees(self, key:str, manifest) -> dict:
+		"""Returns the tree hash in *manifest* of every script imported by the script at *key*."""
+		return {dep: manifest.tree(dep) for dep in self.dependencies(key)}
+
+	def record(self, key:str, manifest, digest:str, options:dict, outputs:list) -> None:
+		"""Records the build of the script at *key* in *manifest*, with what it imports."""
+		manifest.record(self.paths[key], digest, options, outputs, self.imports[key], self.import_trees(key, manifest))
+
+	def waves(self) -> tuple:
+		"""
+		Groups the scripts into waves, every script only imports scripts of earlier waves, so the
+		scripts of one wave can be built at once. Returns (waves, cyclic), *cyclic* holding the
+		scripts that are in an import cycle or import one, which can't be built.
+		"""
+		waves:list = []
+		done:set = set()
+		pending:list = list(self.paths)
+		while pending:
+			wave:list = [key for key in pending if all([dep in done for dep in self.dependencies(key)])]
+			if not wave:
+				break
+			waves.append(wave)
+			done.update(wave)
+			pending = [key for key in pending if key not in done]
+		return waves, pending
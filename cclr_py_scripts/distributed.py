@@ -0,0 +1,387 @@
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from . import __version__
+from .compiler import SourceCompiler
+from .entry import BuildStatus, compile_text_task, read_task, write_task
+from .parser import PARSER_VERSION
+
+LENGTH:struct.Struct = struct.Struct(">I") # Every message is its length followed by that much UTF-8 JSON
+MAX_MESSAGE:int = 1 << 30
+VERSION:list = [__version__, PARSER_VERSION] # A worker is only given scripts if it sends the same
+
+def parse_address(address:str) -> tuple:
+	"""Splits "host:port" into (host, port). Raises a ValueError if it isn't one."""
+	host, _, port = address.rpartition(":")
+	if not host or not port.isdigit():
+		raise ValueError("Expected host:port, got '%s'" % address)
+	return host, int(port)
+
+def send_message(sock:socket.socket, message:dict) -> None:
+	data:bytes = json.dumps(message).encode("utf-8")
+	sock.sendall(LENGTH.pack(len(data)) + data)
+
+def recv_message(sock:socket.socket) -> dict:
+	"""
+	Reads the next message sent by send_message. Raises a ConnectionError if the other end closed
+	the connection, or a ValueError if what was sent isn't a message.
+	"""
+	size:int = LENGTH.unpack(recv_exact(sock, LENGTH.size))[0]
+	if size > MAX_MESSAGE:
+		raise ValueError("A message of %s bytes is too large" % size)
+	message = json.loads(recv_exact(sock, size).decode("utf-8"))
+	if not isinstance(message, dict):
+		raise ValueError("Expected a message, got %s" % type(message).__name__)
+	return message
+
+def recv_exact(sock:socket.socket, size:int) -> bytes:
+	parts:list = []
+	while size:
+		chunk:bytes = sock.recv(min(size, 1<<20))
+		if not chunk:
+			raise ConnectionError("The connection was closed")
+		parts.append(chunk)
+		size -= len(chunk)
+	return b"".join(parts)
+
+class ResultCache:
+	"""
+	The .cpp and .h texts compiled from a script, by the hash of its text and the paths its
+	imports are included by, so a script that was built before in any folder is never sent to a
+	worker again. Each entry is a JSON file in the cache folder.
+	"""
+	FOLDER_NAME:str = "results"
+
+	folder:str = ""
+
+	def __init__(self, cache:str) -> None:
+		self.folder = os.path.join(cache, self.FOLDER_NAME)
+
+	@staticmethod
+	def key(digest:str, includes:dict) -> str:
+		"""The hash *digest* of a script, followed by a hash of VERSION and *includes*."""
+		rest:bytes = json.dumps([VERSION, sorted(includes.items())]).encode("utf-8")
+		return digest + "." + hashlib.sha256(rest).hexdigest()[:16]
+
+	def load(self, key:str) -> tuple:
+		"""Returns the (cpp, h) texts saved for *key*, or None."""
+		try:
+			with open(self.path(key), "r") as file:
+				entry = json.load(file)
+			return entry["cpp"], entry["h"]
+		except (OSError, ValueError, KeyError, TypeError):
+			return None
+
+	def path(self, key:str) -> str:
+		return os.path.join(self.folder, key + ".json")
+
+	def prune(self, keep:set) -> None:
+		"""Deletes the entries of every text whose hash is not in *keep*."""
+		try:
+			entries = os.scandir(self.folder)
+		except OSError:
+			return
+		with entries:
+			for entry in entries:
+				if entry.name.endswith(".json") and entry.name.split(".")[0] not in keep:
+					try:
+						os.remove(entry.path)
+					except OSError:
+						pass
+
+	def save(self, key:str, texts:tuple) -> None:
+		os.makedirs(self.folder, exist_ok=True)
+		path:str = self.path(key)
+		temp:str = "%s.%s.%s.tmp" % (path, os.getpid(), threading.get_ident())
+		with open(temp, "w") as file:
+			json.dump({"cpp": texts[0], "h": texts[1]}, file)
+		os.replace(temp, path)
+
+class Coordinator:
+	"""
+	Builds scripts on workers, see serve, that connect to it over TCP at *address*. *run* splits
+	the tasks of a build into a shard for each worker and sends each worker the text of one
+	script of its shard at a time, writing the .cpp and .h texts it sends back. A worker whose
+	shard is done steals from the back of the largest shard left, and a worker that joins during
+	*run* starts stealing right away. Scripts are looked up in the ResultCache before they are
+	sent. A script whose worker is lost or doesn't answer within *timeout* seconds is sent to
+	another worker, after *retries* tries, or when no worker is left, it is compiled here.
+	With *force* set every script is compiled again, the ResultCache is only written.
+	"""
+	address:tuple = ()	# (host, port) listened on, the port is picked by the system if 0 was given
+	wait:float = 30		# Seconds run waits for a first worker
+	retries:int = 2
+	timeout:float = 300
+	force:bool = False
+
+	server:socket.socket = None
+	condition:threading.Condition = None	# Guards everything below
+	closed:bool = False
+	workers:list = []	# Sockets of the workers not used by a run
+
+	# State of the current run
+	running:bool = False
+	tasks:list = []
+	results:list = []
+	shards:list = []	# A deque of task indices for each worker
+	retry:deque = None	# Tasks whose worker was lost, taken before any shard
+	local:list = []		# Tasks that were tried too many times
+	attempts:list = []
+	in_flight:int = 0
+	handlers:int = 0
+
+	def __init__(self, address:tuple, wait:float=30, retries:int=2, timeout:float=300, force:bool=False) -> None:
+		self.wait = wait
+		self.retries = retries
+		self.timeout = timeout
+		self.force = force
+		self.server = socket.create_server(address)
+		self.address = self.server.getsockname()[:2]
+		self.condition = threading.Condition()
+		self.closed = False
+		self.workers = []
+		self.running = False
+		threading.Thread(target=self.accept, daemon=True).start()
+
+	def accept(self) -> None:
+		while True:
+			try:
+				sock, _ = self.server.accept()
+			except OSError: # Closed
+				return
+			threading.Thread(target=self.greet, args=(sock,), daemon=True).start()
+
+	def greet(self, sock:socket.socket) -> None:
+		"""Takes on the worker connected through *sock* if it says it runs the same version."""
+		try:
+			sock.settimeout(self.timeout)
+			hello:dict = recv_message(sock)
+			if hello.get("type") != "hello" or hello.get("version") != VERSION:
+				send_message(sock, {"type": "stop", "reason": "Expected version %s" % VERSION})
+				sock.close()
+				return
+		except (OSError, ValueError):
+			sock.close()
+			return
+
+		with self.condition:
+			if self.closed:
+				sock.close()
+			elif self.running:
+				shard:deque = deque()
+				self.shards.append(shard)
+				self.start_handler(sock, shard)
+			else:
+				self.workers.append(sock)
+				self.condition.notify_all()
+
+	def close(self) -> None:
+		"""Tells every worker the build is over and stops listening."""
+		with self.condition:
+			self.closed = True
+			workers:list = self.workers
+			self.workers = []
+		try:
+			self.server.shutdown(socket.SHUT_RDWR) # Wakes up accept, closing alone doesn't
+		except OSError:
+			pass
+		self.server.close()
+		for sock in workers:
+			try:
+				send_message(sock, {"type": "stop"})
+			except OSError:
+				pass
+			sock.close()
+
+	def compile_here(self, task:tuple, read) -> tuple:
+		compiled:tuple = compile_text_task(task, read)
+		if compiled[1] != None:
+			ResultCache(task[3]).save(ResultCache.key(read[1], task[4]), compiled[1])
+		return write_task(task, compiled)
+
+	def dispatch(self, sock:socket.socket, task:tuple) -> tuple:
+		"""
+		Builds *task* on the worker at *sock*, unless it doesn't need compiling. Returns the same as
+		compile_script. Raises an OSError or a ValueError if the worker was lost.
+		"""
+		result, read = self.lookup(task)
+		if result != None:
+			return result
+		path, outputs, known_hash, cache, includes = task
+		script, digest = read
+
+		send_message(sock, {"type": "compile", "path": path, "script": script, "includes": includes})
+		reply:dict = recv_message(sock)
+		try:
+			log:str = reply["log"]
+			errors:list = [(row, col, message) for row, col, message in reply["errors"]]
+			texts = reply["texts"]
+			if texts != None:
+				texts = (str(texts[0]), str(texts[1]))
+		except (KeyError, TypeError, IndexError):
+			raise ValueError("Expected a result, got %s" % reply.get("type"))
+		if errors or texts == None:
+			return (BuildStatus.FAILED, digest, log, 0, errors)
+
+		ResultCache(cache).save(ResultCache.key(digest, includes), texts)
+		return write_task(task, ((BuildStatus.COMPILED, digest, log, 0, []), texts))
+
+	def handle(self, sock:socket.socket, shard:deque) -> None:
+		"""Sends the tasks of *shard*, then of the other shards, to the worker at *sock*."""
+		try:
+			while True:
+				i:int = self.next_task(shard)
+				if i == None:
+					break
+				try:
+					result:tuple = self.dispatch(sock, self.tasks[i])
+				except Exception: # Mostly OSError or ValueError, the worker is dropped whatever it was
+					sock.close()
+					sock = None
+					with self.condition:
+						self.attempts[i] += 1
+						if self.attempts[i] > self.retries:
+							self.local.append(i)
+						else:
+							self.retry.append(i)
+						self.in_flight -= 1
+						self.condition.notify_all()
+					break
+				with self.condition:
+					self.results[i] = result
+					self.in_flight -= 1
+					self.condition.notify_all()
+		finally:
+			with self.condition:
+				self.handlers -= 1
+				if sock != None:
+					if self.closed:
+						sock.close()
+					else:
+						self.workers.append(sock)
+				self.condition.notify_all()
+
+	def lookup(self, task:tuple) -> tuple:
+		"""
+		Reads the script of *task*. Returns (result, None) if it can't be read, didn't change or
+		its outputs are in the ResultCache and not *force*, otherwise (None, (script, hash)).
+		"""
+		read = read_task(task)
+		if isinstance(read, Exception):
+			return (BuildStatus.FAILED, None, "{}: {}\n".format(type(read).__name__, read), 0, []), None
+		script, digest = read
+		if digest == task[2]:
+			return (BuildStatus.UNCHANGED, digest, "", 0, []), None
+		if self.force:
+			return None, read
+		texts:tuple = ResultCache(task[3]).load(ResultCache.key(digest, task[4]))
+		if texts != None:
+			return write_task(task, ((BuildStatus.COMPILED, digest, "", 0, []), texts)), None
+		return None, read
+
+	def next_task(self, shard:deque) -> int:
+		"""
+		Returns the index of the next task for the worker of *shard*, stealing one when *shard* is
+		empty. Waits while other workers are busy, in case one is lost. Returns None when no task is left.
+		"""
+		with self.condition:
+			while True:
+				if self.retry:
+					i:int = self.retry.popleft()
+				elif shard:
+					i = shard.popleft()
+				else:
+					largest:deque = max(self.shards, key=len)
+					if not largest:
+						if self.in_flight == 0:
+							return None
+						self.condition.wait()
+						continue
+					i = largest.pop()
+				self.in_flight += 1
+				return i
+
+	def run(self, tasks:list) -> list:
+		"""Builds every (path, outputs, known_hash, cache, includes) task, returns what compile_script would for each."""
+		results:list = [None] * len(tasks)
+		if not tasks:
+			return results
+
+		with self.condition:
+			self.condition.wait_for(lambda: self.workers or self.closed, self.wait)
+			workers:list = self.workers
+			self.workers = []
+			count:int = max(len(workers), 1)
+			self.tasks = tasks
+			self.results = results
+			self.shards = [deque(range(len(tasks)*k // count, len(tasks)*(k+1) // count)) for k in range(count)]
+			self.retry = deque()
+			self.local = []
+			self.attempts = [0] * len(tasks)
+			self.in_flight = 0
+			self.running = True
+			for sock, shard in zip(workers, self.shards):
+				self.start_handler(sock, shard)
+
+			self.condition.wait_for(lambda: self.handlers == 0)
+			self.running = False
+			left:list = sorted(list(self.retry) + self.local + [i for shard in self.shards for i in shard])
+
+		if left:
+			print("No worker is left, building {} script(s) here".format(len(left)))
+		for i in left:
+			result, read = self.lookup(tasks[i])
+			results[i] = result if result != None else self.compile_here(tasks[i], read)
+		return results
+
+	def start_handler(self, sock:socket.socket, shard:deque) -> None:
+		"""Starts sending tasks to the worker at *sock*. Must hold *condition*."""
+		self.handlers += 1
+		threading.Thread(target=self.handle, args=(sock, shard), daemon=True).start()
+
+def connect(address:tuple, wait:float) -> socket.socket:
+	"""Connects to *address*, trying again for up to *wait* seconds while nothing listens there."""
+	deadline:float = time.monotonic() + wait
+	while True:
+		try:
+			return socket.create_connection(address)
+		except OSError:
+			if time.monotonic() >= deadline:
+				raise
+			time.sleep(0.1)
+
+def serve(address:tuple, wait:float=30) -> int:
+	"""
+	Works for the Coordinator at *address*: compiles every script it sends with a SourceCompiler
+	and sends back the .cpp and .h texts, or the errors, until the build is over. Waits up to *wait*
+	seconds for the coordinator to start. Returns how many scripts were compiled.
+	"""
+	compiler:SourceCompiler = SourceCompiler()
+	compiled:int = 0
+	with connect(address, wait) as sock:
+		send_message(sock, {"type": "hello", "version": VERSION})
+		while True:
+			try:
+				message:dict = recv_message(sock)
+			except ConnectionError:
+				break
+			if message.get("type") != "compile":
+				break
+
+			reply:dict = {"type": "result", "log": "", "errors": [], "texts": None}
+			try:
+				cpp, h, errors = compiler.compile(message["script"], message["includes"])
+				reply["errors"] = errors
+				if not errors:
+					reply["texts"] = [cpp, h]
+			except Exception as e:
+				reply["log"] = "{}: {}\n".format(type(e).__name__, e)
+			send_message(sock, reply)
+			compiled += 1
+	return compiled
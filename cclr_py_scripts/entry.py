@@ -1,16 +1,21 @@
 
+import contextlib
+import io
+import mmap
 import os
+import sys
 import click
-from pathlib import Path
-
-try:
-	from compiler import Compiler
-	from parser import Parser
-	from lexer import Lexer
-except:
-	from cclr_py_scripts.compiler import Compiler
-	from cclr_py_scripts.parser import Parser
-	from cclr_py_scripts.lexer import Lexer
+from enum import IntEnum, auto
+
+from .compiler import Compiler
+from .parser import Parser
+from .lexer import Lexer
+from .manifest import Manifest, hash_mapped, hash_source
+from .commands import CmdScript, script_errors
+from .parsecache import ParseCache
+from .outputs import OutputFile
+from .dependencies import DependencyGraph
+# The process pool, the watcher and the profiler are imported by the commands that use them
 	
 def name_from_path(path:str) -> str:
 	out_file_n:str = path.replace("/",".")
@@ -28,6 +33,189 @@ def get_script_paths_r(search:str="./") -> list:
 				)
 	return paths
 
+def output_base(path:str, cache:str, localoutput:bool) -> str:
+	"""
+	Returns where the .cpp and .h files of the script at *path* are saved, without the extension.
+	"""
+	if localoutput:
+		return path[:-4]
+	return os.path.join(cache, name_from_path(path))[:-4]
+
+class BuildStatus(IntEnum):
+	COMPILED:int	= auto()
+	UNCHANGED:int	= auto()
+	FAILED:int		= auto()
+
+def compile_script(task:tuple, capture:bool=True) -> tuple:
+	"""
+	Reads, compiles and saves one script. *task* is (path, outputs, known_hash, cache, includes), 
+	where *known_hash* is the hash of the script's text when it was last built or None, and 
+	*includes* maps each imported name to the path its header is included by. The tokens and 
+	commands of a text that was parsed before are loaded from the ParseCache in *cache*. 
+	Returns (BuildStatus, hash, log, written, errors), *written* being how many of the outputs 
+	were changed and *errors* every lexer and parser error of the script, see script_errors. 
+	With *capture* set *log* holds everything printed while compiling, so parallel builds can 
+	print it in order, otherwise it is printed right away and *log* is empty.
+	"""
+	path, outputs, known_hash, cache, includes = task
+	log = io.StringIO()
+	digest:str = None
+	written:int = 0
+	try:
+		with contextlib.redirect_stdout(log) if capture else contextlib.nullcontext():
+			script:str = read_script(path)
+			digest = hash_source(script)
+			if digest == known_hash:
+				return (BuildStatus.UNCHANGED, digest, "", 0, [])
+
+			commands, errors = parse_script(script, digest, cache)
+			if errors:
+				return (BuildStatus.FAILED, digest, log.getvalue(), 0, errors)
+			written = save_outputs(commands, outputs, includes)
+	except Exception as e:
+		log.write("{}: {}\n".format(type(e).__name__, e))
+		return (BuildStatus.FAILED, digest, log.getvalue(), 0, [])
+
+	return (BuildStatus.COMPILED, digest, log.getvalue(), written, [])
+
+def parse_script(script:str, digest:str, cache:str) -> tuple:
+	"""
+	Returns (commands, errors) of the text *script* with hash *digest*, see script_errors. They 
+	are loaded from the ParseCache in *cache* if the text was parsed before, otherwise they are 
+	saved to it if there were no errors.
+	"""
+	parse_cache:ParseCache = ParseCache(cache)
+	parsed:tuple = parse_cache.load(digest, script)
+	if parsed != None:
+		return parsed[1], []
+
+	tokens:list = Lexer().tokenize(script, recover=True)
+	commands:CmdScript = Parser().parse(tokens, recover=True)
+	errors:list = script_errors(commands.commands)
+	if not errors:
+		parse_cache.save(digest, tokens, commands)
+	return commands, errors
+
+class ScriptError(Exception):
+	"""Raised by checked_commands after the last command when any of them was an error."""
+	pass
+
+def checked_commands(commands, errors:list):
+	"""
+	Yields the commands that aren't errors and adds the errors to *errors*, so every error of a 
+	script is found in one pass. Raises a ScriptError at the end if there were any, so the 
+	outputs written from the other commands are thrown away.
+	"""
+	for command in commands:
+		if command.is_error():
+			errors.append(command)
+		else:
+			yield command
+	if errors:
+		raise ScriptError()
+
+def compile_script_mapped(task:tuple, capture:bool=True) -> tuple:
+	"""
+	Same as compile_script, for the low memory mode. The script is memory mapped and lexed, parsed 
+	and compiled one top level command at a time, see Lexer.iter_mapped and Parser.iter_parse, 
+	each command's code being written out before the next command is parsed. Neither the whole 
+	text nor all of its tokens or commands are ever in memory, and the ParseCache isn't used.
+	"""
+	path, outputs, known_hash, cache, includes = task
+	if os.path.getsize(path) == 0: # An empty file can't be mapped
+		return compile_script(task, capture)
+	log = io.StringIO()
+	digest:str = None
+	written:int = 0
+	try:
+		with contextlib.redirect_stdout(log) if capture else contextlib.nullcontext():
+			with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+				digest = hash_mapped(mapped)
+				if digest == known_hash:
+					return (BuildStatus.UNCHANGED, digest, "", 0, [])
+				errors:list = []
+				try:
+					tokens = Lexer().iter_mapped(mapped, recover=True)
+					written = save_outputs(checked_commands(Parser().iter_parse(tokens, recover=True), errors), outputs, includes)
+				except ScriptError:
+					return (BuildStatus.FAILED, digest, log.getvalue(), 0, script_errors(errors))
+	except Exception as e:
+		log.write("{}: {}\n".format(type(e).__name__, e))
+		return (BuildStatus.FAILED, digest, log.getvalue(), 0, [])
+
+	return (BuildStatus.COMPILED, digest, log.getvalue(), written, [])
+
+def read_task(task:tuple):
+	"""
+	The first stage of a pipelined build, see Pipeline: reads and hashes the script of *task*. 
+	Returns (script, hash), or the exception raised while reading it.
+	"""
+	try:
+		script:str = read_script(task[0])
+		return script, hash_source(script)
+	except Exception as e:
+		return e
+
+def compile_text_task(task:tuple, read) -> tuple:
+	"""
+	The second stage: compiles the script *read* for *task* without writing anything. Returns 
+	(result, texts), *result* being what compile_script returns and *texts* the text of each 
+	output, or None when there is nothing to write.
+	"""
+	path, outputs, known_hash, cache, includes = task
+	if isinstance(read, Exception):
+		return (BuildStatus.FAILED, None, "{}: {}\n".format(type(read).__name__, read), 0, []), None
+	script, digest = read
+	if digest == known_hash:
+		return (BuildStatus.UNCHANGED, digest, "", 0, []), None
+
+	log = io.StringIO()
+	try:
+		with contextlib.redirect_stdout(log):
+			commands, errors = parse_script(script, digest, cache)
+			if errors:
+				return (BuildStatus.FAILED, digest, log.getvalue(), 0, errors), None
+			cpp_file, h_file = io.StringIO(), io.StringIO()
+			Compiler(includes).emit(commands, cpp_file, h_file)
+	except Exception as e:
+		log.write("{}: {}\n".format(type(e).__name__, e))
+		return (BuildStatus.FAILED, digest, log.getvalue(), 0, []), None
+	return (BuildStatus.COMPILED, digest, log.getvalue(), 0, []), (cpp_file.getvalue(), h_file.getvalue())
+
+def write_task(task:tuple, compiled:tuple) -> tuple:
+	"""The last stage: writes the texts compiled for *task*. Returns the same as compile_script."""
+	result, texts = compiled
+	if texts == None:
+		return result
+	status, digest, log, written, errors = result
+	try:
+		written = write_outputs(task[1], texts)
+	except Exception as e:
+		return (BuildStatus.FAILED, digest, log + "{}: {}\n".format(type(e).__name__, e), 0, [])
+	return (status, digest, log, written, errors)
+
+def read_script(path:str) -> str:
+	with open(path, "r") as file:
+		return file.read()
+
+def save_outputs(commands:CmdScript, outputs:list, includes:dict=None) -> int:
+	"""
+	Compiles *commands* straight into the .cpp and .h files in *outputs*, only replacing the ones
+	whose content changed, see OutputFile. Returns how many were replaced.
+	"""
+	cpp_output, h_output = OutputFile(outputs[0]), OutputFile(outputs[1])
+	with cpp_output as cpp_file, h_output as h_file:
+		Compiler(includes).emit(commands, cpp_file, h_file)
+	return cpp_output.changed + h_output.changed
+
+def write_outputs(outputs:list, texts:tuple) -> int:
+	"""Same as save_outputs, for the .cpp and .h *texts* that were already compiled."""
+	cpp_output, h_output = OutputFile(outputs[0]), OutputFile(outputs[1])
+	with cpp_output as cpp_file, h_output as h_file:
+		cpp_file.write(texts[0])
+		h_file.write(texts[1])
+	return cpp_output.changed + h_output.changed
+
 # =============================================================================
 # Command Line Interface
 # =============================================================================
@@ -35,6 +223,21 @@ def get_script_paths_r(search:str="./") -> list:
 BUILD_HR:str = "Recursively builds all .cclr scripts in the	specified folder to .cpp and .h files."
 BUILD_HC:str = "The cache folder where all compiled .cpp and .h files are saved."
 BUILD_HL:str = "Rather than store the built .cpp and .h files in a __cclrcache__ folder store them in the same directory as their source .cclr files."
+BUILD_HF:str = "Build every script, even the ones that have not changed since the last build."
+BUILD_HJ:str = "How many scripts are compiled at once in separate processes. Defaults to the number of CPUs."
+BUILD_HX:str = "Also compile the generated .cpp files to .o object files next to them with this C++ compiler, like g++. Objects are cached in the cache folder by their preprocessed source and flags."
+BUILD_HXF:str = "Flags given to the C++ compiler, as one string."
+BUILD_HM:str = "Build with little memory, for very large scripts. Each script is memory mapped and compiled one command at a time, and scripts are built one at a time."
+BUILD_HPL:str = "Compile in this process while reading the next scripts and writing the last outputs in other threads, which helps on slow or network drives. Scripts are compiled one at a time."
+BUILD_HCO:str = "Send the scripts to workers started with 'cclr worker' to be compiled, see --listen. Scripts built before, in any folder, are taken from the cache folder instead."
+BUILD_HLI:str = "Address the coordinator listens on for workers, as host:port. Use 0.0.0.0 to accept workers from other machines, only on a network you trust."
+BUILD_HP:str = "Record the time, counts, backtracking and peak memory of every stage for each script into profile.json and a Chrome trace, trace.json, in the cache folder. Scripts are built one at a time."
+
+WORKER_HC:str = "Address of the build started with --coordinator, as host:port."
+WORKER_HW:str = "Seconds to keep trying to connect while the coordinator isn't listening yet."
+
+WATCH_HP:str = "Find changed files by scanning the folder instead of with inotify."
+WATCH_HI:str = "Seconds between scans of the folder when scanning."
 
 @click.group()
 def main() -> None:
@@ -46,13 +249,39 @@ def main() -> None:
 @click.option("-c", "--cache", type=click.Path(exists=False),				\
 	default="./__cclr__", show_default=True, help=BUILD_HC )
 @click.option("-l", "--localoutput", is_flag=True, help=BUILD_HL)
+@click.option("-f", "--force", is_flag=True, help=BUILD_HF)
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=None, help=BUILD_HJ)
+@click.option("--profile", is_flag=True, help=BUILD_HP)
+@click.option("--cxx", default=None, help=BUILD_HX)
+@click.option("--cxxflags", default="", help=BUILD_HXF)
+@click.option("--low-memory", is_flag=True, help=BUILD_HM)
+@click.option("--pipeline", is_flag=True, help=BUILD_HPL)
+@click.option("--coordinator", is_flag=True, help=BUILD_HCO)
+@click.option("--listen", default="127.0.0.1:7531", show_default=True, help=BUILD_HLI)
 
-def _build(script:str, cache:str, recursive:bool, localoutput:bool) -> None:
-	build( script, cache, recursive, localoutput)
+def _build(script:str, cache:str, recursive:bool, localoutput:bool, force:bool, jobs:int, profile:bool, cxx:str, cxxflags:str,
+	low_memory:bool, pipeline:bool, coordinator:bool, listen:str) -> None:
+	sys.exit( build( script, cache, recursive, localoutput, force, jobs, profile, cxx, cxxflags, low_memory, pipeline,
+		listen if coordinator else None) )
 
-def build(script:str, cache:str, recursive:bool, localoutput:bool) -> None:
+def build(script:str, cache:str, recursive:bool, localoutput:bool, force:bool=False, jobs:int=1, profile:bool=False,
+	cxx:str=None, cxxflags:str="", low_memory:bool=False, pipeline:bool=False, coordinator:str=None) -> int:
 	"""
 	Compiles a .cclr script to .cpp and .h files. The .cpp and .h files are then saved to __cclrcache__ in the current directory.
+	Scripts that have not changed since they were last built are skipped unless *force* is set. 
+	The scripts imported by the built scripts are built too, and a script is built again when a 
+	script it imports changed, directly or not. Scripts are built in waves, see DependencyGraph, 
+	each wave after the scripts it imports. With more than one job the scripts of a wave are 
+	compiled in a process pool, but always reported in the order they were found. A script with 
+	errors doesn't stop the build, the errors of every script are reported together at the end, 
+	sorted by path and position. Returns the exit code, 1 if any script failed to compile.
+	With *profile* set the build is profiled, see Profiler, and the results saved to the cache folder.
+	With *cxx* set every generated .cpp file is then compiled with it, see ObjectCache.
+	With *low_memory* set scripts are built one at a time with compile_script_mapped.
+	With *pipeline* set scripts are built one at a time by a Pipeline, unless profiling or in 
+	low memory mode, overlapping the reads and writes with compiling.
+	With *coordinator* set to a "host:port" the scripts are compiled by workers, see Coordinator,
+	unless profiling or in low memory mode.
 	"""
 	s_paths:list = []
 	if recursive:
@@ -60,40 +289,203 @@ def build(script:str, cache:str, recursive:bool, localoutput:bool) -> None:
 	else:
 		s_paths = [script]
 
-	scripts:list = []
-	for s_path in s_paths:
-		with open(s_path, "r") as file:
-			scripts.append( file.read() )
-
-	# Create __cclrcache__
-	if not localoutput and not os.path.isdir(cache):
-		Path(cache).mkdir(parents=True)
-	#	os.mkdir(cache)
-
-	lx = Lexer()
-	ps = Parser()
-	cm = Compiler()
-	for path, script in zip(s_paths, scripts):
-		tokens:list = lx.tokenize(script)
-		commands:list = ps.parse(tokens)
-		cpp_code:str = cm.compile(commands)
-		h_code:str = cm.compile(commands)
-
-		# Save
-		if localoutput:
-			with open(path[:-4]+"cpp", "w") as file:
-				file.write(cpp_code)
-			with open(path[:-4]+"h", "w") as file:
-				file.write(h_code)
-			print("Compiled '{}' to '{}'".format(path, path[:-4]+"cpp/h"))
-		else:
-			out_file_n:str = name_from_path(path)
-			out_file_path:str = os.path.join(cache, out_file_n)
-			with open(out_file_path[:-4]+"cpp", "w") as file:
-				file.write(cpp_code)
-			with open(out_file_path[:-4]+"h", "w") as file:
-				file.write(h_code)
-			print("Compiled '{}' to '{}'".format(path, out_file_path[:-4]+"cpp/h"))
+	# Create __cclrcache__, it also holds the build manifest
+	if not os.path.isdir(cache):
+		os.makedirs(cache)
+
+	manifest:Manifest = Manifest(cache)
+	options:dict = {"localoutput": localoutput}
+
+	def outputs_of(path:str) -> list:
+		out_path:str = output_base(path, cache, localoutput)
+		return [out_path+"cpp", out_path+"h"]
+
+	# Imports of scripts that didn't change since the last build are known without reading them
+	graph:DependencyGraph = DependencyGraph()
+	roots:list = [script if os.path.isdir(script) else os.path.dirname(script)]
+	graph.scan(s_paths, roots, lambda path: manifest.imports(path) if not force and	\
+		manifest.is_current(path, options, outputs_of(path)) else None)
+	waves, cyclic = graph.waves()
+
+	skipped:int = 0
+	written:int = 0
+	unchanged:int = 0 # Outputs that were generated again with the same content
+
+	if jobs == None:
+		jobs = os.cpu_count() or 1
+	cxx_jobs:int = jobs
+	jobs = min(jobs, len(graph.paths))
+	if low_memory or pipeline or coordinator != None:
+		jobs = min(jobs, 1)
+
+	profiler = None # A Profiler when profiling
+	if profile:
+		from .profiling import Profiler
+		profiler = Profiler()
+		profiler.install(sys.modules[__name__])
+		jobs = min(jobs, 1) # The hooks are only installed in this process
+	compile_task = compile_script_mapped if low_memory else compile_script
+
+	pipe = None
+	if pipeline and not low_memory and profiler == None:
+		from .pipeline import Pipeline
+		pipe = Pipeline(read_task, compile_text_task, write_task)
+
+	hub = None
+	if coordinator != None and not low_memory and profiler == None:
+		from .distributed import Coordinator, parse_address
+		hub = Coordinator(parse_address(coordinator), force=force)
+		print("Waiting for workers on {}:{}".format(*hub.address))
+
+	failed:list = []
+	failed_keys:set = set()
+	diagnostics:list = [] # (path, row, col, message) of every error found in a script
+	for key in cyclic:
+		failed.append(graph.paths[key])
+		failed_keys.add(key)
+		print("Failed to compile '{}', it is in or imports an import cycle".format(graph.paths[key]))
+
+	executor = None
+	if jobs > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		executor = ProcessPoolExecutor(max_workers=jobs)
+
+	try:
+		for wave in waves:
+			tasks:list = []
+			keys:list = [] # Key of each task
+			for key in wave:
+				path:str = graph.paths[key]
+				deps:list = graph.dependencies(key)
+				problem:str = None
+				if key in graph.missing:
+					problem = "can't find the imported script(s) {}".format(", ".join(["'%s'" % name for name in graph.missing[key]]))
+				elif failed_keys.intersection(deps):
+					problem = "an imported script failed"
+				if problem != None:
+					failed.append(path)
+					failed_keys.add(key)
+					print("Failed to compile '{}', {}".format(path, problem))
+					continue
+
+				outputs:list = outputs_of(path)
+				known_hash:str = None
+				if not force and manifest.imports_current(path, graph.import_trees(key, manifest)):
+					if manifest.is_current(path, options, outputs):
+						skipped += 1
+						continue
+					known_hash = manifest.known_hash(path, options, outputs)
+
+				tasks.append( (path, outputs, known_hash, cache, graph.includes(key, outputs_of)) )
+				keys.append(key)
+
+			if executor != None and len(tasks) > 1:
+				results = executor.map(compile_task, tasks, chunksize=max(1, len(tasks) // (jobs*4)))
+			elif hub != None:
+				results = hub.run(tasks)
+			elif pipe != None:
+				results = pipe.run(tasks)
+			else:
+				results = map(lambda task: compile_task(task, False), tasks)
+
+			for (path, outputs, *_), key, (status, digest, log, changed, errors) in zip(tasks, keys, results):
+				sys.stdout.write(log)
+				diagnostics += [(path,) + error for error in errors]
+				if status == BuildStatus.COMPILED:
+					graph.record(key, manifest, digest, options, outputs)
+					written += changed
+					unchanged += len(outputs) - changed
+					print("Compiled '{}' to '{}'".format(path, outputs[0][:-3]+"cpp/h"))
+				elif status == BuildStatus.UNCHANGED:
+					manifest.touch(path)
+					skipped += 1
+				else:
+					failed.append(path)
+					failed_keys.add(os.path.abspath(path))
+					print("Failed to compile '{}'".format(path))
+	finally:
+		if executor != None:
+			executor.shutdown()
+		if hub != None:
+			hub.close()
+		manifest.save()
+		hashes:set = set([entry["hash"] for entry in manifest.entries.values()])
+		ParseCache(cache).prune(hashes)
+		if hub != None:
+			from .distributed import ResultCache
+			ResultCache(cache).prune(hashes)
+		if profiler != None:
+			profiler.uninstall()
+			profiler.write(os.path.join(cache, "profile.json"), os.path.join(cache, "trace.json"))
+			print("Saved the profile to '{}' and '{}'".format(os.path.join(cache, "profile.json"), os.path.join(cache, "trace.json")))
+
+	if diagnostics:
+		print("{} error(s) in {} script(s):".format(len(diagnostics), len(set([error[0] for error in diagnostics]))))
+		for path, row, col, message in sorted(diagnostics):
+			print("{}: {}".format(path, message))
+
+	if written or unchanged:
+		print("Wrote {} output file(s), left {} identical output file(s) untouched".format(written, unchanged))
+
+	failed_objects:list = []
+	if cxx != None:
+		from .cxx import ObjectCache
+		sources:list = []
+		for path in graph.paths.values():
+			out_path:str = output_base(path, cache, localoutput)
+			if path not in failed and os.path.isfile(out_path+"cpp"):
+				sources.append( (out_path+"cpp", out_path+"o") )
+		compiled, cached, failed_objects = ObjectCache(cache, cxx, cxxflags).build(sources, cxx_jobs)
+		for source, message in failed_objects:
+			print("Failed to compile '{}' with '{}':\n{}".format(source, cxx, message))
+		print("Compiled {} object file(s) with '{}', took {} from the object cache".format(compiled, cxx, cached))
+
+	if skipped:
+		print("Skipped {} unchanged script(s)".format(skipped))
+	if failed:
+		print("{} script(s) failed to compile".format(len(failed)))
+	if failed_objects:
+		print("{} C++ file(s) failed to compile".format(len(failed_objects)))
+	return 1 if failed or failed_objects else 0
+
+@main.command("worker")
+@click.option("--connect", required=True, help=WORKER_HC)
+@click.option("--wait", type=float, default=30, show_default=True, help=WORKER_HW)
+
+def _worker(connect:str, wait:float) -> None:
+	"""
+	Compiles the scripts sent by a build started with --coordinator, until that build is over.
+	"""
+	from .distributed import parse_address, serve
+	try:
+		address:tuple = parse_address(connect)
+	except ValueError as e:
+		raise click.BadParameter(str(e), param_hint="--connect")
+	try:
+		compiled:int = serve(address, wait)
+	except OSError as e:
+		print("Can't connect to the coordinator at '{}': {}".format(connect, e))
+		sys.exit(1)
+	print("Compiled {} script(s)".format(compiled))
+
+@main.command("watch")
+@click.argument("folder", type=click.Path(exists=True, file_okay=False))
+@click.option("-c", "--cache", type=click.Path(exists=False),				\
+	default="./__cclr__", show_default=True, help=BUILD_HC )
+@click.option("-l", "--localoutput", is_flag=True, help=BUILD_HL)
+@click.option("--poll", is_flag=True, help=WATCH_HP)
+@click.option("--interval", type=float, default=0.1, show_default=True, help=WATCH_HI)
+
+def _watch(folder:str, cache:str, localoutput:bool, poll:bool, interval:float) -> None:
+	"""
+	Builds every .cclr script in a folder, then stays running and rebuilds each script as soon as it is saved.
+	"""
+	from .watch import Watcher, make_waiter
+	if not os.path.isdir(cache):
+		os.makedirs(cache)
+	watcher:Watcher = Watcher(folder, cache, output_base, localoutput)
+	print("Watching '{}', press Ctrl+C to stop".format(folder))
+	watcher.run( make_waiter(folder, poll, interval) )
 
 if __name__ == "__main__":
 	main()
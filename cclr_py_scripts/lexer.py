@@ -1,8 +1,36 @@
 
+import mmap
 import re
-from typing import Dict, Tuple
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
 from enum import IntEnum, auto
-from tqdm import tqdm
+from .progress import progress
+
+class LazyClassAttribute:
+	"""
+	A class attribute made by calling *build* with the class the first time it is read, then stored
+	on that class in place of this, so modules can be imported without building it.
+	"""
+	build = None
+	name:str = ""
+
+	def __get__(self, instance, owner):
+		value = self.build(owner)
+		setattr(owner, self.name, value)
+		return value
+
+	def __init__(self, build) -> None:
+		self.build = build
+		self.name = build.__name__
+		self.__doc__ = build.__doc__
+
+	def __set_name__(self, owner, name:str) -> None:
+		self.name = name
+
+class LexError(ValueError):
+	"""Raised by Lexer.iter_mapped on an invalid token."""
+	pass
 
 class TokenTypes(IntEnum):
 	NONE:int			= auto()
@@ -18,8 +46,25 @@ class TokenTypes(IntEnum):
 	SYMBOL:int			= auto()
 	COMMENT:int			= auto()
 
+TOKEN_TYPES:list = [TokenTypes.NONE] * (max(TokenTypes) + 1) # TokenTypes by value
+for _type in TokenTypes:
+	TOKEN_TYPES[_type] = _type
+del _type
+
+# Keywords, operators and punctuation, each token with one of these texts gets its index as its 
+# code so the parser can compare codes instead of texts. Every other token has code 0.
+FIXED_TEXTS:tuple = ("", "\n",
+	"alc", "if", "elif", "else", "import", "inherit", "static", "const",
+	"(", ")", "+", "-", "*", "/", "%", "|", "^", "&", "!", "?",
+	">=", "<=", "==", ">", "<", "=", ":", ";", ".",
+)
+TOKEN_CODES:dict = {text: code for code, text in enumerate(FIXED_TEXTS)}
+CODED_TYPES:tuple = (TokenTypes.VARNAME, TokenTypes.KEYWORD, TokenTypes.NEWLINE, TokenTypes.SYMBOL) # The only types with fixed texts
+IS_CODED:list = [type in CODED_TYPES for type in range(len(TOKEN_TYPES))] # By type
+
 class TokenList:
 	tokens:list = []
+	bounds = None # BoundaryIndex, built by boundaries()
 
 	def __bool__(self):
 		return self.tokens.__bool__()
@@ -27,8 +72,9 @@ class TokenList:
 	def __getitem__(self, key):
 		return self.tokens[key]
 
-	def __init__(self, tokens:list=[]) -> None:
-		self.tokens = tokens
+	def __init__(self, tokens:list=None) -> None:
+		self.tokens = tokens if tokens != None else []
+		self.bounds = None
 
 	def __iter__(self):
 		return self.tokens.__iter__()
@@ -38,6 +84,7 @@ class TokenList:
 
 	def __setitem__(self, key, value):
 		self.tokens[key] = value
+		self.bounds = None
 
 	def __sizeof__(self) -> int:
 		return self.tokens.__sizeof__()
@@ -48,12 +95,473 @@ class TokenList:
 			string += str(token) + " "
 		return string[:-1]
 
+	def boundaries(self):
+		if self.bounds == None:
+			self.bounds = BoundaryIndex(self)
+		return self.bounds
+
+	def has(self, key:int) -> bool:
+		return 0 <= key < len(self.tokens)
+
+	def release(self, key:int) -> None:
+		pass
+
+	def text_at(self, key:int) -> str: # Returns "" when there is no token at *key*
+		if 0 <= key < len(self.tokens):
+			return self.tokens[key].text
+		return ""
+
+	def type_at(self, key:int) -> int: # Returns TokenTypes.NONE when there is no token at *key*
+		if 0 <= key < len(self.tokens):
+			return self.tokens[key].type
+		return TokenTypes.NONE
+
+	def code_at(self, key:int) -> int: # Returns 0 when there is no token at *key*, see TOKEN_CODES
+		if 0 <= key < len(self.tokens):
+			return self.tokens[key].code
+		return 0
+
+	def indent_at(self, key:int) -> int: # Only known for an INDENT token, its text is the indentation
+		return len(self.text_at(key))
+
+class CompactTokenList(TokenList):
+	"""
+	A TokenList that stores one array per token field next to the lexed script instead of one 
+	Token object per token. Token objects and their text are only built when they are looked at, 
+	*text_at*, *type_at* and *code_at* read the arrays without building a Token at all, and the 
+	text of a token with a code is never cut out of *source*. Rows and columns aren't stored, 
+	they are found from the start of each line of *source* when a Token is built, see line_index.
+	"""
+	@LazyClassAttribute
+	def RE_LINE(cls) -> re.Pattern:
+		"""The indentation at the start of every line, the match is empty on a line without any."""
+		return re.compile(r"^[ \t]*", flags=re.MULTILINE)
+
+	source:str = ""
+	types:array = None		# TokenTypes
+	codes:array = None		# See TOKEN_CODES
+	starts:array = None		# Index of the first character in *source*
+	lengths:array = None
+	lines:array = None		# Index of the first character of each line of *source*, built by line_index
+	indents:array = None	# Width of the indentation of each line
+	replaced:dict = {}		# Tokens assigned with __setitem__, by index
+	shift_keys:list = []	# Index of the first token of each pending shift, see splice
+	shift_values:list = []	# Characters added to the start of each token from the matching key on
+
+	MAX_SHIFTS:int = 64		# Pending shifts kept before they are written into the arrays
+
+	def __bool__(self):
+		return len(self.types) != 0
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			return [self[i] for i in range(*key.indices(len(self.types)))]
+		if key < 0:
+			key += len(self.types)
+		if self.replaced and key in self.replaced:
+			return self.replaced[key]
+		start:int = self.starts[key]
+		if self.shift_keys:
+			start += self.shift_at(key)
+		code:int = self.codes[key]
+		text:str = FIXED_TEXTS[code] if code else self.source[start:start+self.lengths[key]]
+		if self.lines == None:
+			self.line_index()
+		return Token(text, start, -1, -1, TOKEN_TYPES[self.types[key]], code, self.lines)
+
+	def __init__(self, source:str="") -> None:
+		self.source = source
+		self.types = array("B")
+		self.codes = array("B")
+		self.starts = array("q")
+		self.lengths = array("I")
+		self.lines = None
+		self.indents = None
+		self.replaced = {}
+		self.shift_keys = []
+		self.shift_values = []
+		self.tokens = None
+		self.bounds = None
+
+	def __iter__(self):
+		for i in range(len(self.types)):
+			yield self[i]
+
+	def __len__(self):
+		return len(self.types)
+
+	def __setitem__(self, key, value):
+		if key < 0:
+			key += len(self.types)
+		if not 0 <= key < len(self.types):
+			raise IndexError("token index out of range")
+		self.replaced[key] = value
+		self.bounds = None
+
+	def __sizeof__(self) -> int:
+		size:int = object.__sizeof__(self)
+		for column in self.columns():
+			size += column.__sizeof__()
+		if self.lines != None:
+			size += self.lines.__sizeof__() + self.indents.__sizeof__()
+		return size
+
+	def __str__(self) -> str:
+		return " ".join([self.text_at(i) for i in range(len(self.types))])
+
+	def append(self, start:int, length:int, type:int, code:int=0) -> None:
+		self.types.append(type)
+		self.codes.append(code)
+		self.starts.append(start)
+		self.lengths.append(length)
+
+	def columns(self) -> tuple:
+		"""Every per token array, in the order they are stored by the ParseCache."""
+		return (self.types, self.starts, self.lengths, self.codes)
+
+	def compact(self) -> None:
+		"""Writes every pending shift into the *starts* array."""
+		keys:list = self.shift_keys + [len(self.types)]
+		for i, shift_idx in enumerate(self.shift_values):
+			first, stop = keys[i], keys[i+1]
+			if shift_idx:
+				self.starts[first:stop] = array("q", [start + shift_idx for start in self.starts[first:stop]])
+		self.shift_keys = []
+		self.shift_values = []
+
+	def has(self, key:int) -> bool:
+		return 0 <= key < len(self.types)
+
+	def index_at(self, position:int) -> int:
+		"""Returns the index of the first token starting at or after *position* in *source*."""
+		low:int = 0
+		high:int = len(self.types)
+		while low < high:
+			middle:int = (low + high) // 2
+			start:int = self.starts[middle]
+			if self.shift_keys:
+				start += self.shift_at(middle)
+			if start < position:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def indent_at(self, key:int) -> int:
+		"""Returns the width of the indentation of the line the token at *key* is on."""
+		if self.replaced and key in self.replaced:
+			return len(self.replaced[key].text)
+		if self.lines == None:
+			self.line_index()
+		return self.indents[bisect_right(self.lines, self.start_at(key)) - 1]
+
+	def line_index(self) -> None:
+		"""
+		Finds where every line of *source* starts and how wide its indentation is, with one pattern 
+		over the whole text, for *position* and *indent_at*.
+		"""
+		matches:list = list(self.RE_LINE.finditer(self.source))
+		self.lines = array("q", [m.start() for m in matches])
+		self.indents = array("I", [m.end() - m.start() for m in matches])
+
+	def position(self, idx:int) -> tuple:
+		"""Returns the (row, col) of the character at *idx* in *source*."""
+		if self.lines == None:
+			self.line_index()
+		row:int = bisect_right(self.lines, idx) - 1
+		return row, idx - self.lines[row]
+
+	def shift_at(self, key:int) -> int:
+		"""Returns the pending shift, in characters, of the token at *key*."""
+		i:int = bisect_right(self.shift_keys, key) - 1
+		if i < 0:
+			return 0
+		return self.shift_values[i]
+
+	def start_at(self, key:int) -> int:
+		"""Returns the index in *source* of the first character of the token at *key*."""
+		if self.replaced and key in self.replaced:
+			return self.replaced[key].idx
+		start:int = self.starts[key]
+		if self.shift_keys:
+			start += self.shift_at(key)
+		return start
+
+	def splice(self, first:int, stop:int, tokens:"CompactTokenList", shift_idx:int, line_range:tuple=None) -> None:
+		"""
+		Replaces the tokens *first* to *stop* with *tokens*, which must be lexed from the edited script, 
+		and takes that script as *source*. The tokens after *stop* move by *shift_idx* characters. 
+		That is only recorded as a pending shift, their arrays are not rewritten until there are 
+		more than MAX_SHIFTS pending shifts. *line_range* is the (start, stop) in the old *source* 
+		of the whole lines that were edited, the line index is then kept, see splice_lines, 
+		otherwise it is built again when next needed.
+		"""
+		count:int = len(tokens)
+		moved:int = count - (stop - first)
+		after_idx:int = self.shift_at(stop)
+
+		keys:list = []
+		values:list = []
+		for key, value in zip(self.shift_keys, self.shift_values):
+			if key >= first:
+				break
+			keys.append(key)
+			values.append(value)
+		if count and values and values[-1] != 0:
+			# The new tokens already hold their final position
+			keys.append(first)
+			values.append(0)
+		after:int = after_idx + shift_idx
+		if after != (values[-1] if values else 0):
+			keys.append(first + count)
+			values.append(after)
+		for key, key_idx in zip(self.shift_keys, self.shift_values):
+			if key > stop:
+				keys.append(key + moved)
+				values.append(key_idx + shift_idx)
+
+		self.types[first:stop] = tokens.types
+		self.codes[first:stop] = tokens.codes
+		self.starts[first:stop] = tokens.starts
+		self.lengths[first:stop] = tokens.lengths
+		self.source = tokens.source
+		if self.lines != None and line_range != None:
+			self.splice_lines(*line_range, shift_idx)
+		else:
+			self.lines = None
+			self.indents = None
+		self.shift_keys = keys
+		self.shift_values = values
+		if self.replaced:
+			self.replaced = {key if key < first else key + moved: token 
+				for key, token in self.replaced.items() if not first <= key < stop}
+		self.bounds = None
+
+		if len(self.shift_keys) > self.MAX_SHIFTS:
+			self.compact()
+
+	def splice_lines(self, start:int, stop:int, shift_idx:int) -> None:
+		"""
+		Updates the line index for an edit of the lines *start* to *stop* of the old source, which 
+		are now *start* to *stop* + *shift_idx* of *source*. Only those lines are matched again, 
+		the starts of the lines after them move by *shift_idx*. New arrays are made, the Tokens 
+		already built keep the line index of the text they were built from.
+		"""
+		first_line:int = bisect_left(self.lines, start)
+		stop_line:int = bisect_right(self.lines, stop) # The line at *stop* is matched again, it may have just started
+		starts:list = []
+		widths:list = []
+		for m in self.RE_LINE.finditer(self.source, start):
+			if m.start() > stop + shift_idx:
+				break
+			starts.append(m.start())
+			widths.append(m.end() - m.start())
+
+		tail:array = self.lines[stop_line:]
+		if shift_idx:
+			tail = array("q", [line + shift_idx for line in tail])
+		self.lines = self.lines[:first_line] + array("q", starts) + tail
+		self.indents = self.indents[:first_line] + array("I", widths) + self.indents[stop_line:]
+
+	def text_at(self, key:int) -> str:
+		if key < 0:
+			return ""
+		if self.replaced and key in self.replaced:
+			return self.replaced[key].text
+		try:
+			code:int = self.codes[key]
+		except IndexError:
+			return ""
+		if code:
+			return FIXED_TEXTS[code]
+		start:int = self.starts[key]
+		if self.shift_keys:
+			start += self.shift_at(key)
+		return self.source[start:start+self.lengths[key]]
+
+	def type_at(self, key:int) -> int:
+		if key < 0:
+			return TokenTypes.NONE
+		if self.replaced and key in self.replaced:
+			return self.replaced[key].type
+		try:
+			return self.types[key]
+		except IndexError:
+			return TokenTypes.NONE
+
+	def code_at(self, key:int) -> int:
+		if key < 0:
+			return 0
+		if self.replaced and key in self.replaced:
+			return self.replaced[key].code
+		try:
+			return self.codes[key]
+		except IndexError:
+			return 0
+
+class TokenStream:
+	"""
+	Gives the parser indexed access to tokens coming from an iterator, such as Lexer.iter_tokens. 
+	Tokens are only pulled from the iterator when they are looked at, and every token before the 
+	index given to *release* is dropped, so only the current lookahead window is kept in memory.
+	"""
+	source = None
+	window:list = []
+	start:int = 0 # The index of window[0]
+	exhausted:bool = False
+
+	def __getitem__(self, key:int):
+		if not self.has(key):
+			raise IndexError("token %s is %s" % (key, "released" if key < self.start else "out of range"))
+		return self.window[key - self.start]
+
+	def __init__(self, tokens) -> None:
+		self.source = iter(tokens)
+		self.window = []
+		self.start = 0
+		self.exhausted = False
+
+	def __iter__(self):
+		i:int = self.start
+		while self.has(i):
+			yield self.window[i - self.start]
+			i += 1
+
+	def boundaries(self):
+		return BoundaryScan(self) # A stream can't be indexed ahead of time
+
+	def has(self, key:int) -> bool:
+		if key < self.start:
+			return False
+		while key - self.start >= len(self.window):
+			if self.exhausted:
+				return False
+			try:
+				self.window.append( next(self.source) )
+			except StopIteration:
+				self.exhausted = True
+				return False
+		return True
+
+	def release(self, key:int) -> None:
+		key = min(key, self.start + len(self.window))
+		if key > self.start:
+			del self.window[:key - self.start]
+			self.start = key
+
+	def text_at(self, key:int) -> str:
+		if self.has(key):
+			return self.window[key - self.start].text
+		return ""
+
+	def type_at(self, key:int) -> int:
+		if self.has(key):
+			return self.window[key - self.start].type
+		return TokenTypes.NONE
+
+	def code_at(self, key:int) -> int:
+		if self.has(key):
+			return self.window[key - self.start].code
+		return 0
+
+	def indent_at(self, key:int) -> int: # Only known for an INDENT token, its text is the indentation
+		return len(self.text_at(key))
+
+class BoundaryIndex:
+	"""
+	Statement and bracket boundaries of a TokenList, found in one pass so the parser can jump to 
+	the end of a statement or to a matching bracket without scanning for it.
+	"""
+	TERMINATORS:tuple = (";",)
+	PAIRS:dict = {"(": ")", "[": "]", "{": "}"}
+
+	terminators:array = None	# For each token, the index of the first terminator at or after it, or -1
+	matches:dict = {}			# Index of each paired bracket -> index of its partner
+
+	def __init__(self, tokens:TokenList) -> None:
+		length:int = len(tokens)
+		self.terminators = array("q", [-1]) * (length + 1)
+		self.matches = {}
+
+		closers:dict = {close: open for open, close in self.PAIRS.items()}
+		opened:list = [] # Stack of (text, index) of brackets without a partner yet
+		previous:int = -1 # Index of the last terminator
+		symbol:int = TokenTypes.SYMBOL
+		for i in range(length):
+			if tokens.type_at(i) != symbol:
+				continue
+			text:str = tokens.text_at(i)
+			if text in self.TERMINATORS:
+				self.terminators[previous+1:i+1] = array("q", [i]) * (i - previous)
+				previous = i
+			elif text in self.PAIRS:
+				opened.append((text, i))
+			elif text in closers:
+				# An unmatched closer is left without a partner
+				if opened and opened[-1][0] == closers[text]:
+					open_i:int = opened.pop()[1]
+					self.matches[open_i] = i
+					self.matches[i] = open_i
+
+	def matching(self, key:int) -> int:
+		return self.matches.get(key, -1)
+
+	def next_terminator(self, key:int) -> int:
+		if 0 <= key < len(self.terminators):
+			return self.terminators[key]
+		return -1
+
+class BoundaryScan:
+	"""
+	Finds the same boundaries as BoundaryIndex by scanning forward from the asked token, for token 
+	lists that are not indexed ahead of time: streams, and token lists that are being edited.
+	"""
+	tokens = None
+
+	def __init__(self, tokens) -> None:
+		self.tokens = tokens
+
+	def matching(self, key:int) -> int:
+		tokens = self.tokens
+		opener:str = tokens.text_at(key)
+		close:str = BoundaryIndex.PAIRS.get(opener)
+		if close == None:
+			return -1
+		depth:int = 0
+		i:int = key
+		while tokens.has(i):
+			text:str = tokens.text_at(i)
+			if text == opener:
+				depth += 1
+			elif text == close:
+				depth -= 1
+				if depth == 0:
+					return i
+			i += 1
+		return -1
+
+	def next_terminator(self, key:int) -> int:
+		tokens = self.tokens
+		i:int = max(key, 0)
+		while tokens.has(i):
+			if tokens.text_at(i) in BoundaryIndex.TERMINATORS:
+				return i
+			i += 1
+		return -1
+
 class Token:
-	text:str = ""
-	idx:int = -1
-	row:int = -1
-	col:int = -1
-	type:int = TokenTypes.NONE
+	"""
+	A token of a script. Its row and column are either given, or found from *lines*, the start of 
+	each line of the script, only when they are read, see CompactTokenList.line_index.
+	"""
+	__slots__ = ("text", "idx", "type", "code", "lines", "given_row", "given_col")
+	text:str
+	idx:int
+	type:int
+	code:int	# See TOKEN_CODES
+	lines:array
+	given_row:int
+	given_col:int
 
 	def __add__(self, add_by:str) -> str:
 		assert(add_by is str, "TypeError: unsupported operand type(s) for +: 'Token' and '{}'".format(type(add_by).__name__))
@@ -66,44 +574,81 @@ class Token:
 			return self.text == obj.text
 		elif isinstance(obj, int):
 			return self.type == obj
-		elif isinstance(obj, Tuple):
+		elif isinstance(obj, tuple):
 			if len(obj) == 2:
 				return self.row == obj[0] and self.col == obj[1]
 			return False
 		else:
 			return False
 
-	def __init__(self, text:str="", idx:int=-1, row:int=-1, col:int=-1, type:int=TokenTypes.NONE) -> None:
+	def __init__(self, text:str="", idx:int=-1, row:int=-1, col:int=-1, type:int=TokenTypes.NONE, code:int=-1,
+		lines:array=None) -> None:
 		self.text = text
 		self.idx = idx
-		self.row = row
-		self.col = col
+		self.given_row = row
+		self.given_col = col
 		self.type = type
+		self.code = code if code != -1 else TOKEN_CODES.get(text, 0)
+		self.lines = lines
+
+	@property
+	def row(self) -> int:
+		if self.lines == None:
+			return self.given_row
+		return bisect_right(self.lines, self.idx) - 1
+
+	@property
+	def col(self) -> int:
+		if self.lines == None:
+			return self.given_col
+		return self.idx - self.lines[bisect_right(self.lines, self.idx) - 1]
+
+	@classmethod
+	def interned(cls, text:str, idx:int, row:int, col:int, type:int) -> "Token":
+		"""
+		Makes a token with its code, whose text is the one string shared by every token with the 
+		same fixed text or name, so the many copies of a name don't each hold their own string.
+		"""
+		code:int = TOKEN_CODES.get(text, 0)
+		if code:
+			text = FIXED_TEXTS[code]
+		elif type == TokenTypes.VARNAME:
+			text = sys.intern(text)
+		return cls(text, idx, row, col, type, code)
 
 	def __str__(self) -> str:
 		return self.text
 
 class Lexer:
 
-	RE_INDENT = re.compile(r"(?:^)[ \t]+", flags=re.MULTILINE)
-
-	codes:Dict = {
-		re.compile(r"//.*")											:TokenTypes.COMMENT,	# Matches a one-line comment
-		re.compile(r"/\*.*\*/")										:TokenTypes.COMMENT,	# Matches a multi-line comment
-		re.compile(r"([a-zA-Z]+|[_]+[a-zA-Z0-9])[a-zA-Z0-9_]*")		:TokenTypes.VARNAME,	# Matches a valid variable name
-		re.compile(r"alc")											:TokenTypes.KEYWORD,	# Matches keyword alc
-		re.compile(r"(if|else|elif)")								:TokenTypes.KEYWORD,	# Matches keyword for if statements
-		re.compile(r"[0-9]+")										:TokenTypes.INT,		# Matches valid int
-		re.compile(r"[0-9]*\.[0-9]+")								:TokenTypes.FLOAT,		# Matches valid float
-		re.compile(r"\n")											:TokenTypes.NEWLINE,	# Matches a new line
-		RE_INDENT													:TokenTypes.INDENT,		# Matches a indents at start of fline
-		re.compile(r"[)(]")											:TokenTypes.SYMBOL,		# Matches parenthesis
-		re.compile(r"[+\-*/|^%]")									:TokenTypes.SYMBOL,		# Matches any math symbol
-		re.compile(r"(>=|<=|==|[!&|?><=])")							:TokenTypes.SYMBOL,		# Matches any logic symbol
-		re.compile(r"[:;]")											:TokenTypes.SYMBOL,		# Matches end statement or type specifier symbol
-		re.compile(r" ")											:TokenTypes.NONE,		# Do NOT match spacescr,
-		re.compile(r".+?(?:\b)")									:TokenTypes.ERROR,		# Matches any token for an error,
-	}
+	@LazyClassAttribute
+	def RE_INDENT(cls) -> re.Pattern:
+		return re.compile(r"(?:^)[ \t]+", flags=re.MULTILINE)
+
+	@LazyClassAttribute
+	def codes(cls) -> dict:
+		"""Every token pattern and the type of its tokens, in the order they are tried."""
+		return {
+			re.compile(r"//[^\r\n]*")									:TokenTypes.COMMENT,	# Matches a one-line comment
+			re.compile(r"/\*.*\*/")										:TokenTypes.COMMENT,	# Matches a multi-line comment
+			re.compile(r"([a-zA-Z]+|[_]+[a-zA-Z0-9])[a-zA-Z0-9_]*")		:TokenTypes.VARNAME,	# Matches a valid variable name
+			re.compile(r"alc")											:TokenTypes.KEYWORD,	# Matches keyword alc
+			re.compile(r"(if|else|elif)")								:TokenTypes.KEYWORD,	# Matches keyword for if statements
+			re.compile(r"[0-9]+")										:TokenTypes.INT,		# Matches valid int
+			re.compile(r"[0-9]*\.[0-9]+")								:TokenTypes.FLOAT,		# Matches valid float
+			re.compile(r"\n")											:TokenTypes.NEWLINE,	# Matches a new line
+			cls.RE_INDENT												:TokenTypes.INDENT,		# Matches a indents at start of fline
+			re.compile(r"[)(]")											:TokenTypes.SYMBOL,		# Matches parenthesis
+			re.compile(r"[+\-*/|^%]")									:TokenTypes.SYMBOL,		# Matches any math symbol
+			re.compile(r"(>=|<=|==|[!&|?><=])")							:TokenTypes.SYMBOL,		# Matches any logic symbol
+			re.compile(r"[:;.]")										:TokenTypes.SYMBOL,		# Matches end statement, type specifier or import path symbol
+			re.compile(r" ")											:TokenTypes.NONE,		# Do NOT match spacescr,
+			re.compile(r".+?(?:\b)")									:TokenTypes.ERROR,		# Matches any token for an error,
+		}
+
+	RE_MASTER:re.Pattern = None	# All of *codes* as one pattern, built by master_pattern()
+	RE_MASTER_BYTES:re.Pattern = None	# The same over bytes
+	MASTER_TYPES:list = []
 
 	def is_symbol(self, char:str) -> bool:
 		return char == "`" or char == "~" or char == "!" or char == "@" or		\
@@ -115,53 +660,285 @@ class Lexer:
 			char == "\"" or char == "'" or char == "," or char == "<" or 		\
 			char == "." or	char == ">" or char == "/" or char == "?"			\
 
-	def tokenize(self, script:str, show_bar:bool=False) -> TokenList:
-		if script == "":
-			return []
+	def tokenize(self, script:str, show_bar:bool=False, recover:bool=False) -> TokenList:
+		"""
+		Lexes *script*. On an invalid token the error is printed and an empty list is returned, 
+		unless *recover* is set, then the invalid text is kept as an ERROR token for the parser 
+		to report and lexing goes on. Only where each token starts is recorded, its row and column 
+		are found when they are needed, see CompactTokenList.position.
+		"""
+		tokens:CompactTokenList = CompactTokenList(script)
+		append_type = tokens.types.append
+		append_code = tokens.codes.append
+		append_start = tokens.starts.append
+		append_length = tokens.lengths.append
+		pattern, types = self.master_pattern()
+		match = pattern.match
+		code_of = TOKEN_CODES.get
 
-		tokens:list = []
+		# Enum members are looked up once, the loop below runs once per token
+		NONE:int = TokenTypes.NONE
+		ERROR:int = TokenTypes.ERROR
 		
-		with tqdm(total=len(script), desc="Lexing CClear files", unit="char", disable=not show_bar) as pbar:
+		with progress(total=len(script), desc="Lexing CClear files", unit="char", disable=not show_bar) as pbar:
 			i:int = 0
-			r:int = 0 # Row
-			c:int = 0 # Column
-			while i != len(script):
-				old_i:int = i
-				resulting_tk:Token = Token()
-				for pattern, type in self.codes.items():
-					m = pattern.match(script, i)
-					if m:
-						text_length:int = m.end(0) - m.start(0)
-						test2 = text_length
-
-						if type != TokenTypes.NONE:
-							resulting_tk = Token(script[i:i+text_length], i, r, c, type)
-							tokens.append( resulting_tk )
-
-						i += text_length
-						c += text_length
-
-						if type == TokenTypes.NEWLINE:
-							c = 0
-							r += 1
-
-						break
-
-				if tokens[-1].type == TokenTypes.ERROR:
+			length:int = len(script)
+			bar_step:int = max(length//100, 1)
+			bar_next:int = bar_step
+			while i != length:
+				m = match(script, i)
+				if m:
+					type:int = types[m.lastindex]
+					end:int = m.end()
+				else: # Nothing matched, not even the error rule
+					type = ERROR
+					end = i + 1
+
+				if type == ERROR and not recover:
 					print("Error on line {} column {} : Invalid token '{}'"	\
-						.format(resulting_tk.row,resulting_tk.col, 			\
-						resulting_tk.text))
-					i += 1
-					c += 1
+						.format(*tokens.position(i), script[i:end]))
 					return TokenList([])
 
+				if type != NONE:
+					append_type(type)
+					append_code(code_of(script[i:end], 0) if IS_CODED[type] else 0)
+					append_start(i)
+					append_length(end - i)
+				i = end
+
 				# Update progress bar
-				if i-pbar.n > len(script)/100:
+				if i >= bar_next:
 					pbar.update(i-pbar.n)
+					bar_next = i + bar_step
 
 			pbar.update(i-pbar.n)
 
-		return TokenList(tokens)
+		return tokens
+
+	def iter_tokens(self, fileobj, chunk_size:int=1<<16, recover:bool=False):
+		"""
+		Yields the same tokens as *tokenize* while reading *fileobj* *chunk_size* characters at a time. 
+		No token spans a line break, so only complete lines are lexed and a partial last line is kept 
+		for the next chunk. On an invalid token the error is printed and no more tokens are yielded, 
+		unless *recover* is set, then it is yielded as an ERROR token.
+		"""
+		pattern, types = self.master_pattern()
+		match = pattern.match
+
+		NONE:int = TokenTypes.NONE
+		ERROR:int = TokenTypes.ERROR
+		NEWLINE:int = TokenTypes.NEWLINE
+
+		offset:int = 0 # Index of buffer[0] in the whole file
+		r:int = 0 # Row
+		c:int = 0 # Column
+		buffer:str = ""
+		while True:
+			chunk:str = fileobj.read(chunk_size)
+			buffer += chunk
+			if chunk:
+				stop:int = buffer.rfind("\n") + 1
+				if stop == 0:
+					continue
+			else:
+				stop = len(buffer)
+
+			i:int = 0
+			while i != stop:
+				m = match(buffer, i, stop)
+				if m:
+					type:int = types[m.lastindex]
+					end:int = m.end()
+				else:
+					type = ERROR
+					end = i + 1
+
+				if type == ERROR and not recover:
+					print("Error on line {} column {} : Invalid token '{}'"	\
+						.format(r, c, buffer[i:end]))
+					return
+
+				if type != NONE:
+					yield Token.interned(buffer[i:end], offset+i, r, c, type) if IS_CODED[type]	\
+						else Token(buffer[i:end], offset+i, r, c, type, 0)
+
+				if type == NEWLINE:
+					c = 0
+					r += 1
+				else:
+					c += end - i
+				i = end
+
+			if not chunk:
+				return
+			buffer = buffer[stop:]
+			offset += stop
+
+	def iter_mapped(self, data, release_step:int=1<<22, recover:bool=False):
+		"""
+		Yields the tokens of the UTF-8 text in *data*, any bytes-like object such as an mmap, 
+		matching straight over its bytes, so only the text of each token is ever copied out. The 
+		*idx* of each token is its byte offset. When *data* is an mmap the pages already lexed 
+		are given back every *release_step* bytes, so they don't stay in memory. Raises a LexError 
+		on an invalid token, or yields it as an ERROR token if *recover* is set.
+		"""
+		pattern, types = self.master_pattern(binary=True)
+		match = pattern.match
+		release = getattr(data, "madvise", None) if hasattr(mmap, "MADV_DONTNEED") else None
+		if release != None and hasattr(mmap, "MADV_SEQUENTIAL"):
+			release(mmap.MADV_SEQUENTIAL)
+
+		NONE:int = TokenTypes.NONE
+		ERROR:int = TokenTypes.ERROR
+		NEWLINE:int = TokenTypes.NEWLINE
+
+		i:int = 0
+		r:int = 0 # Row
+		c:int = 0 # Column, in characters
+		released:int = 0 # Bytes before this were given back
+		length:int = len(data)
+		while i != length:
+			m = match(data, i)
+			if m:
+				type:int = types[m.lastindex]
+				end:int = m.end()
+			else:
+				type = ERROR
+				end = i + 1
+			text:str = data[i:end].decode("utf-8", "replace") if type != NEWLINE else "\n" # As a "\r\n" reads in text mode
+
+			if type == ERROR and not recover:
+				raise LexError("Error on line {} column {} : Invalid token '{}'".format(r, c, text))
+
+			if type != NONE:
+				yield Token.interned(text, i, r, c, type) if IS_CODED[type]	\
+					else Token(text, i, r, c, type, 0)
+
+			if type == NEWLINE:
+				c = 0
+				r += 1
+			else:
+				c += len(text)
+			i = end
+
+			if release != None and i - released >= release_step:
+				stop:int = i - i % mmap.PAGESIZE
+				release(mmap.MADV_DONTNEED, released, stop - released)
+				released = stop
+
+	def lex_lines(self, script:str, start:int, stop:int) -> CompactTokenList:
+		"""
+		Lexes *script* from *start* to *stop*, which must be the start and end of whole lines, into a 
+		CompactTokenList over *script*. On an invalid token the error is printed and None is returned.
+		"""
+		tokens:CompactTokenList = CompactTokenList(script)
+		pattern, types = self.master_pattern()
+		match = pattern.match
+
+		NONE:int = TokenTypes.NONE
+		ERROR:int = TokenTypes.ERROR
+
+		i:int = start
+		while i != stop:
+			m = match(script, i, stop)
+			if m:
+				type:int = types[m.lastindex]
+				end:int = m.end()
+			else:
+				type = ERROR
+				end = i + 1
+
+			if type == ERROR:
+				print("Error on line {} column {} : Invalid token '{}'"	\
+					.format(*tokens.position(i), script[i:end]))
+				return None
+
+			if type != NONE:
+				tokens.append(i, end - i, type, TOKEN_CODES.get(script[i:end], 0) if IS_CODED[type] else 0)
+			i = end
+
+		return tokens
+
+	@classmethod
+	def master_pattern(cls, binary:bool=False) -> tuple:
+		"""
+		Joins every pattern in *codes* into one alternation so a token only needs a single match call. 
+		Alternatives are tried in the order of *codes*, exactly like trying each pattern one after another.
+		Returns the pattern and a list mapping the index of each alternative's group to its token type.
+		With *binary* set the pattern matches bytes, where a line break may also be "\\r\\n".
+		"""
+		if cls.RE_MASTER is None:
+			alternatives:list = []
+			binary_alternatives:list = []
+			for i, (pattern, type) in enumerate(cls.codes.items()):
+				flags:str = ""
+				for flag, letter in ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x")):
+					if pattern.flags & flag:
+						flags += letter
+				if flags:
+					alternatives.append("(?P<T%d>(?%s:%s))" % (i, flags, pattern.pattern))
+				else:
+					alternatives.append("(?P<T%d>%s)" % (i, pattern.pattern))
+				binary_alternatives.append("(?P<T%d>\\r?\\n)" % i if type == TokenTypes.NEWLINE else alternatives[-1])
+			master:re.Pattern = re.compile("|".join(alternatives))
+
+			types:list = [TokenTypes.NONE] * (master.groups + 1)
+			codes:list = list(cls.codes.values())
+			for name, group in master.groupindex.items():
+				types[group] = codes[int(name[1:])]
+
+			# RE_MASTER is set last, another thread that finds it set finds the rest set too
+			cls.MASTER_TYPES = types
+			cls.RE_MASTER_BYTES = re.compile("|".join(binary_alternatives).encode("ascii"))
+			cls.RE_MASTER = master
+
+		return cls.RE_MASTER_BYTES if binary else cls.RE_MASTER, cls.MASTER_TYPES
+
+	def relex(self, tokens:CompactTokenList, offset:int, deleted:int, inserted:str) -> tuple:
+		"""
+		Applies an edit of the script to *tokens*, made by Lexer.tokenize: *deleted* characters at 
+		*offset* are replaced by *inserted*. Only the lines touched by the edit are lexed again, 
+		the tokens after them are shifted in place. Returns (first, old_stop, new_stop), the tokens 
+		*first* to *old_stop* were replaced by the tokens *first* to *new_stop*. On an invalid token 
+		the error is printed, *tokens* are left as they were and None is returned.
+		"""
+		old:str = tokens.source
+		script:str = old[:offset] + inserted + old[offset+deleted:]
+
+		# Tokens never span a line break, so lexing whole lines gives the same tokens as lexing everything
+		line_start:int = old.rfind("\n", 0, offset) + 1
+		line_end:int = old.find("\n", offset + deleted)
+		old_end:int = len(old) if line_end == -1 else line_end + 1
+		new_end:int = old_end + len(inserted) - deleted
+
+		first:int = tokens.index_at(line_start)
+		stop:int = tokens.index_at(old_end)
+
+		lexed:CompactTokenList = self.lex_lines(script, line_start, new_end)
+		if lexed is None:
+			return None
+		shift_idx:int = new_end - old_end
+
+		# Tokens lexed the same at either end of the lines are kept, so only changed tokens are replaced.
+		# Rows and columns come from the edited script, so they don't need to be compared.
+		count:int = len(lexed)
+		head:int = 0
+		while head < count and first + head < stop and self.same_token(tokens, first+head, lexed, head, 0):
+			head += 1
+		tail:int = 0
+		while tail < count - head and stop - tail > first + head	\
+			and self.same_token(tokens, stop-tail-1, lexed, count-tail-1, shift_idx):
+			tail += 1
+		for column in lexed.columns():
+			del column[count-tail:]
+			del column[:head]
+
+		tokens.splice(first + head, stop - tail, lexed, shift_idx, (line_start, old_end))
+		return first + head, stop - tail, first + head + len(lexed)
+
+	def same_token(self, old:CompactTokenList, old_key:int, new:CompactTokenList, new_key:int, shift_idx:int) -> bool:
+		return old.text_at(old_key) == new.text_at(new_key) and old.type_at(old_key) == new.type_at(new_key)	\
+			and old.start_at(old_key) + shift_idx == new.start_at(new_key)
 
 	def token_str(tokens:list) -> str:
 		string:str = ""
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import mmap
+import os
+
+from . import __version__
+
+def hash_source(script:str) -> str:
+	return hashlib.sha256(script.encode("utf-8")).hexdigest()
+
+def hash_mapped(mapped, step:int=1<<22) -> str:
+	"""
+	Hashes the bytes of the mmap *mapped* *step* bytes at a time, giving back the pages of each 
+	step once hashed. Same as hash_source for a UTF-8 text with "\\n" line breaks.
+	"""
+	digest = hashlib.sha256()
+	release = getattr(mapped, "madvise", None) if hasattr(mmap, "MADV_DONTNEED") else None
+	with memoryview(mapped) as view:
+		for start in range(0, len(view), step):
+			digest.update(view[start:start+step])
+			if release != None:
+				release(mmap.MADV_DONTNEED, start, min(step, len(view) - start))
+	return digest.hexdigest()
+
+class Manifest:
+	"""
+	Remembers, for every built source, the hash of its text, the compiler version and the build 
+	options it was built with, so an unchanged source can be skipped on the next build. The 
+	manifest is saved as json in the cache folder.
+	Each source also keeps the scripts it imports and their tree hashes when it was built. The tree 
+	hash of a source covers its text and the tree hashes of its imports, so it changes when anything 
+	the source imports changes, directly or not, and the sources importing it are built again.
+	"""
+	FILE_NAME:str = "manifest.json"
+
+	path:str = ""
+	entries:dict = {} # Absolute source path -> entry dict
+	changed:bool = False
+
+	def __init__(self, cache:str) -> None:
+		self.path = os.path.join(cache, self.FILE_NAME)
+		self.entries = {}
+		self.changed = False
+		try:
+			with open(self.path, "r") as file:
+				self.entries = json.load(file)["entries"]
+		except (OSError, ValueError, KeyError, TypeError):
+			pass # A missing or unreadable manifest means everything is rebuilt
+
+	def is_current(self, source:str, options:dict, outputs:list) -> bool:
+		"""
+		Returns True if *source* was last built with *options* into *outputs* and its size and 
+		modification time have not changed since.
+		"""
+		if self.known_hash(source, options, outputs) == None:
+			return False
+		entry:dict = self.entries[os.path.abspath(source)]
+		stat = os.stat(source)
+		return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+
+	def known_hash(self, source:str, options:dict, outputs:list) -> str:
+		"""
+		Returns the hash *source* had when it was last built with *options* into *outputs*, or None 
+		if it has to be built anyway.
+		"""
+		entry:dict = self.entries.get(os.path.abspath(source))
+		if entry == None or entry["version"] != __version__ or	\
+			entry["options"] != options or entry["outputs"] != outputs:
+			return None
+		for output in outputs:
+			if not os.path.isfile(output):
+				return None
+		return entry["hash"]
+
+	def imports(self, source:str) -> dict:
+		"""Returns the {name: path} imports *source* had when it was last built, or None."""
+		entry:dict = self.entries.get(os.path.abspath(source))
+		return None if entry == None else entry.get("imports")
+
+	def imports_current(self, source:str, import_trees:dict) -> bool:
+		"""
+		Returns True if the scripts *source* imports have the same tree hashes, *import_trees* 
+		maps the absolute path of each to its tree hash now, as when *source* was last built.
+		"""
+		entry:dict = self.entries.get(os.path.abspath(source))
+		return entry != None and entry.get("import_trees") == import_trees
+
+	def record(self, source:str, digest:str, options:dict, outputs:list, imports:dict=None, import_trees:dict=None) -> None:
+		stat = os.stat(source)
+		tree = hashlib.sha256(digest.encode("ascii"))
+		for path in sorted(import_trees or {}):
+			tree.update(str(import_trees[path]).encode("ascii"))
+		self.entries[os.path.abspath(source)] = {
+			"hash": digest,
+			"tree": tree.hexdigest(),
+			"version": __version__,
+			"size": stat.st_size,
+			"mtime": stat.st_mtime_ns,
+			"options": options,
+			"outputs": outputs,
+			"imports": imports or {},
+			"import_trees": import_trees or {},
+		}
+		self.changed = True
+
+	def save(self) -> None:
+		if not self.changed:
+			return
+		temp_path:str = self.path + ".tmp"
+		with open(temp_path, "w") as file:
+			json.dump({"entries": self.entries}, file)
+		os.replace(temp_path, self.path)
+		self.changed = False
+
+	def tree(self, source:str) -> str:
+		entry:dict = self.entries.get(os.path.abspath(source))
+		return None if entry == None else entry.get("tree")
+
+	def touch(self, source:str) -> None:
+		stat = os.stat(source)
+		entry:dict = self.entries[os.path.abspath(source)]
+		if entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+			entry["size"] = stat.st_size
+			entry["mtime"] = stat.st_mtime_ns
+			self.changed = True
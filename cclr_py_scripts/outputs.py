@@ -0,0 +1,50 @@
+import os
+
+CHUNK_SIZE:int = 1 << 16
+
+class OutputFile:
+	"""
+	Opens *path* for writing through a temporary file next to it. When the with block ends the
+	temporary file replaces *path* in one rename, unless *path* already holds exactly the same
+	bytes, then it is deleted and *path* is left untouched so its modification time doesn't
+	make C++ build tools rebuild it. *changed* tells which of the two happened. Nothing is
+	replaced if the block raises.
+	"""
+	path:str = ""
+	temp_path:str = ""
+	file = None
+	changed:bool = False
+
+	def __enter__(self):
+		self.file = open(self.temp_path, "w")
+		return self.file
+
+	def __exit__(self, exception_type, exception, traceback) -> None:
+		self.file.close()
+		if exception_type != None or same_content(self.temp_path, self.path):
+			os.remove(self.temp_path)
+			self.changed = False
+		else:
+			os.replace(self.temp_path, self.path)
+			self.changed = True
+
+	def __init__(self, path:str) -> None:
+		self.path = path
+		self.temp_path = "%s.%s.tmp" % (path, os.getpid())
+		self.file = None
+		self.changed = False
+
+def same_content(path_a:str, path_b:str) -> bool:
+	"""Returns True if both files exist and hold the same bytes, checking their sizes first."""
+	try:
+		if os.path.getsize(path_a) != os.path.getsize(path_b):
+			return False
+		with open(path_a, "rb") as file_a, open(path_b, "rb") as file_b:
+			while True:
+				chunk:bytes = file_a.read(CHUNK_SIZE)
+				if chunk != file_b.read(CHUNK_SIZE):
+					return False
+				if not chunk:
+					return True
+	except OSError:
+		return False
@@ -0,0 +1,289 @@
+import gc
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from .commands import *
+from .lexer import CompactTokenList, FIXED_TEXTS, Token, TOKEN_TYPES
+from .parser import PARSER_VERSION
+
+FORMAT_VERSION:int = 3
+MAGIC:bytes = b"CCLRPC"
+HEADER:struct.Struct = struct.Struct("<6sHIB32s") # Magic, format, parser version, byte order, source hash
+COUNT:struct.Struct = struct.Struct("<Q")
+
+# Node tags of the preorder stream, see dump_tree
+TAG_EMPTY:int		= 0
+TAG_GROUP:int		= 1
+TAG_IDENTIFIER:int	= 2
+TAG_NUMERIC:int		= 3
+TAG_TOKEN_LIST:int	= 4
+TAG_DECLARATION:int	= 5
+TAG_IMPORT:int		= 6
+
+DECLARATION_FIELDS:tuple = ("cmd_options", "cmd_name", "cmd_type", "cmd_asignment")
+
+def dump_tree(cmd_script:CmdScript, tokens:CompactTokenList) -> tuple:
+	"""
+	Flattens the commands of *cmd_script* into a preorder array of ints: each node is its tag, its
+	type and its own fields, followed by its children. Tokens are stored as their index in *tokens*, 
+	which must not have pending shifts, operators as their index in the returned string list. 
+	Returns (array, strings). Raises a ValueError for a node that can't be stored, like an error.
+	"""
+	stream:array = array("i")
+	strings:list = []
+	string_ids:dict = {}
+
+	def string_id(text:str) -> int:
+		if text not in string_ids:
+			string_ids[text] = len(strings)
+			strings.append(text)
+		return string_ids[text]
+
+	index_of:dict = dict(zip(tokens.starts, range(len(tokens)))) # The tokens have no pending shifts
+	def token_id(token:Token) -> int:
+		i:int = index_of.get(token.idx, -1)
+		if tokens.text_at(i) != token.text:
+			raise ValueError("Token '%s' is not in the token list" % token)
+		return i
+
+	stack:list = list(reversed(cmd_script.commands))
+	while stack:
+		node = stack.pop()
+		if isinstance(node, CmdGroup):
+			stream.extend((TAG_GROUP, node.type, string_id(str(node.pre_op)),
+				string_id(str(node.pos_op)), string_id(str(node.op))))
+			stack.append(node.right)
+			stack.append(node.left)
+		elif isinstance(node, CmdVarDeclaration):
+			stream.extend((TAG_DECLARATION, node.type))
+			for field in reversed(DECLARATION_FIELDS):
+				stack.append(getattr(node, field))
+		elif isinstance(node, CmdIdentifier):
+			stream.extend((TAG_IDENTIFIER, node.type, token_id(node.value)))
+		elif isinstance(node, CmdNumericLiteral):
+			stream.extend((TAG_NUMERIC, node.type, token_id(node.value)))
+		elif isinstance(node, CmdTokenList):
+			stream.extend((TAG_TOKEN_LIST, node.type, len(node.keys)))
+			stream.extend([token_id(key) for key in node.keys])
+		elif isinstance(node, CmdImport):
+			stream.extend((TAG_IMPORT, node.type, token_id(node.keyword), len(node.names)))
+			stream.extend([token_id(name) for name in node.names])
+		elif isinstance(node, Command) and node.is_empty():
+			stream.append(TAG_EMPTY)
+		else:
+			raise ValueError("Can't store a %s" % type(node).__name__)
+	return stream, strings
+
+def load_tree(stream:array, strings:list, tokens:CompactTokenList, count:int) -> list:
+	"""
+	Rebuilds the *count* top level commands stored by dump_tree. Each node is made without calling
+	its __init__, every field __init__ would set is set from the stream.
+	"""
+	commands:list = [None] * count
+	slots:list = [(commands, i) for i in reversed(range(count))] # Where each next node goes
+	i:int = 0
+
+	# Freshly loaded tokens have no pending shifts, so they are read straight from the arrays
+	source:str = tokens.source
+	types, starts, lengths, codes = tokens.columns()
+	tokens.line_index()
+	lines:array = tokens.lines
+	def token_at(key:int) -> Token:
+		start:int = starts[key]
+		code:int = codes[key]
+		text:str = FIXED_TEXTS[code] if code else source[start:start+lengths[key]]
+		return Token(text, start, -1, -1, TOKEN_TYPES[types[key]], code, lines)
+
+	while slots:
+		parent, key = slots.pop()
+		tag:int = stream[i]
+		if tag == TAG_EMPTY:
+			node = CmdEmpty()
+			i += 1
+		elif tag == TAG_GROUP:
+			node = CmdGroup.__new__(CmdGroup)
+			node.type = stream[i+1]
+			node.pre_op = strings[stream[i+2]]
+			node.pos_op = strings[stream[i+3]]
+			node.op = strings[stream[i+4]]
+			i += 5
+			slots.append((node, "right"))
+			slots.append((node, "left"))
+		elif tag == TAG_DECLARATION:
+			node = CmdVarDeclaration.__new__(CmdVarDeclaration)
+			node.type = stream[i+1]
+			i += 2
+			for field in reversed(DECLARATION_FIELDS):
+				slots.append((node, field))
+		elif tag == TAG_IDENTIFIER or tag == TAG_NUMERIC:
+			cls = CmdIdentifier if tag == TAG_IDENTIFIER else CmdNumericLiteral
+			node = cls.__new__(cls)
+			node.type = stream[i+1]
+			node.value = token_at(stream[i+2])
+			i += 3
+		elif tag == TAG_TOKEN_LIST:
+			node = CmdTokenList.__new__(CmdTokenList)
+			node.type = stream[i+1]
+			length:int = stream[i+2]
+			node.keys = [token_at(key) for key in stream[i+3:i+3+length]]
+			i += 3 + length
+		elif tag == TAG_IMPORT:
+			node = CmdImport.__new__(CmdImport)
+			node.type = stream[i+1]
+			node.keyword = token_at(stream[i+2])
+			length = stream[i+3]
+			node.names = [token_at(key) for key in stream[i+4:i+4+length]]
+			i += 4 + length
+		else:
+			raise ValueError("Unknown node tag %s" % tag)
+
+		if isinstance(key, str):
+			setattr(parent, key, node)
+		else:
+			parent[key] = node
+	return commands
+
+class ParseCache:
+	"""
+	Keeps the tokens and parse tree of each source text in the cache folder, in a binary file
+	named after the hash of the text, so a source that is built again without changing isn't
+	lexed and parsed again. A file written by another format or parser version is deleted.
+	"""
+	FOLDER_NAME:str = "parsed"
+
+	folder:str = ""
+
+	def __init__(self, cache:str) -> None:
+		self.folder = os.path.join(cache, self.FOLDER_NAME)
+
+	def discard(self, digest:str) -> None:
+		try:
+			os.remove(self.path(digest))
+		except OSError:
+			pass
+
+	def load(self, digest:str, script:str) -> tuple:
+		"""
+		Returns (tokens, cmd_script) saved for the text *script* with hash *digest*, or None.
+		"""
+		try:
+			with open(self.path(digest), "rb") as file:
+				data:bytes = file.read()
+		except OSError:
+			return None
+
+		collecting:bool = gc.isenabled()
+		gc.disable() # Nothing made here is garbage, collecting while it is made would only slow it down
+		try:
+			magic, format, version, order, stored = HEADER.unpack_from(data, 0)
+			if magic != MAGIC or format != FORMAT_VERSION or version != PARSER_VERSION	\
+				or order != (sys.byteorder == "little") or stored != bytes.fromhex(digest):
+				raise ValueError("Stale entry")
+			reader:BufferReader = BufferReader(zlib.decompress(data[HEADER.size:]))
+
+			tokens:CompactTokenList = CompactTokenList(script)
+			for column in tokens.columns():
+				reader.read_array(column)
+			strings:list = [reader.read_bytes().decode("utf-8") for _ in range(reader.read_count())]
+			count:int = reader.read_count()
+			stream:array = reader.read_array(array("i"))
+			ends:array = reader.read_array(array("q"))
+			states:array = reader.read_array(array("q"))
+
+			cmd_script:CmdScript = CmdScript(load_tree(stream, strings, tokens, count))
+			cmd_script.ends = CommandEnds(ends)
+			cmd_script.states = [(states[i], states[i+1], bool(states[i+2]), bool(states[i+3]))
+				for i in range(0, len(states), 4)]
+		except (ValueError, IndexError, struct.error, zlib.error):
+			self.discard(digest)
+			return None
+		finally:
+			if collecting:
+				gc.enable()
+		return tokens, cmd_script
+
+	def path(self, digest:str) -> str:
+		return os.path.join(self.folder, digest + ".bin")
+
+	def prune(self, keep:set) -> None:
+		"""Deletes the entries of every text whose hash is not in *keep*."""
+		try:
+			entries = os.scandir(self.folder)
+		except OSError:
+			return
+		with entries:
+			for entry in entries:
+				if entry.name.endswith(".bin") and entry.name[:-4] not in keep:
+					self.discard(entry.name[:-4])
+
+	def save(self, digest:str, tokens:CompactTokenList, cmd_script:CmdScript) -> bool:
+		"""
+		Saves *tokens* and *cmd_script*, parsed from the text with hash *digest*. Returns False
+		if they can't be stored.
+		"""
+		if not isinstance(tokens, CompactTokenList) or not isinstance(cmd_script, CmdScript) or tokens.replaced:
+			return False
+		tokens.compact()
+		try:
+			stream, strings = dump_tree(cmd_script, tokens)
+		except ValueError:
+			return False
+
+		parts:list = []
+		for column in tokens.columns():
+			parts += array_parts(column)
+		parts.append(COUNT.pack(len(strings)))
+		for text in strings:
+			encoded:bytes = text.encode("utf-8")
+			parts += [COUNT.pack(len(encoded)), encoded]
+		parts.append(COUNT.pack(len(cmd_script.commands)))
+		parts += array_parts(stream)
+		parts += array_parts(array("q", cmd_script.ends))
+		parts += array_parts(array("q", [int(value) for state in cmd_script.states for value in state]))
+
+		os.makedirs(self.folder, exist_ok=True)
+		path:str = self.path(digest)
+		temp:str = "%s.%s.tmp" % (path, os.getpid()) # Workers may save the same text at once
+		with open(temp, "wb") as file:
+			file.write(HEADER.pack(MAGIC, FORMAT_VERSION, PARSER_VERSION, sys.byteorder == "little", bytes.fromhex(digest)))
+			file.write(zlib.compress(b"".join(parts), 1))
+		os.replace(temp, path)
+		return True
+
+class BufferReader:
+	data:bytes = b""
+	position:int = 0
+
+	def __init__(self, data:bytes, position:int=0) -> None:
+		self.data = data
+		self.position = position
+
+	def read_array(self, column:array) -> array:
+		"""Reads an array written by array_parts into *column*, which gives the item type."""
+		typecode:str = chr(self.data[self.position])
+		itemsize:int = self.data[self.position+1]
+		if typecode != column.typecode or itemsize != column.itemsize:
+			raise ValueError("Expected an array of '%s'" % column.typecode)
+		self.position += 2
+		column.frombytes(self.read_bytes())
+		return column
+
+	def read_bytes(self) -> bytes:
+		length:int = self.read_count()
+		if self.position + length > len(self.data):
+			raise ValueError("Truncated entry")
+		data:bytes = self.data[self.position:self.position+length]
+		self.position += length
+		return data
+
+	def read_count(self) -> int:
+		count:int = COUNT.unpack_from(self.data, self.position)[0]
+		self.position += COUNT.size
+		return count
+
+def array_parts(column:array) -> list:
+	data:bytes = column.tobytes()
+	return [column.typecode.encode("ascii"), bytes((column.itemsize,)), COUNT.pack(len(data)), data]
@@ -1,76 +1,267 @@
 
-try:
-	from cclr_py_scripts.commands import *
-	from cclr_py_scripts.lexer import Lexer, Token, TokenList
-except:
-	from commands import *
-	from lexer import Lexer, Token, TokenList
+from .commands import *
+from .lexer import BoundaryIndex, BoundaryScan, CompactTokenList, FIXED_TEXTS, Lexer, Token, TOKEN_CODES, TokenList, TokenStream, TokenTypes
+from .progress import progress
 from types import FunctionType
-from tqdm import tqdm
+
+PARSER_VERSION:int = 2 # Change whenever the grammar or the commands it makes change, see ParseCache
+
+# Codes of the texts and the token types the grammar looks for, see TOKEN_CODES, as module ints so checking a
+# token is one int comparison, reading an enum member is much slower
+NEWLINE:int		= TOKEN_CODES["\n"]
+ALC:int			= TOKEN_CODES["alc"]
+STATIC:int		= TOKEN_CODES["static"]
+CONST:int		= TOKEN_CODES["const"]
+PAREN_OPEN:int	= TOKEN_CODES["("]
+PAREN_CLOSE:int	= TOKEN_CODES[")"]
+QUESTION:int	= TOKEN_CODES["?"]
+COLON:int		= TOKEN_CODES[":"]
+SEMICOLON:int	= TOKEN_CODES[";"]
+DOT:int			= TOKEN_CODES["."]
+TYPE_VARNAME:int	= int(TokenTypes.VARNAME)
+TYPE_KEYWORD:int	= int(TokenTypes.KEYWORD)
+TYPE_INT:int		= int(TokenTypes.INT)
+TYPE_INDENT:int		= int(TokenTypes.INDENT)
+TYPE_COMMENT:int	= int(TokenTypes.COMMENT)
 
 class Parser(object):
 
 	cursor:int = -1
 	cursors_saved:int = [cursor]
+	command_start:int = -1	# Cursor before the top level command being parsed, see p_recover
 	tokens:TokenList = []
+	boundaries:BoundaryIndex = None
 
 	indent:int = 0
 	expected_indent:int = 0
 	can_dedent:bool = False
 	is_awaiting_initial_indent:bool = False
 
-	def parse(self, tokens:TokenList, show_bar:bool=False) -> list:
+	BINDING_POWERS:dict = {	# How tightly each binary operator holds its operands
+		"?"		:10,	# Conditional, "a ? b : c"
+		"|"		:20,
+		"^"		:30,
+		"&"		:40,
+		"=="	:50,
+		">"		:60,
+		"<"		:60,
+		">="	:60,
+		"<="	:60,
+		"+"		:70,
+		"-"		:70,
+		"*"		:80,
+		"/"		:80,
+		"%"		:80,
+	}
+	PREFIX_OPS:tuple = ("!", "-")
+	PREFIX_POWER:int = 90
+	POWERS:list = [0] * len(FIXED_TEXTS)	# BINDING_POWERS by token code
+	for _op, _power in BINDING_POWERS.items():
+		POWERS[TOKEN_CODES[_op]] = _power
+	PREFIX_CODES:tuple = tuple([TOKEN_CODES[_op] for _op in PREFIX_OPS])
+	del _op, _power
+
+	INITIAL_STATE:tuple = (0, 0, True, False) # See state
+
+	packrat:bool = False	# Memoize the rules called by eoe
+	memo_size:int = 1<<16	# Most results kept in *memo* at once
+	memo:dict = {}			# (rule, cursor) -> (command, cursor after, cursors_saved[0] after)
+
+	def __init__(self, packrat:bool=False, memo_size:int=1<<16) -> None:
+		self.packrat = packrat
+		self.memo_size = memo_size
+		self.memo = {}
+		self.release()
+
+	def release(self) -> None:
+		"""Forgets the tokens of the last parse, so a parser kept for later doesn't hold them."""
 		self.cursor = -1
 		self.cursors_saved = [-1]
-		self.tokens = tokens
-
-		self.indent = 0
-		self.expected_indent = 0
-		self.is_awaiting_initial_indent = True
-		self.can_dedent = False
+		self.command_start = -1
+		self.tokens = TokenList()
+		self.boundaries = None
+		self.memo.clear()
+		self.set_state(self.INITIAL_STATE)
 
+	def parse(self, tokens:TokenList, show_bar:bool=False, recover:bool=False) -> list:
+		"""
+		Parses every top level command. Returns a CmdScript, or a list with only the first error. 
+		With *recover* every error is kept in place in the CmdScript, see iter_parse. A script 
+		without commands, blank or only comments, is an empty CmdScript.
+		"""
 		commands:list = []
-		i:int = 0
-		with tqdm(total=len(self.tokens), desc="Parsinng CClear files", unit="token", disable=not show_bar) as pbar:
-			while self.cursor != len(self.tokens)-1:
-
-				loop_made_change:bool = False
-				while True:
-					if self.token_next_check("\n"):
-						self.indent = 0
-						loop_made_change = True
-						continue
-					tk = self.token_spy()
-					ma = Lexer.RE_INDENT.match(tk.text)
-					if ma != None:
-						# TODO: Better handling of spaces and tabs
-						self.indent = len(tk.text)
-						if self.is_awaiting_initial_indent:
-							self.expected_indent = self.indent
-							self.is_awaiting_initial_indent = False
-
-						self.token_next()
-						loop_made_change = True
-						continue
-					break
-				if loop_made_change:
-					continue
+		ends:list = []
+		states:list = [self.INITIAL_STATE]
+		for expression in self.iter_parse(tokens, show_bar, recover):
+			if expression.is_error() and not recover:
+				return [expression]
+			commands.append(expression)
+			ends.append(self.cursor+1)
+			states.append(self.state())
+
+		cmd_script:CmdScript = CmdScript(commands)
+		cmd_script.ends = CommandEnds(ends)
+		cmd_script.states = states
+		return cmd_script
+
+	def iter_parse(self, tokens, show_bar:bool=False, recover:bool=False):
+		"""
+		Yields each top level command as soon as it is parsed, stopping after the first error. 
+		With *recover* the error is yielded and parsing goes on after the command it is in, so 
+		every error of a script is found in one pass. *tokens* can be a TokenList, a list or any 
+		iterator of tokens such as Lexer.iter_tokens. Tokens before the command being parsed are 
+		released, so a TokenStream only holds the tokens of one command at a time.
+		"""
+		if isinstance(tokens, list):
+			tokens = TokenList(tokens)
+		elif not isinstance(tokens, (TokenList, TokenStream)):
+			tokens = TokenStream(tokens)
 
-				expression:Command = self.p_script()
+		self.cursor = -1
+		self.cursors_saved = [-1]
+		self.tokens = tokens
+		self.boundaries = tokens.boundaries()
+		self.memo.clear()
+		self.set_state(self.INITIAL_STATE)
+
+		total = len(tokens) if isinstance(tokens, TokenList) else None
+		with progress(total=total, desc="Parsinng CClear files", unit="token", disable=not show_bar) as pbar:
+			while True:
+				expression:Command = self.p_next()
+				if expression == None:
+					break
 				if expression.is_error():
-					return [expression]
-				commands.append(expression)
+					if not recover:
+						yield expression
+						return
+					expression = self.p_recover(expression)
+				yield expression
 				# Update progress bar
-				if self.cursor-pbar.n > len(tokens)/100:
+				if total is None or self.cursor-pbar.n > total/100:
 					pbar.update(self.cursor-pbar.n)
 
 			pbar.update(self.cursor+1-pbar.n)
 
-		if len(commands) != 0:
-			return CmdScript(commands)
+	def reparse(self, cmd_script:CmdScript, tokens:CompactTokenList, first:int, old_stop:int, new_stop:int) -> list:
+		"""
+		Updates *cmd_script*, made by *parse*, after Lexer.relex replaced the tokens *first* to 
+		*old_stop* by the tokens *first* to *new_stop*. Parsing restarts at the command before the 
+		edit and stops as soon as a command ends where an old command ended past the edit, in the 
+		same state, every command after that is kept with the Token objects it was parsed from, 
+		which keep their positions from before the edit. Returns *cmd_script*, or an error like 
+		*parse*, after a parse error *cmd_script* is left out of date and the tokens must be parsed again.
+		"""
+		if not cmd_script.states: # No parser states were kept with it, there is nothing to reuse
+			parsed = self.parse(tokens)
+			if not isinstance(parsed, CmdScript) or not parsed.states:
+				return parsed
+			cmd_script.commands = parsed.commands
+			cmd_script.ends = parsed.ends
+			cmd_script.states = parsed.states
+			return cmd_script
+
+		ends:CommandEnds = cmd_script.ends
+		states:list = cmd_script.states
+		moved:int = new_stop - old_stop
+
+		# A command can depend on the token after its end, which its last rule looked at
+		start_i:int = ends.bisect_left(first)
+		start:int = ends[start_i-1] if start_i > 0 else 0
+
+		self.cursor = start-1
+		self.cursors_saved = [start-1]
+		self.tokens = tokens
+		self.boundaries = BoundaryScan(tokens)
+		self.memo.clear()
+		self.set_state(states[start_i])
+
+		commands:list = []
+		new_ends:list = []
+		new_states:list = []
+		old_i:int = start_i # Old command that may end where the last new one does
+		stop_i:int = len(ends) # Old commands from start_i up to stop_i are replaced
+		while True:
+			expression:Command = self.p_next()
+			if expression == None:
+				break
+			if expression.is_error():
+				return [expression]
+			commands.append(expression)
+			new_ends.append(self.cursor+1)
+			new_states.append(self.state())
+
+			end:int = self.cursor+1 - moved # The same token before the edit
+			if end < old_stop:
+				continue
+			while old_i < len(ends) and ends[old_i] < end:
+				old_i += 1
+			if old_i < len(ends) and ends[old_i] == end and states[old_i+1] == new_states[-1]:
+				stop_i = old_i + 1
+				break
+
+		# Only the replaced commands are touched, the ends after them get a pending shift
+		cmd_script.commands[start_i:stop_i] = commands
+		ends.splice(start_i, stop_i, new_ends, moved)
+		states[start_i+1:stop_i+1] = new_states
+		return cmd_script
 
-		err:CmdError = CmdError(msg="Error in parse.", token=self.token_spy())
-		return CmdScript(([err]))
+	def p_next(self) -> Command:
+		"""
+		Skips line breaks, comments and indents, keeping track of the indent, then parses one top level 
+		command. Returns None when there are no tokens left.
+		"""
+		while self.tokens.has(self.cursor+1):
+			self.tokens.release(self.cursor)
+			if self.memo: # Nothing backtracks past the start of a command
+				self.memo.clear()
+
+			if self.token_next_check(NEWLINE):
+				self.indent = 0
+				continue
+			type:int = self.tokens.type_at(self.cursor+1)
+			if type == TYPE_COMMENT:
+				self.cursor += 1
+				continue
+			if type == TYPE_INDENT:
+				# TODO: Better handling of spaces and tabs
+				self.indent = self.tokens.indent_at(self.cursor+1)
+				if self.is_awaiting_initial_indent:
+					self.expected_indent = self.indent
+					self.is_awaiting_initial_indent = False
+
+				self.cursor += 1
+				continue
+
+			self.command_start = self.cursor
+			return self.p_script()
+		return None
+
+	def p_recover(self, error:CmdError) -> CmdError:
+		"""
+		Skips the top level command that failed with *error*, up to and including its ';' or up to 
+		the end of its line, so the next command can be parsed. Returns the error to report, an 
+		invalid token in the skipped tokens comes first as it is likely what made the command fail.
+		"""
+		self.cursor = self.command_start
+		invalid:Token = None
+		while True:
+			token:Token = self.token_next()
+			if invalid == None and token.type == TokenTypes.ERROR:
+				invalid = token
+			if token.code == SEMICOLON or not self.tokens.has(self.cursor+1) \
+				or self.tokens.type_at(self.cursor+1) == TokenTypes.NEWLINE:
+				break
+
+		if invalid != None:
+			return CmdError(invalid, msg="Invalid token '%s'" % invalid.text.strip())
+		return error
+
+	def set_state(self, state:tuple) -> None:
+		self.indent, self.expected_indent, self.is_awaiting_initial_indent, self.can_dedent = state
+
+	def state(self) -> tuple:
+		"""The indentation state carried from one top level command to the next."""
+		return (self.indent, self.expected_indent, self.is_awaiting_initial_indent, self.can_dedent)
 
 	def eoe(self, left:FunctionType, right:FunctionType=None, op:str="NA", 
 		pre_op:str="NA", pos_op:str="NA", cmd_type:CmdTypes=CmdTypes.NO_TYPE) -> Command:
@@ -81,29 +272,29 @@ class Parser(object):
 		self.token_save(0) # Return to slot 0 if pre op is used, but not all requirements are met
 
 		if pre_op != "NA": # Using left op, optionally using right op, but not op.
-			if self.token_next_check(pre_op):
-				e2:Command = right()
+			if self.token_next_check(TOKEN_CODES[pre_op]):
+				e2:Command = self.call_rule(right)
 				if e2.is_error():
 					return e2
 				if e2.is_empty():
-					return left()
+					return self.call_rule(left)
 
-				if pos_op == "NA" or self.token_next_check(pos_op):
+				if pos_op == "NA" or self.token_next_check(TOKEN_CODES[pos_op]):
 					return CmdGroup(type=cmd_type, right=e2, pre_op=pre_op, pos_op=pos_op)
 
-			return left()
+			return self.call_rule(left)
 
 		elif pos_op != "NA": # Using right_op without left_op
 			assert(False, "post_op requires pre_op because to implementation exists for without it.")
 
 		elif op != "NA": # Using only op
-			e1:Command = left()
+			e1:Command = self.call_rule(left)
 			if e1.is_error():
 				return e1
 
 			self.token_save()
-			if self.token_next_check(op):
-				e2:Command = right()
+			if self.token_next_check(TOKEN_CODES[op]):
+				e2:Command = self.call_rule(right)
 				if e2.is_error():
 					return e2
 				if e2.is_empty():
@@ -114,24 +305,42 @@ class Parser(object):
 
 			return e1
 
-		return left()
+		return self.call_rule(left)
+
+	def call_rule(self, rule:FunctionType) -> Command:
+		"""
+		Calls *rule*. With packrat parsing the outcome of a rule at a cursor is remembered, so a 
+		rule is never parsed twice from the same token after backtracking.
+		"""
+		if not self.packrat:
+			return rule()
+
+		key:tuple = (rule.__func__, self.cursor)
+		result:tuple = self.memo.get(key)
+		if result != None:
+			self.cursor = result[1]
+			self.cursors_saved[0] = result[2]
+			return result[0]
+
+		cmd:Command = rule()
+		while self.memo and len(self.memo) >= self.memo_size: # Forget the oldest results
+			del self.memo[next(iter(self.memo))]
+		self.memo[key] = (cmd, self.cursor, self.cursors_saved[0])
+		return cmd
 
 	def token_inspect(self, expectation:str) -> str:
 		return self.token_next() == expectation
 
 	def token_next(self) -> str:
 		self.cursor += 1
-		if self.cursor+1 > len(self.tokens):
+		if not self.tokens.has(self.cursor):
 			return ""
 		return self.tokens[self.cursor]
 
-	def token_next_check(self, equater:str) -> bool: # Returns the next token. Also increments the cursor if the next token is equal to *equater*.
-		val:str = ""
-		if self.cursor < len(self.tokens)-1:
-			val = self.tokens[self.cursor+1]
-			if val == equater:
-				self.cursor += 1
-				return True
+	def token_next_check(self, code:int) -> bool: # Increments the cursor if the next token has the code *code*, see TOKEN_CODES.
+		if self.tokens.code_at(self.cursor+1) == code:
+			self.cursor += 1
+			return True
 
 		return False
 
@@ -141,13 +350,17 @@ class Parser(object):
 	def token_restore(self, slot:int=0) -> None:
 		self.cursor = self.cursors_saved[slot]
 
+	def token_rewind(self, cursor:int) -> None:
+		"""Moves the cursor back to *cursor*, how the expression rules backtrack, see Profiler.restore."""
+		self.cursor = cursor
+
 	def token_save(self, slot:int=0) -> None:
 		append_by:int = (slot+1)-len(self.cursors_saved)
 		self.cursors_saved += range(append_by)
 		self.cursors_saved[slot] = self.cursor
 
 	def token_spy(self) -> str:
-		if self.cursor+1 >= len(self.tokens):
+		if not self.tokens.has(self.cursor+1):
 			return Token()
 		return self.tokens[self.cursor+1]
 
@@ -161,7 +374,10 @@ class Parser(object):
 		
 		reading_tk:Token = self.token_spy()
 
-		cmd = self.p_vardec_start()
+		cmd = self.p_import_start()
+		if cmd.is_empty():
+			self.token_restore()
+			cmd = self.p_vardec_start()
 		if cmd.is_empty():
 			self.token_restore()
 			cmd = self.p_expr_start()
@@ -187,22 +403,10 @@ class Parser(object):
 		return CmdEmpty()
 
 	def p_name(self) -> Command:
-		token:Token = self.token_spy()
-
-		if token.text[0].isalpha() or token.text[0] == "_":
-			use:bool = True
-
-			i:int = 0
-			char:str = ""
-			while i < len(token.text):
-				char = token.text[i:i+1]
-				if not char.isalnum() and char != "_":
-					use = False
-					break
-				i += 1
-
-			if use:
-				return CmdIdentifier(value=self.token_next())
+		# The lexer only makes names of valid identifiers, so their type is all there is to check
+		type:int = self.tokens.type_at(self.cursor+1)
+		if type == TYPE_VARNAME or type == TYPE_KEYWORD:
+			return CmdIdentifier(value=self.token_next())
 
 		return CmdEmpty()
 
@@ -211,34 +415,93 @@ class Parser(object):
 	# =============================================================================
 
 	def p_expr_start(self) -> Command:
-		return self.eoe(left=self.p_expr_sub, 
-			cmd_type=CmdTypes.BINARY_EXPRESSION)
+		return self.p_expr(0)
+
+	def p_expr(self, min_power:int) -> Command:
+		"""
+		Parses an expression with precedence climbing over *BINDING_POWERS*. Operators that bind 
+		tighter than *min_power* are read in one loop, so a long chain of operators never recurses 
+		deeper than the number of precedence levels it uses. Operators with nothing to their right 
+		are left unread.
+		"""
+		e1:Command = self.p_expr_prefix()
+		if e1.is_error() or e1.is_empty():
+			return e1
+
+		while True:
+			code:int = self.tokens.code_at(self.cursor+1)
+			power:int = self.POWERS[code]
+			if power <= min_power:
+				return e1
 
-	def p_expr_sub(self) -> Command:
-		return self.eoe(left=self.p_expr_add, right=self.p_expr_start, 
-				op="-", cmd_type=CmdTypes.BINARY_EXPRESSION)
+			op:str = FIXED_TEXTS[code]
+			op_cursor:int = self.cursor
+			self.cursor += 1
+			if code == QUESTION:
+				e2:Command = self.p_expr_ternary(power)
+			else:
+				e2 = self.p_expr(power)
+			if e2.is_error():
+				return e2
+			if e2.is_empty():
+				self.token_rewind(op_cursor)
+				return e1
 
-	def p_expr_add(self) -> Command:
-		return self.eoe(left=self.p_expr_divi, right=self.p_expr_start, 
-			op="+",	cmd_type=CmdTypes.BINARY_EXPRESSION)
+			e1 = CmdGroup(type=CmdTypes.BINARY_EXPRESSION, left=e1, right=e2, op=op)
 
-	def p_expr_divi(self) -> Command:
-		return self.eoe(left=self.p_expr_mult, right=self.p_expr_start, 
-			op="/",	cmd_type=CmdTypes.BINARY_EXPRESSION)
+	def p_expr_prefix(self) -> Command:
+		code:int = self.tokens.code_at(self.cursor+1)
 
-	def p_expr_mult(self) -> Command:
-		return self.eoe(left=self.p_expr_paren, right=self.p_expr_start, 
-			op="*", cmd_type=CmdTypes.BINARY_EXPRESSION)
+		if code == PAREN_OPEN:
+			paren_cursor:int = self.cursor
+			self.cursor += 1
+			e1:Command = self.p_expr(0)
+			if e1.is_error():
+				return e1
+			if e1.is_empty():
+				self.token_rewind(paren_cursor)
+				return e1
+			if not self.token_next_check(PAREN_CLOSE):
+				err:CmdError = CmdError(self.token_spy(), msg="Expected a ')'")
+				return err
+			return CmdGroup(type=CmdTypes.BINARY_EXPRESSION, right=e1, pre_op="(", pos_op=")")
 
-	def p_expr_paren(self) -> Command:
-		return self.eoe(left=self.p_expr_literal, right=self.p_expr_start, \
-			pre_op="(", pos_op=")", cmd_type=CmdTypes.BINARY_EXPRESSION)
+		if code in self.PREFIX_CODES:
+			op_cursor:int = self.cursor
+			self.cursor += 1
+			e1 = self.p_expr(self.PREFIX_POWER)
+			if e1.is_error():
+				return e1
+			if e1.is_empty():
+				self.token_rewind(op_cursor)
+				return e1
+			return CmdGroup(type=CmdTypes.BINARY_EXPRESSION, right=e1, pre_op=FIXED_TEXTS[code])
+
+		return self.p_expr_literal()
+
+	def p_expr_ternary(self, power:int) -> Command:
+		"""
+		Parses the "a : b" that follows a "?", returned as one group so the "?" keeps a single right side.
+		"""
+		e1:Command = self.p_expr(0)
+		if e1.is_error() or e1.is_empty():
+			return e1
+
+		colon_cursor:int = self.cursor
+		if self.token_next_check(COLON):
+			e2:Command = self.p_expr(power-1) # Right associative
+			if e2.is_error():
+				return e2
+			if not e2.is_empty():
+				return CmdGroup(type=CmdTypes.BINARY_EXPRESSION, left=e1, right=e2, op=":")
+			self.token_rewind(colon_cursor)
+
+		err:CmdError = CmdError(self.token_spy(), msg="Expected a ':' in conditional expression")
+		return err
 
 	def p_expr_literal(self) -> Command:
-		token:Token = self.token_spy()
-		if token.text.isnumeric():
-			self.token_next()
-			return CmdNumericLiteral(value=token)
+		if self.tokens.type_at(self.cursor+1) == TYPE_INT:
+			return CmdNumericLiteral(value=self.token_next())
 
 		return self.p_expr_var()
 
@@ -249,21 +512,44 @@ class Parser(object):
 		e1.type = CmdTypes.VARIABLE
 		return e1
 
+	# =============================================================================
+	# Parse Import
+	# =============================================================================
+
+	IMPORT_KEYWORDS:tuple = ("import", "inherit")
+	IMPORT_CODES:tuple = tuple([TOKEN_CODES[keyword] for keyword in IMPORT_KEYWORDS])
+
+	def p_import_start(self) -> Command:
+		if self.tokens.code_at(self.cursor+1) not in self.IMPORT_CODES:
+			return CmdEmpty()
+		command:CmdImport = CmdImport(self.token_next())
+
+		while True:
+			name:Command = self.p_name()
+			if name.is_empty():
+				err:CmdError = CmdError(self.token_spy(), msg="Import expected a script name")
+				return err
+			command.names.append(name.value)
+			if not self.token_next_check(DOT):
+				break
+
+		if not self.token_next_check(SEMICOLON):
+			err:CmdError = CmdError(self.token_spy(), msg="Import was not closed with a ';'")
+			return err
+		return command
+
 	# =============================================================================
 	# Parse Variable Declaration
 	# =============================================================================
 
 	def p_vardec_start(self) -> Command:
-		if self.token_next_check("alc"):
+		if self.token_next_check(ALC):
 			command:CmdVarDeclaration = CmdVarDeclaration()
 			
 			length:int = -1
-			i:int = self.cursor
-			while i != len(self.tokens):
-				if self.tokens[i] == ";":
-					length = i - self.cursor
-					break
-				i += 1
+			end:int = self.boundaries.next_terminator(self.cursor)
+			if end != -1:
+				length = end - self.cursor
 
 			# Var options
 			command.cmd_options = self.p_vardec_opti1()
@@ -276,7 +562,7 @@ class Parser(object):
 				return command.cmd_name
 
 			# Var type
-			if self.token_next_check(":"):
+			if self.token_next_check(COLON):
 				command.cmd_type = self.p_name()
 				if command.cmd_type.is_error():
 					return command.cmd_type
@@ -289,7 +575,7 @@ class Parser(object):
 			if command.cmd_asignment.is_error():
 					return command.cmd_asignment
 
-			if self.token_next_check(";"):
+			if self.token_next_check(SEMICOLON):
 				if length != -1:
 					return command
 				err:CmdError = CmdError(self.token_spy(), msg="Error in variable declaration.")
@@ -310,15 +596,16 @@ class Parser(object):
 
 	def p_vardec_opti2(self) -> Command:
 		keys:list = []
+		close:int = self.boundaries.matching(self.cursor) # The cursor is on the opening "("
 		i:int = self.cursor+1
-		while i != len(self.tokens):
-			token:Token = self.tokens[i]
-			if token == "static" or token == "const":
-				keys.append(token)
-				self.token_next()
-			elif token == ")":
+		while self.tokens.has(i) and i != close:
+			code:int = self.tokens.code_at(i)
+			if code == STATIC or code == CONST:
+				keys.append(self.token_next())
+			elif code == PAREN_CLOSE:
 				break
 			else:
+				token:Token = self.tokens[i]
 				err:CmdError = CmdError(token, msg="Invalid keyword for variable declaration '{}'".format(token))
 				return err
 			i += 1
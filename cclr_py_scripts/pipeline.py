@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class Pipeline:
+	"""
+	Passes every item through three stages: *read* and *write* run in a thread pool, *compile*
+	runs in the event loop's thread, so reading the next items and writing the last ones overlap
+	with compiling the current one. The stages are joined by queues of at most *depth* items,
+	a stage that gets ahead waits for the next one, so only a few items are ever in memory.
+	*read* is called with an item, *compile* with the item and what *read* returned, *write*
+	with the item and what *compile* returned. *run* returns what *write* returned for each item,
+	in the order of the items.
+	"""
+	read = None
+	compile = None
+	write = None
+	depth:int = 4
+	threads:int = 4
+
+	def __init__(self, read, compile, write, depth:int=4, threads:int=4) -> None:
+		self.read = read
+		self.compile = compile
+		self.write = write
+		self.depth = depth
+		self.threads = threads
+
+	def run(self, items:list) -> list:
+		return asyncio.run(self.drive(list(items)))
+
+	async def drive(self, items:list) -> list:
+		loop = asyncio.get_running_loop()
+		results:list = [None] * len(items)
+		compiling:asyncio.Queue = asyncio.Queue(self.depth)	# (index, future of the read)
+		writing:asyncio.Queue = asyncio.Queue(self.depth)	# (index, future of the write)
+
+		with ThreadPoolExecutor(max_workers=self.threads) as pool:
+			async def read_stage() -> None:
+				for i, item in enumerate(items):
+					await compiling.put( (i, loop.run_in_executor(pool, self.read, item)) )
+				await compiling.put(None)
+
+			async def compile_stage() -> None:
+				while True:
+					entry:tuple = await compiling.get()
+					if entry == None:
+						break
+					i, reading = entry
+					compiled = self.compile(items[i], await reading)
+					await writing.put( (i, loop.run_in_executor(pool, self.write, items[i], compiled)) )
+				await writing.put(None)
+
+			async def write_stage() -> None:
+				while True:
+					entry:tuple = await writing.get()
+					if entry == None:
+						break
+					i, written = entry
+					results[i] = await written
+
+			await asyncio.gather(read_stage(), compile_stage(), write_stage())
+		return results
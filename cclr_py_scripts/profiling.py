@@ -0,0 +1,201 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from .compiler import Compiler
+from .parser import Parser
+from .lexer import Lexer
+
+class Profiler:
+	"""
+	Records where a build spends its time. *install* swaps the methods of each stage for wrappers
+	that time them, and *uninstall* puts the originals back, so nothing is measured, or slowed
+	down, while no profiler is installed. Every grammar rule of the Parser is counted, with how
+	often it called eoe and how often it moved the cursor back with token_restore or token_rewind.
+	"""
+	files:dict = {}		# Path -> record, see new_record
+	events:list = []	# Chrome trace events
+	patched:list = []	# (owner, name, original) of every installed wrapper
+	current:dict = None	# Record of the file being built
+	spans:list = []		# Time spent in the children of each open span
+	rules:list = []		# Names of the grammar rules being parsed
+	origin:float = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception) -> None:
+		self.uninstall()
+
+	def __init__(self) -> None:
+		self.files = {}
+		self.events = []
+		self.patched = []
+		self.current = None
+		self.spans = []
+		self.rules = []
+		self.origin = time.perf_counter()
+
+	def file(self, function):
+		"""Wraps *function*, called with a build task, to record everything below it for that task's file."""
+		@functools.wraps(function)
+		def wrapper(task, *args, **kwargs):
+			path:str = task[0]
+			record:dict = self.new_record()
+			self.files[path] = record
+			self.current = record
+
+			tracing:bool = tracemalloc.is_tracing()
+			if not tracing:
+				tracemalloc.start()
+			tracemalloc.reset_peak()
+			before:int = tracemalloc.get_traced_memory()[0]
+			start:float = time.perf_counter()
+			try:
+				with self.span(path, "file"):
+					return function(task, *args, **kwargs)
+			finally:
+				record["seconds"] = time.perf_counter() - start
+				record["peak_bytes"] = tracemalloc.get_traced_memory()[1] - before
+				if not tracing:
+					tracemalloc.stop()
+				self.current = None
+		return wrapper
+
+	def install(self, entry) -> None:
+		"""Installs every hook, including the read and write steps of the *entry* module."""
+		self.patch(Lexer, "tokenize", self.stage("lex", "tokens", len))
+		self.patch(Parser, "parse", self.stage("parse", "commands", lambda result: len(getattr(result, "commands", result))))
+		self.patch(Parser, "eoe", self.rule_counter("eoe_calls"))
+		self.patch(Parser, "token_restore", self.restore)
+		self.patch(Parser, "token_rewind", self.restore)
+		for name in sorted(vars(Parser)):
+			if name.startswith("p_"):
+				self.patch(Parser, name, self.rule)
+		self.patch(Compiler, "emit", self.stage("compile"))
+		self.patch(entry, "read_script", self.stage("read"))
+		self.patch(entry, "save_outputs", self.stage("write"))
+		self.patch(entry, "compile_script", self.file)
+		self.patch(entry, "compile_script_mapped", self.file)
+
+	def new_record(self) -> dict:
+		return {"seconds": 0, "peak_bytes": 0, "stages": {}, "counts": {}, "rules": {}}
+
+	def patch(self, owner, name:str, wrap) -> None:
+		original = vars(owner)[name]
+		self.patched.append( (owner, name, original) )
+		setattr(owner, name, wrap(original))
+
+	def record(self) -> dict:
+		if self.current == None: # Hooks called outside of a build task
+			self.current = self.files.setdefault("", self.new_record())
+		return self.current
+
+	def report(self) -> dict:
+		"""Returns every file's record, and the sum of them all."""
+		total:dict = self.new_record()
+		for record in self.files.values():
+			total["seconds"] += record["seconds"]
+			total["peak_bytes"] = max(total["peak_bytes"], record["peak_bytes"])
+			for key in ("stages", "counts"):
+				for name, value in record[key].items():
+					total[key][name] = total[key].get(name, 0) + value
+			for name, counts in record["rules"].items():
+				rule:dict = total["rules"].setdefault(name, {})
+				for key, value in counts.items():
+					rule[key] = rule.get(key, 0) + value
+		return {"files": self.files, "total": total}
+
+	def restore(self, function):
+		"""Wraps Parser.token_restore or token_rewind to count backtracking against the rule that did it."""
+		@functools.wraps(function)
+		def wrapper(parser, *args, **kwargs):
+			before:int = parser.cursor
+			function(parser, *args, **kwargs)
+			if parser.cursor < before:
+				counts:dict = self.rule_counts()
+				counts["backtracks"] += 1
+				counts["tokens_backtracked"] += before - parser.cursor
+		return wrapper
+
+	def rule(self, function):
+		"""Wraps a grammar rule of the Parser to count its calls."""
+		name:str = function.__name__
+		rules:list = self.rules
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			rules.append(name)
+			self.rule_counts()["calls"] += 1
+			try:
+				return function(*args, **kwargs)
+			finally:
+				rules.pop()
+		return wrapper
+
+	def rule_counter(self, key:str):
+		"""Makes a wrapper that adds one to *key* of the rule being parsed."""
+		def wrap(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				self.rule_counts()[key] += 1
+				return function(*args, **kwargs)
+			return wrapper
+		return wrap
+
+	def rule_counts(self) -> dict:
+		name:str = self.rules[-1] if self.rules else "<top>"
+		rules:dict = self.record()["rules"]
+		if name not in rules:
+			rules[name] = {"calls": 0, "eoe_calls": 0, "backtracks": 0, "tokens_backtracked": 0}
+		return rules[name]
+
+	@contextlib.contextmanager
+	def span(self, name:str, category:str="stage"):
+		"""
+		Times the code in the with block as a trace event. The time of a stage is added to the
+		current file without the time of the spans inside it, so stages never count twice.
+		"""
+		start:float = time.perf_counter()
+		self.spans.append(0.0)
+		try:
+			yield
+		finally:
+			duration:float = time.perf_counter() - start
+			children:float = self.spans.pop()
+			if self.spans:
+				self.spans[-1] += duration
+			if category == "stage":
+				stages:dict = self.record()["stages"]
+				stages[name] = stages.get(name, 0) + duration - children
+			self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(),
+				"tid": threading.get_ident(), "ts": (start - self.origin) * 1e6, "dur": duration * 1e6})
+
+	def stage(self, name:str, count:str=None, counter=None):
+		"""Makes a wrapper that times a stage, and adds *counter* of its result to *count*."""
+		def wrap(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				with self.span(name):
+					result = function(*args, **kwargs)
+				if count != None:
+					counts:dict = self.record()["counts"]
+					counts[count] = counts.get(count, 0) + counter(result)
+				return result
+			return wrapper
+		return wrap
+
+	def uninstall(self) -> None:
+		while self.patched:
+			owner, name, original = self.patched.pop()
+			setattr(owner, name, original)
+
+	def write(self, json_path:str, trace_path:str) -> None:
+		"""Writes the report as JSON to *json_path*, and the Chrome trace events to *trace_path*."""
+		with open(json_path, "w") as file:
+			json.dump(self.report(), file, indent="\t")
+		with open(trace_path, "w") as file:
+			json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
@@ -0,0 +1,34 @@
+class NullBar:
+	"""
+	Stands in for a disabled tqdm progress bar, so tqdm is only imported when a bar is shown.
+	"""
+	iterable = None
+	n:int = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception) -> None:
+		pass
+
+	def __init__(self, iterable=None) -> None:
+		self.iterable = iterable
+		self.n = 0
+
+	def __iter__(self):
+		return iter(self.iterable)
+
+	def close(self) -> None:
+		pass
+
+	def update(self, n:int=1) -> None:
+		self.n += n
+
+def progress(iterable=None, disable:bool=False, **options):
+	"""
+	Returns tqdm(*iterable*, **options), or a NullBar without importing tqdm when *disable* is set.
+	"""
+	if disable:
+		return NullBar(iterable)
+	from tqdm import tqdm
+	return tqdm(iterable, **options)
@@ -0,0 +1,253 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from .commands import script_errors
+from .compiler import Compiler
+from .dependencies import DependencyGraph
+from .parser import Parser
+from .lexer import Lexer
+from .manifest import Manifest, hash_source
+from .outputs import OutputFile
+
+class PollWaiter:
+	"""
+	Finds changed .cclr files by comparing the size and modification time of every file under a folder.
+	"""
+	folder:str = ""
+	interval:float = 0.1
+	stats:dict = {} # Path -> (size, mtime)
+
+	def __init__(self, folder:str, interval:float=0.1) -> None:
+		self.folder = folder
+		self.interval = interval
+		self.stats = self.scan()
+
+	def close(self) -> None:
+		pass
+
+	def scan(self) -> dict:
+		stats:dict = {}
+		for dir_p, dir_n, files in os.walk(self.folder):
+			for file_n in files:
+				if file_n.endswith(".cclr"):
+					path:str = os.path.join(dir_p, file_n)
+					try:
+						stat = os.stat(path)
+					except OSError:
+						continue
+					stats[path] = (stat.st_size, stat.st_mtime_ns)
+		return stats
+
+	def wait(self, timeout:float) -> set:
+		"""
+		Returns the paths that were changed, created or deleted, waiting up to *timeout* seconds for one.
+		"""
+		end:float = time.monotonic() + timeout
+		while True:
+			stats:dict = self.scan()
+			changed:set = {path for path in stats.keys() | self.stats.keys() if stats.get(path) != self.stats.get(path)}
+			self.stats = stats
+			if changed or time.monotonic() >= end:
+				return changed
+			time.sleep(min(self.interval, max(end - time.monotonic(), 0)))
+
+class InotifyWaiter:
+	"""
+	Finds changed .cclr files with Linux's inotify, so nothing is scanned while waiting.
+	"""
+	IN_MODIFY:int		= 0x002
+	IN_CLOSE_WRITE:int	= 0x008
+	IN_MOVED_FROM:int	= 0x040
+	IN_MOVED_TO:int		= 0x080
+	IN_CREATE:int		= 0x100
+	IN_DELETE:int		= 0x200
+	IN_ISDIR:int		= 0x40000000
+	MASK:int = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+	EVENT = struct.Struct("iIII") # wd, mask, cookie, name length
+
+	libc = None
+	fd:int = -1
+	folders:dict = {} # Watch descriptor -> folder
+
+	def __init__(self, folder:str) -> None:
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.folders = {}
+		for dir_p, dir_n, files in os.walk(folder):
+			self.add_folder(dir_p)
+
+	def add_folder(self, folder:str) -> None:
+		wd:int = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK)
+		if wd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_add_watch failed for '{}'".format(folder))
+		self.folders[wd] = folder
+
+	def close(self) -> None:
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
+
+	def wait(self, timeout:float) -> set:
+		changed:set = set()
+		if not select.select([self.fd], [], [], timeout)[0]:
+			return changed
+
+		while True:
+			try:
+				data:bytes = os.read(self.fd, 1<<16)
+			except BlockingIOError:
+				return changed
+
+			i:int = 0
+			while i < len(data):
+				wd, mask, cookie, length = self.EVENT.unpack_from(data, i)
+				i += self.EVENT.size
+				name:str = os.fsdecode(data[i:i+length].rstrip(b"\0"))
+				i += length
+
+				path:str = os.path.join(self.folders.get(wd, ""), name)
+				if mask & self.IN_ISDIR:
+					if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+						self.add_folder(path)
+						for dir_p, dir_n, files in os.walk(path):
+							changed.update(os.path.join(dir_p, file_n) for file_n in files if file_n.endswith(".cclr"))
+				elif name.endswith(".cclr") and not (mask & self.IN_CREATE):
+					changed.add(path) # A created file is reported again when it is closed after writing
+
+def make_waiter(folder:str, poll:bool=False, interval:float=0.1):
+	"""
+	Returns an InotifyWaiter where inotify is available and a PollWaiter otherwise.
+	"""
+	if not poll:
+		try:
+			return InotifyWaiter(folder)
+		except (OSError, AttributeError, TypeError):
+			pass
+	return PollWaiter(folder, interval)
+
+class WatchedScript:
+	digest:str = ""
+	tokens = None
+	commands = None
+
+	def __init__(self, digest:str, tokens=None, commands=None) -> None:
+		self.digest = digest
+		self.tokens = tokens
+		self.commands = commands
+
+class Watcher:
+	"""
+	Keeps the .cclr files under a folder built. The tokens and parse tree of every script built 
+	are kept in memory, so saving a file without changing it, or deleting its outputs, costs no 
+	lexing or parsing. Imports are found under the folder and included like a build does.
+	"""
+	folder:str = ""
+	cache:str = ""
+	output_base = None # Function from a script path, the cache and localoutput to its output path without extension
+	localoutput:bool = False
+	scripts:dict = {} # Path -> WatchedScript
+	manifest:Manifest = None
+
+	def __init__(self, folder:str, cache:str, output_base, localoutput:bool=False) -> None:
+		self.folder = folder
+		self.cache = cache
+		self.output_base = output_base
+		self.localoutput = localoutput
+		self.scripts = {}
+		self.manifest = Manifest(cache)
+		self.lexer = Lexer()
+		self.parser = Parser()
+
+	def build(self, paths) -> list:
+		"""
+		Builds every path in *paths* that changed, returning a list of (path, message).
+		"""
+		messages:list = []
+		options:dict = {"localoutput": self.localoutput}
+
+		def outputs_of(path:str) -> list:
+			out_path:str = self.output_base(path, self.cache, self.localoutput)
+			return [out_path+"cpp", out_path+"h"]
+
+		for path in [path for path in paths if not os.path.isfile(path)]:
+			self.scripts.pop(path, None)
+		paths = sorted([path for path in paths if os.path.isfile(path)])
+		graph:DependencyGraph = DependencyGraph()
+		graph.scan(paths, [self.folder])
+		waves, cyclic = graph.waves()
+		keys:set = set([os.path.abspath(path) for path in paths])
+		for key in [key for key in cyclic if key in keys]:
+			messages.append( (graph.paths[key], "Failed to compile '{}', it is in or imports an import cycle".format(graph.paths[key])) )
+
+		# Imported scripts are built first, like a build does, so their tree hashes are recorded
+		for key in [key for wave in waves for key in wave if key in keys]:
+			path:str = graph.paths[key]
+			outputs:list = outputs_of(path)
+			if key in graph.missing:
+				messages.append( (path, "Failed to compile '{}', can't find the imported script(s) {}".format(
+					path, ", ".join(["'%s'" % name for name in graph.missing[key]]))) )
+				continue
+
+			try:
+				with open(path, "r") as file:
+					script:str = file.read()
+			except (OSError, UnicodeDecodeError) as e: # Deleted since the event, or not text
+				self.scripts.pop(path, None)
+				messages.append( (path, "{}: {}".format(type(e).__name__, e)) )
+				messages.append( (path, "Failed to compile '{}'".format(path)) )
+				continue
+			digest:str = hash_source(script)
+
+			watched:WatchedScript = self.scripts.get(path)
+			if watched == None or watched.digest != digest:
+				watched = WatchedScript(digest)
+				self.scripts[path] = watched
+			if self.manifest.known_hash(path, options, outputs) == digest:
+				self.manifest.touch(path)
+				continue
+			if watched.commands == None:
+				watched.tokens = self.lexer.tokenize(script, recover=True)
+				watched.commands = self.parser.parse(watched.tokens, recover=True)
+
+			# Every error of the script is reported, like a build does
+			commands = watched.commands
+			errors:list = script_errors(commands.commands)
+			if errors:
+				messages += [(path, "{}: {}".format(path, message)) for row, col, message in errors]
+				messages.append( (path, "Failed to compile '{}'".format(path)) )
+				continue
+
+			with OutputFile(outputs[0]) as cpp_file, OutputFile(outputs[1]) as h_file:
+				Compiler(graph.includes(key, outputs_of)).emit(commands, cpp_file, h_file)
+			graph.record(key, self.manifest, digest, options, outputs)
+			messages.append( (path, "Compiled '{}' to '{}'".format(path, outputs[0][:-3]+"cpp/h")) )
+
+		self.manifest.save()
+		return messages
+
+	def run(self, waiter, timeout:float=1.0, on_message=print) -> None:
+		"""
+		Builds everything once, then rebuilds what *waiter* reports as changed until interrupted.
+		"""
+		paths:list = []
+		for dir_p, dir_n, files in os.walk(self.folder):
+			paths += [os.path.join(dir_p, file_n) for file_n in files if file_n.endswith(".cclr")]
+
+		try:
+			for path, message in self.build(paths):
+				on_message(message)
+			while True:
+				changed:set = waiter.wait(timeout)
+				if changed:
+					for path, message in self.build(changed):
+						on_message(message)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			waiter.close()
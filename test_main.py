@@ -1,10 +1,26 @@
 
+import contextlib
+import io
+import json
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
-from cclr_py_scripts import parser
+from cclr_py_scripts import entry, manifest, parsecache, parser, watch
+from cclr_py_scripts import distributed
+from cclr_py_scripts.pipeline import Pipeline
+from cclr_py_scripts.profiling import Profiler
 from cclr_py_scripts.commands import *
-from cclr_py_scripts.lexer import Lexer, TokenList
+from cclr_py_scripts.lexer import Lexer, Token, TOKEN_CODES, TokenList, TokenStream, TokenTypes
 from cclr_py_scripts.parser import Parser
-from cclr_py_scripts.compiler import Compiler
+from cclr_py_scripts.compiler import Compiler, compile_source, SourceCompiler
 from cclr_py_scripts.commands import *
 
 class TestLexer(unittest.TestCase):
@@ -23,8 +39,9 @@ class TestLexer(unittest.TestCase):
 	def test_empty(self) -> None:
 		l = Lexer()
 		self.assertEqual (
-			l.tokenize(""),
+			list(l.tokenize("")),
 			[] )
+		self.assertIsInstance( l.tokenize(""), TokenList ) # So an empty script can be edited
 
 	def test_names(self) -> None:
 		l = Lexer()
@@ -62,6 +79,144 @@ class TestLexer(unittest.TestCase):
 			str(l.tokenize("alc a b c do1thing 1andstuff")),
 			"alc a b c do1thing 1 andstuff" )
 
+	def test_rule_order(self) -> None:
+		l = Lexer()
+		tokens = l.tokenize("alc x:float = 1.5;// note\n\ta>=b == c")
+		self.assertEqual (
+			[(tk.text, tk.type) for tk in tokens],
+			[("alc", TokenTypes.VARNAME), ("x", TokenTypes.VARNAME), (":", TokenTypes.SYMBOL),
+			("float", TokenTypes.VARNAME), ("=", TokenTypes.SYMBOL), ("1", TokenTypes.INT),
+			(".5", TokenTypes.FLOAT), (";", TokenTypes.SYMBOL), ("// note", TokenTypes.COMMENT),
+			("\n", TokenTypes.NEWLINE), ("\t", TokenTypes.INDENT), ("a", TokenTypes.VARNAME),
+			(">=", TokenTypes.SYMBOL), ("b", TokenTypes.VARNAME), ("==", TokenTypes.SYMBOL),
+			("c", TokenTypes.VARNAME)] )
+		self.assertEqual (
+			[(tk.idx, tk.row, tk.col) for tk in tokens][-6:],
+			[(26, 1, 0), (27, 1, 1), (28, 1, 2), (30, 1, 4), (32, 1, 6), (35, 1, 9)] )
+
+	def test_invalid_token(self) -> None:
+		l = Lexer()
+		self.assertEqual( len(l.tokenize("alc a:int = 5;\n a, b")), 0 )
+		self.assertEqual( len(l.tokenize("a @;")), 0 )
+
+	def test_iter_tokens(self) -> None:
+		l = Lexer()
+		script = "alc(static) a:int = 5 * (b+1);\n\t// c\n\talc d:float = .5;\n"
+		expected = [(tk.text, tk.idx, tk.row, tk.col, tk.type) for tk in l.tokenize(script)]
+		for chunk_size in (1, 3, 7, 1000):
+			self.assertEqual (
+				[(tk.text, tk.idx, tk.row, tk.col, tk.type) for tk in l.iter_tokens(io.StringIO(script), chunk_size)],
+				expected )
+
+		self.assertEqual( [tk.text for tk in l.iter_tokens(io.StringIO("a\n@;"))], ["a", "\n"] )
+
+	def test_codes(self) -> None:
+		l = Lexer()
+		script = "alc(static) alcove:int = 5 >= b;\nimport a.b;\n"
+		tokens = l.tokenize(script)
+		codes = [tokens.code_at(i) for i in range(len(tokens))]
+		self.assertEqual( [TOKEN_CODES.get(tk.text, 0) for tk in tokens], codes )
+		self.assertEqual( codes[:4], [TOKEN_CODES["alc"], TOKEN_CODES["("], TOKEN_CODES["static"], TOKEN_CODES[")"]] )
+		self.assertEqual( (tokens.code_at(4), tokens.code_at(-1), tokens.code_at(len(tokens))), (0, 0, 0) )
+		self.assertEqual( [tk.code for tk in tokens], codes )
+		self.assertEqual( [tk.code for tk in l.iter_tokens(io.StringIO(script))], codes )
+
+		# Streamed names and fixed texts are shared strings
+		streamed = list(l.iter_tokens(io.StringIO(script * 2), 7))
+		self.assertIs( streamed[4].text, streamed[len(tokens)+4].text )
+		self.assertIs( streamed[0].text, streamed[len(tokens)].text )
+
+	def test_positions(self) -> None:
+		l = Lexer()
+		script = "alc a:int = 1;\n\talc b:int = a;\n\n    // c\n  alc c:int;"
+		tokens = l.tokenize(script)
+		self.assertIsNone( tokens.lines ) # Only found once a position is asked for
+		self.assertEqual( [(tk.text, tk.row, tk.col) for tk in tokens],
+			[(tk.text, tk.row, tk.col) for tk in l.iter_tokens(io.StringIO(script))] )
+		self.assertEqual( list(tokens.lines), [0, 15, 31, 32, 41] )
+		self.assertEqual( list(tokens.indents), [0, 1, 0, 4, 2] )
+		self.assertEqual( [tokens.indent_at(i) for i in range(len(tokens)) if tokens.type_at(i) == TokenTypes.INDENT], [1, 4, 2] )
+
+		# Positions of the tokens after an edit come from the edited script
+		before = tokens[-1]
+		l.relex(tokens, 0, 0, "alc z:int;\n")
+		self.assertEqual( [(tk.row, tk.col) for tk in tokens], [(tk.row, tk.col) for tk in l.tokenize(tokens.source)] )
+		self.assertEqual( (before.row, before.col), (4, 11) ) # Built before the edit
+
+		# The line index is updated for the edited lines only, never built again
+		for offset, deleted, inserted in ((0, 0, "\t\talc y:int;\n\n"), (len(tokens.source), 0, "\n\t"), (16, 5, "  b\n"),
+			(len(tokens.source) - 2, 2, ""), (27, 0, "\n    alc w:int;")):
+			self.assertIsNotNone( l.relex(tokens, offset, deleted, inserted) )
+			self.assertIsNotNone( tokens.lines )
+			fresh = l.tokenize(tokens.source)
+			fresh.line_index()
+			self.assertEqual( (tokens.lines, tokens.indents), (fresh.lines, fresh.indents) )
+			self.assertEqual( [(tk.row, tk.col) for tk in tokens], [(tk.row, tk.col) for tk in fresh] )
+			self.assertEqual( [tokens.indent_at(i) for i in range(len(tokens))], [fresh.indent_at(i) for i in range(len(fresh))] )
+
+	def test_compact_tokens(self) -> None:
+		l = Lexer()
+		script = "alc(static) a:int = 5 * (b+1);\n\talc d:float = .5;\n"
+		tokens = l.tokenize(script)
+		expected = TokenList(list(tokens))
+
+		self.assertEqual( str(tokens), str(expected) )
+		self.assertEqual( len(tokens), len(expected) )
+		self.assertEqual( tokens[-1].text, "\n" )
+		self.assertEqual( [tk.text for tk in tokens[2:5]], ["static", ")", "a"] )
+		for i in range(len(tokens)):
+			self.assertEqual( (tokens.text_at(i), tokens.type_at(i)), (expected.text_at(i), expected.type_at(i)) )
+			self.assertEqual( (tokens[i].idx, tokens[i].row, tokens[i].col), (expected[i].idx, expected[i].row, expected[i].col) )
+		self.assertEqual( tokens.text_at(len(tokens)), "" )
+
+		tokens[0] = Token("alc", 0, 0, 0, TokenTypes.KEYWORD)
+		self.assertEqual( tokens[0].type, TokenTypes.KEYWORD )
+		self.assertEqual( tokens.type_at(0), TokenTypes.KEYWORD )
+
+		tokens = l.tokenize(script * 200)
+		self.assertLess( sys.getsizeof(tokens) * 5, sum(sys.getsizeof(tk) + sys.getsizeof(tk.text) for tk in tokens) )
+
+	def test_boundaries(self) -> None:
+		l = Lexer()
+		script = "alc(static) a:int = (1 * (2 + 3));\nb + (c;\nd )"
+		tokens = l.tokenize(script)
+		texts = [tk.text for tk in tokens]
+		stream = TokenStream(iter(tokens))
+
+		for bounds in (tokens.boundaries(), stream.boundaries()):
+			self.assertEqual( bounds.next_terminator(0), texts.index(";") )
+			self.assertEqual( bounds.next_terminator(texts.index(";")+1), len(texts) - 1 - texts[::-1].index(";") )
+			self.assertEqual( bounds.next_terminator(len(texts)-1), -1 )
+			self.assertEqual( bounds.matching(1), 3 )
+			self.assertEqual( bounds.matching(8), 16 )
+			self.assertEqual( bounds.matching(11), 15 )
+
+		self.assertEqual( tokens.boundaries().matching(16), 8 )
+		self.assertEqual( tokens.boundaries().matching(texts.index("c") - 1), texts.index(")", texts.index("d")) )
+
+	def test_relex(self) -> None:
+		l = Lexer()
+		script = "alc a:int = 1;\nalc b:int = a + 2;\nalc c:int = b * 3;\n"
+		tokens = l.tokenize(script)
+		edits = [(12, 1, "10 + 5"), (0, 0, "alc z:int;\n"), (len("alc z:int;\n") + 14, 1, ""), (3, 0, " ")]
+		for offset, deleted, inserted in edits:
+			script = script[:offset] + inserted + script[offset+deleted:]
+			first, old_stop, new_stop = l.relex(tokens, offset, deleted, inserted)
+			expected = l.tokenize(script)
+			self.assertEqual( [(tk.text, tk.idx, tk.row, tk.col, tk.type) for tk in tokens], 
+				[(tk.text, tk.idx, tk.row, tk.col, tk.type) for tk in expected] )
+		self.assertEqual( tokens.source, script )
+
+		# Only the edited line is lexed, the tokens after it are moved by a pending shift
+		first, old_stop, new_stop = l.relex(tokens, 0, 0, "alc y:int;\n")
+		self.assertEqual( (first, old_stop, new_stop), (1, 1, 7) )
+		self.assertTrue( tokens.shift_keys )
+		tokens.compact()
+		self.assertEqual( [(tk.idx, tk.row) for tk in tokens], [(tk.idx, tk.row) for tk in l.tokenize(tokens.source)] )
+
+		self.assertIsNone( l.relex(tokens, 0, 0, "$") )
+		self.assertEqual( tokens.source[:3], "alc" )
+
 class TestParser(unittest.TestCase):
 	
 	CODE_EXPR = """1 + 1 + 1 + 1 + ( 1 ) + ( 1 + 1 ) * 5 * 5 * 5 * 5 * ( 5 ) * ( 5 * 5 ) - 6 - 6 - 6 - 6 - ( 6 ) - ( 6 - 6 )"""
@@ -95,6 +250,123 @@ class TestParser(unittest.TestCase):
 			str(parsed2), self.CODE_ALC_ADV
 		)
 
+	def test_comments(self) -> None:
+		l = Lexer()
+		code = "// first\nalc a:int = 1; /* after a */\n\t// indented\n\talc b:int;\n"
+		self.assertEqual( str(Parser().parse(l.tokenize(code))), str(Parser().parse(l.tokenize("alc a:int = 1;\n\talc b:int;\n"))) )
+
+	def test_stream(self) -> None:
+		l = Lexer()
+		p = Parser()
+
+		script = self.CODE_ALC_ADV * 50
+		stream = TokenStream( l.iter_tokens(io.StringIO(script), 64) )
+		window = 0
+		commands = []
+		for command in p.iter_parse(stream):
+			window = max(window, len(stream.window))
+			commands.append(command)
+
+		self.assertEqual( str(CmdScript(commands)), str(p.parse(l.tokenize(script))) )
+		self.assertLess( window, len(l.tokenize(self.CODE_ALC_ADV)) + 2 )
+
+	def test_precedence(self) -> None:
+		l = Lexer()
+		p = Parser()
+
+		expr = p.parse(l.tokenize("1 + 2 * 3 - 4")).commands[0]
+		self.assertEqual( (expr.op, str(expr.left), str(expr.right)), ("-", "1 + 2 * 3", "4") )
+		self.assertEqual( (expr.left.op, str(expr.left.right)), ("+", "2 * 3") )
+
+		expr = p.parse(l.tokenize("a >= b == !c | d & -e")).commands[0]
+		self.assertEqual( (expr.op, str(expr.left), str(expr.right)), ("|", "a >= b == ! c", "d & - e") )
+		self.assertEqual( (expr.left.op, expr.left.right.pre_op), ("==", "!") )
+
+		expr = p.parse(l.tokenize("a ? b : c ? d : e")).commands[0]
+		self.assertEqual( (expr.op, str(expr.left), str(expr.right)), ("?", "a", "b : c ? d : e") )
+
+	def test_long_expression(self) -> None:
+		l = Lexer()
+		p = Parser()
+		c = Compiler()
+
+		expr = " + ".join(["(a * 2)"] * 5000)
+		compiled = c.compile( p.parse(l.tokenize("alc v:int = %s;" % expr)) )
+		self.assertEqual( compiled, "int v = %s;\n" % " + ".join(["( a * 2 )"] * 5000) )
+
+	def test_packrat(self) -> None:
+		l = Lexer()
+		for code in (self.CODE_EXPR, self.CODE_ALC_BASIC, self.CODE_ALC_ADV, self.CODE_ALC_ADV * 20):
+			tokens = l.tokenize(code)
+			self.assertEqual( str(Parser(packrat=True).parse(tokens)), str(Parser().parse(tokens)) )
+
+		class CountingParser(Parser):
+			calls:int = 0
+			def p_counted(self) -> Command:
+				self.calls += 1
+				return self.p_expr_start()
+
+		p = CountingParser(packrat=True, memo_size=2)
+		p.tokens = l.tokenize(self.CODE_EXPR)
+		first = p.call_rule(p.p_counted)
+		end = p.cursor
+		p.cursor = -1
+		second = p.call_rule(p.p_counted)
+		self.assertIs( first, second )
+		self.assertEqual( (p.calls, p.cursor), (1, end) )
+		self.assertLessEqual( len(p.memo), 2 )
+
+	def test_reparse(self) -> None:
+		l = Lexer()
+		p = Parser()
+		script = "alc a:int = 1;\nalc b:int = a + 2;\n\nalc c:int = b * 3;\n"
+		tokens = l.tokenize(script)
+		cmd_script = p.parse(tokens)
+		commands = list(cmd_script.commands)
+
+		edits = [(12, 1, "10 + 5"), (0, 0, "alc z:int;\n"), (len("alc z:int;\n"), 0, "x * (y - 1)\n"), (0, 11, "")]
+		for offset, deleted, inserted in edits:
+			script = script[:offset] + inserted + script[offset+deleted:]
+			edit = l.relex(tokens, offset, deleted, inserted)
+			self.assertIs( p.reparse(cmd_script, tokens, *edit), cmd_script )
+			expected = Parser().parse(l.tokenize(script))
+			self.assertEqual( str(cmd_script), str(expected) )
+			self.assertEqual( (cmd_script.ends, cmd_script.states), (expected.ends, expected.states) )
+
+		# Commands after the edit are kept as they were
+		self.assertIs( cmd_script.commands[-1], commands[-1] )
+
+		# The ends after an edit only get a pending shift, until there are too many
+		script = "".join(["alc v%s:int = %s;\n" % (i, i) for i in range(100)])
+		tokens = l.tokenize(script)
+		cmd_script = p.parse(tokens)
+		values = cmd_script.ends.values
+		for i in range(80):
+			lines = script.splitlines(True)
+			offset = len("".join(lines[:(i * 37) % 90]))
+			inserted = "alc w%s:int;\n" % i if i % 3 else ""
+			deleted = 0 if i % 3 else len(lines[(i * 37) % 90])
+			script = script[:offset] + inserted + script[offset+deleted:]
+			self.assertIs( p.reparse(cmd_script, tokens, *l.relex(tokens, offset, deleted, inserted)), cmd_script )
+			if i == 0:
+				self.assertEqual( values[-1], 100 * 8 - 1 ) # Not rewritten
+				self.assertEqual( cmd_script.ends[-1], 99 * 8 - 1 )
+		expected = Parser().parse(l.tokenize(script))
+		self.assertEqual( (cmd_script.ends, cmd_script.states), (expected.ends, expected.states) )
+		self.assertEqual( str(cmd_script), str(expected) )
+
+		edit = l.relex(tokens, 0, 0, "alc e:int = (1;\n")
+		self.assertTrue( p.reparse(cmd_script, tokens, *edit)[0].is_error() )
+
+		# A script without commands is parsed again in full
+		for script in ("", "// Only a comment\n"):
+			tokens = l.tokenize(script)
+			cmd_script = p.parse(tokens)
+			self.assertIs( p.reparse(cmd_script, tokens, *l.relex(tokens, len(script), 0, "alc a:int = 1;\n")), cmd_script )
+			expected = Parser().parse(l.tokenize(script + "alc a:int = 1;\n"))
+			self.assertEqual( str(cmd_script), str(expected) )
+			self.assertEqual( (cmd_script.ends, cmd_script.states), (expected.ends, expected.states) )
+
 class TestCompiler(unittest.TestCase):
 
 	def test_compiler(self) -> None:
@@ -116,5 +388,772 @@ int new_var2 = ( 2 + 2 + 2 + 2 + 2 + 2 );
 		
 		self.assertEqual(compiled, expected)
 
+		source, header = io.StringIO(), io.StringIO()
+		c.emit( p.iter_parse( l.tokenize(code) ), source, header )
+		self.assertEqual( (source.getvalue(), header.getvalue()), (expected, "#pragma once\n" + "extern int new_var;\n"*2 + "extern int new_var2;\n") )
+
+		# The header only declares, a static is only in the source and a const is defined extern
+		source, header = io.StringIO(), io.StringIO()
+		c.emit( p.parse( l.tokenize("alc(static) s:int = 1;\nalc(const) k:int = 5;\nimport m;\n") ), source, header )
+		self.assertEqual( source.getvalue(), 'static int s = 1;\nextern const int k = 5;\n#include "m.h"\n' )
+		self.assertEqual( header.getvalue(), '#pragma once\nextern const int k;\n#include "m.h"\n' )
+
+	def test_compile_source(self) -> None:
+		self.assertEqual( compile_source(""), ("", "#pragma once\n", []) )
+		cpp, h, diagnostics = compile_source("alc a:int = 1;\nimport b.c;\n", {"b.c": "c.hpp"})
+		self.assertEqual( (cpp, h, diagnostics), ("int a = 1;\n#include \"c.hpp\"\n", "#pragma once\nextern int a;\n#include \"c.hpp\"\n", []) )
+		self.assertEqual( compile_source("alc a:int = $;\nalc b:int = 2;\nalc c int;\n"),
+			("", "", [(0, 12, "Error in line 0 col 12 : Invalid token '$'"), (2, 6, "Error in line 2 col 6 : Variable declaration expected a ':'")]) )
+
+		# Defaults are never shared between instances
+		self.assertIsNot( CmdScript().commands, CmdScript().commands )
+		self.assertIsNot( CmdGroup().left, CmdGroup().left )
+		self.assertIsNot( TokenList().tokens, TokenList().tokens )
+
+		sources = []
+		for i in range(40):
+			source = "".join(["alc v{}_{}:int = {} * ({} + v{}_{});\n".format(i, j, i, j, i, j-1) for j in range(i % 7 + 1)])
+			if i % 5 == 0:
+				source += "alc bad{}:int = {} $ 1;\n".format(i, i)
+			sources.append(source)
+		compiler = SourceCompiler()
+		expected = compiler.compile_all(sources)
+		self.assertEqual( sum([1 for result in expected if result[2]]), 8 )
+
+		# A compile started while another one is half way through doesn't disturb it
+		parser = compiler.take_parser()
+		commands = parser.iter_parse( Lexer().tokenize(sources[6]) )
+		first = next(commands)
+		self.assertEqual( compiler.compile(sources[3]), expected[3] )
+		self.assertEqual( Compiler().compile([first] + list(commands)), expected[6][0] )
+		compiler.give_parser(parser)
+
+		threads = 8
+		results = [None] * threads
+		barrier = threading.Barrier(threads)
+		def run(n:int) -> None:
+			barrier.wait()
+			order = sources[n:] + sources[:n]
+			results[n] = [compiler.compile(source) for _ in range(3) for source in order]
+
+		interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6) # Switch threads as often as possible
+		try:
+			workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+			for worker in workers:
+				worker.start()
+			for worker in workers:
+				worker.join()
+		finally:
+			sys.setswitchinterval(interval)
+
+		for n in range(threads):
+			self.assertEqual( results[n], (expected[n:] + expected[:n]) * 3 )
+		self.assertLessEqual( len(compiler.parsers), threads )
+		self.assertEqual( compiler.compile_all(sources, threads=4), expected )
+
+class TestBuild(unittest.TestCase):
+
+	def setUp(self) -> None:
+		self.folder = tempfile.TemporaryDirectory()
+		self.cache = os.path.join(self.folder.name, "__cclr__")
+		self.script = os.path.join(self.folder.name, "script.cclr")
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 1;\n")
+
+	def tearDown(self) -> None:
+		self.folder.cleanup()
+
+	def build(self, **options) -> str:
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			entry.build(self.script, self.cache, False, False, **options)
+		return output.getvalue()
+
+	def test_incremental(self) -> None:
+		self.assertIn( "Compiled", self.build() )
+		self.assertEqual( self.build(), "Skipped 1 unchanged script(s)\n" )
+
+		# Same text with a new modification time is still skipped
+		os.utime(self.script, ns=(0, 0))
+		self.assertEqual( self.build(), "Skipped 1 unchanged script(s)\n" )
+
+		with open(self.script, "w") as file:
+			file.write("alc b:int = 2;\n")
+		self.assertIn( "Compiled", self.build() )
+		self.assertIn( "Compiled", self.build(force=True) )
+
+		out_path = entry.output_base(self.script, self.cache, False)
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), "int b = 2;\n" )
+
+		os.remove(out_path + "h")
+		self.assertIn( "Compiled", self.build() )
+
+	def test_profile(self) -> None:
+		tokenize = Lexer.tokenize
+		self.build(profile=True)
+		self.assertIs( Lexer.tokenize, tokenize )
+
+		with open(os.path.join(self.cache, "profile.json")) as file:
+			record = json.load(file)["files"][self.script]
+		self.assertEqual( set(record["stages"]), {"read", "lex", "parse", "compile", "write"} )
+		self.assertEqual( record["counts"], {"tokens": 8, "commands": 1} )
+		self.assertEqual( record["rules"]["p_vardec_start"]["calls"], 1 )
+		self.assertGreater( record["peak_bytes"], 0 )
+
+		with open(os.path.join(self.cache, "trace.json")) as file:
+			events = json.load(file)["traceEvents"]
+		self.assertEqual( [event["name"] for event in events if event["cat"] == "file"], [self.script] )
+
+		# Rewinding the cursor is counted against the rule being parsed
+		with Profiler() as profiler:
+			profiler.install(entry)
+			p = Parser()
+			p.tokens = Lexer().tokenize("a + b")
+			p.token_save()
+			p.p_expr_start()
+			p.token_restore()
+
+			# So is the expression parser giving back an operator without a right side
+			p.tokens = Lexer().tokenize("a + )")
+			p.cursor = -1
+			p.p_expr(0)
+		rules = profiler.report()["total"]["rules"]
+		self.assertEqual( rules["<top>"]["tokens_backtracked"], 3 )
+		self.assertEqual( (rules["p_expr"]["backtracks"], rules["p_expr"]["tokens_backtracked"]), (1, 1) )
+
+	def test_parse_cache(self) -> None:
+		self.build()
+		with open(self.script) as file:
+			script = file.read()
+		digest = entry.hash_source(script)
+		cache = parsecache.ParseCache(self.cache)
+		self.assertTrue( os.path.isfile(cache.path(digest)) )
+
+		tokens, cmd_script = cache.load(digest, script)
+		self.assertEqual( str(cmd_script), str(Parser().parse(Lexer().tokenize(script))) )
+		self.assertEqual( [(tk.text, tk.idx, tk.row, tk.col) for tk in tokens], 
+			[(tk.text, tk.idx, tk.row, tk.col) for tk in Lexer().tokenize(script)] )
+
+		# A forced build loads the tokens and commands instead of lexing and parsing again
+		tokenize = Lexer.tokenize
+		Lexer.tokenize = None
+		try:
+			self.assertIn( "Compiled", self.build(force=True) )
+		finally:
+			Lexer.tokenize = tokenize
+
+		# Entries of another parser version are thrown away
+		parsecache.PARSER_VERSION += 1
+		try:
+			self.assertIsNone( cache.load(digest, script) )
+		finally:
+			parsecache.PARSER_VERSION -= 1
+		self.assertFalse( os.path.isfile(cache.path(digest)) )
+
+		# Entries of texts that are no longer built are removed
+		self.build(force=True)
+		with open(self.script, "w") as file:
+			file.write("alc c:int = 3;\n")
+		self.build()
+		self.assertFalse( os.path.isfile(cache.path(digest)) )
+
+	def test_write_if_changed(self) -> None:
+		self.assertIn( "Wrote 2 output file(s), left 0 identical output file(s) untouched", self.build() )
+		out_path = entry.output_base(self.script, self.cache, False)
+		for output in (out_path + "cpp", out_path + "h"):
+			os.utime(output, ns=(0, 0))
+
+		# A new text that compiles to the same code leaves the outputs alone
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 1; // Same code\n")
+		self.assertIn( "Wrote 0 output file(s), left 2 identical output file(s) untouched", self.build() )
+		self.assertEqual( [os.stat(output).st_mtime_ns for output in (out_path + "cpp", out_path + "h")], [0, 0] )
+
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 2;\n")
+		self.assertIn( "Wrote 1 output file(s), left 1 identical output file(s) untouched", self.build() ) # The declaration is the same
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), "int a = 2;\n" )
+		self.assertEqual( os.stat(out_path + "h").st_mtime_ns, 0 )
+		self.assertEqual( [name for name in os.listdir(os.path.dirname(out_path)) if name.endswith(".tmp")], [] )
+
+		# A failed write keeps the old file
+		with self.assertRaises( ValueError ):
+			with entry.OutputFile(out_path + "cpp") as file:
+				file.write("partial")
+				raise ValueError()
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), "int a = 2;\n" )
+
+	CXX_STUB:str = "\n".join([
+		"import sys",
+		"args = sys.argv[1:]",
+		"log = [arg[6:] for arg in args if arg.startswith('--log=')][0]",
+		"if '-E' in args:",
+		"	sys.stdout.write(open(args[args.index('-E')+1]).read())",
+		"	sys.exit(0)",
+		"source, output = args[args.index('-c')+1], args[args.index('-o')+1]",
+		"text = open(source).read()",
+		"if 'fail' in text:",
+		"	sys.exit('error: no fail allowed')",
+		"open(output, 'w').write('object of ' + text)",
+		"open(log, 'a').write(source + '\\n')",
+	])
+
+	def test_cxx(self) -> None:
+		stub = os.path.join(self.folder.name, "cxx_stub.py")
+		log = os.path.join(self.folder.name, "cxx.log")
+		with open(stub, "w") as file:
+			file.write(self.CXX_STUB)
+		cxx = "%s %s" % (shlex.quote(sys.executable), shlex.quote(stub))
+		flags = "--log=" + shlex.quote(log)
+		def compiled() -> list:
+			with open(log) as file:
+				return file.read().splitlines()
+		out_path = entry.output_base(self.script, self.cache, False)
+
+		self.assertIn( "Compiled 1 object file(s) with '%s', took 0 from the object cache" % cxx,
+			self.build(cxx=cxx, cxxflags=flags) )
+		with open(out_path + "o") as file:
+			self.assertEqual( file.read(), "object of int a = 1;\n" )
+
+		# Unchanged sources come from the cache, even when the object file is gone
+		os.remove(out_path + "o")
+		self.assertIn( "took 1 from the object cache", self.build(cxx=cxx, cxxflags=flags) )
+		self.assertTrue( os.path.isfile(out_path + "o") )
+		self.assertEqual( compiled(), [out_path + "cpp"] )
+
+		# Other flags are another object
+		self.assertIn( "Compiled 1 object file(s)", self.build(cxx=cxx, cxxflags=flags + " -O2") )
+		self.assertEqual( len(compiled()), 2 )
+
+		# Scripts are compiled in parallel, and failures are reported
+		for name, text in (("b.cclr", "alc b:int = 2;\n"), ("c.cclr", "alc fail:int = 3;\n")):
+			with open(os.path.join(self.folder.name, name), "w") as file:
+				file.write(text)
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(self.folder.name, self.cache, True, False, jobs=3, cxx=cxx, cxxflags=flags)
+		lines = output.getvalue().splitlines()
+		self.assertEqual( code, 1 )
+		self.assertIn( "error: no fail allowed", lines )
+		self.assertIn( "Compiled 1 object file(s) with '%s', took 1 from the object cache" % cxx, lines )
+		self.assertEqual( lines[-1], "1 C++ file(s) failed to compile" )
+
+	def test_cxx_imports(self) -> None:
+		cxx = shutil.which("c++") or shutil.which("g++") or shutil.which("clang++")
+		if cxx == None:
+			self.skipTest("no C++ compiler is installed")
+		folder = os.path.join(self.folder.name, "diamond")
+		os.makedirs(folder)
+		scripts = {
+			"base": "alc b:int = 1;\nalc(static) hidden:int = 2;\n",
+			"left": "import base;\nalc l:int = b + 1;\n",
+			"right": "import base;\nalc(const) r:int = 3;\n",
+			"top": "import left;\nimport right;\nalc t:int = b + l + r;\n",
+		}
+		for name, text in scripts.items():
+			with open(os.path.join(folder, name + ".cclr"), "w") as file:
+				file.write(text)
+
+		# Every header is included once, and every variable is defined in one object file
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(folder, self.cache, True, False, jobs=2, cxx=cxx)
+		self.assertEqual( code, 0, output.getvalue() )
+		main = os.path.join(self.cache, "main.cpp")
+		with open(main, "w") as file:
+			file.write('#include "{}h"\nint main() {{ return b == 1 && r == 3 && t >= 0 ? 0 : 1; }}\n'.format(
+				os.path.basename(entry.output_base(os.path.join(folder, "top.cclr"), self.cache, False))))
+		program = os.path.join(self.cache, "program")
+		objects = [entry.output_base(os.path.join(folder, name + ".cclr"), self.cache, False) + "o" for name in scripts]
+		linked = subprocess.run([cxx, main] + objects + ["-o", program], capture_output=True, text=True)
+		self.assertEqual( linked.returncode, 0, linked.stderr )
+		self.assertEqual( subprocess.run([program]).returncode, 0 )
+
+	def test_dependencies(self) -> None:
+		folder = os.path.join(self.folder.name, "deps")
+		os.makedirs(os.path.join(folder, "sub"))
+		scripts = {
+			"base": "alc b:int = 1;\n",
+			"mid": "import base;\nalc m:int = 2;\n",
+			"top": "// Imports may be nested\ninherit mid;\nalc t:int = 3;\n",
+			"other": "alc o:int = 4;\n",
+			"sub/leaf": "import base;\n", # Found in the build folder
+		}
+		paths = {name: os.path.join(folder, name + ".cclr") for name in scripts}
+		for name, text in scripts.items():
+			with open(paths[name], "w") as file:
+				file.write(text)
+
+		def build(path=folder, recursive=True, **options) -> tuple:
+			output = io.StringIO()
+			with contextlib.redirect_stdout(output):
+				code = entry.build(path, self.cache, recursive, False, **options)
+			lines = output.getvalue().splitlines()
+			return code, [name for line in lines for name in paths if line.startswith("Compiled '%s'" % paths[name])], lines
+
+		code, built, lines = build(jobs=2)
+		self.assertEqual( code, 0 )
+		self.assertEqual( sorted(built), sorted(scripts) )
+		self.assertLess( built.index("base"), built.index("mid") )
+		self.assertLess( built.index("mid"), built.index("top") )
+		self.assertLess( built.index("base"), built.index("sub/leaf") )
+		with open(entry.output_base(paths["top"], self.cache, False) + "cpp") as file:
+			self.assertEqual( file.read(), '#include "{}h"\nint t = 3;\n'.format(
+				os.path.basename(entry.output_base(paths["mid"], self.cache, False))) )
+		self.assertEqual( build()[2][-1], "Skipped 5 unchanged script(s)" )
+
+		# Only the scripts importing a changed script, directly or not, are built again
+		with open(paths["base"], "w") as file:
+			file.write("alc b:int = 10;\n")
+		self.assertEqual( sorted(build(jobs=2)[1]), ["base", "mid", "sub/leaf", "top"] )
+
+		# Even when the change was built by building another script first
+		with open(paths["base"], "w") as file:
+			file.write("alc b:int = 11;\n")
+		self.assertEqual( build(paths["top"], False)[1], ["base", "mid", "top"] )
+		self.assertEqual( build()[1], ["sub/leaf"] )
+
+		# Import cycles and missing scripts fail, and so does everything importing them
+		with open(paths["base"], "w") as file:
+			file.write("import top;\n")
+		with open(paths["other"], "w") as file:
+			file.write("import nowhere;\n")
+		code, built, lines = build()
+		self.assertEqual( (code, built), (1, []) )
+		self.assertIn( "Failed to compile '{}', it is in or imports an import cycle".format(paths["sub/leaf"]), lines )
+		self.assertIn( "Failed to compile '{}', can't find the imported script(s) 'nowhere'".format(paths["other"]), lines )
+		self.assertEqual( lines[-1], "5 script(s) failed to compile" )
+
+	def test_unreadable_dependency(self) -> None:
+		folder = os.path.join(self.folder.name, "unreadable")
+		os.makedirs(folder)
+		good, bad = os.path.join(folder, "good.cclr"), os.path.join(folder, "bad.cclr")
+		with open(good, "w") as file:
+			file.write("alc g:int = 1;\n")
+		with open(bad, "wb") as file:
+			file.write(b"alc b:int = 2;\xff\n")
+
+		# The script that isn't text fails like any other, the others are still built
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(folder, self.cache, True, False)
+		lines = output.getvalue().splitlines()
+		self.assertEqual( code, 1 )
+		self.assertIn( "Failed to compile '{}'".format(bad), lines )
+		self.assertIn( "Compiled '{}' to '{}'".format(good, entry.output_base(good, self.cache, False) + "cpp/h"), lines )
+		self.assertEqual( lines[-1], "1 script(s) failed to compile" )
+
+	def test_low_memory(self) -> None:
+		lines = ["alc v%d:int = (%d + 2) * v%d; // Line %d" % (i, i, max(i-1, 0), i) for i in range(3000)]
+		with open(self.script, "w") as file:
+			file.write("\n".join(lines) + "\n\talc last:bool = v1 >= 2;\n")
+		size = os.path.getsize(self.script)
+		out_path = entry.output_base(self.script, self.cache, False)
+
+		def build(**options) -> tuple:
+			tracemalloc.start()
+			try:
+				output = self.build(force=True, **options)
+				return output, tracemalloc.get_traced_memory()[1]
+			finally:
+				tracemalloc.stop()
+
+		output, peak = build()
+		self.assertGreater( peak, size )
+		with open(out_path + "cpp") as file:
+			expected = file.read()
+
+		# The same code, without ever holding the whole script
+		output, low_peak = build(low_memory=True)
+		self.assertIn( "Wrote 0 output file(s), left 2 identical output file(s) untouched", output )
+		self.assertLess( low_peak, peak / 10 )
+
+		# Errors keep the outputs as they were
+		with open(self.script, "a") as file:
+			file.write("alc a:int = 1 $;\n")
+		self.assertIn( "Invalid token '$'", self.build(low_memory=True) )
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 1;\nalc b int;\n")
+		self.assertIn( "Failed to compile", self.build(low_memory=True) )
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), expected )
+
+		# Windows line breaks build the same code as they do when the script is read as text
+		with open(self.script, "wb") as file:
+			file.write(b"alc a:int = 1;\r\nalc b:int = 2;\r\n")
+		self.assertIn( "Compiled '{}'".format(self.script), self.build(low_memory=True) )
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), "int a = 1;\nint b = 2;\n" )
+
+	def test_empty_scripts(self) -> None:
+		folder = os.path.join(self.folder.name, "empty")
+		os.mkdir(folder)
+		for name, text in (("blank", ""), ("comment", "// Nothing yet\n\n"), ("code", "alc a:int;\n")):
+			with open(os.path.join(folder, name + ".cclr"), "w") as file:
+				file.write(text)
+
+		# A script without commands is an empty translation unit, also when it comes from the ParseCache
+		for options in ({}, {"force": True}, {"force": True, "low_memory": True}):
+			output = io.StringIO()
+			with contextlib.redirect_stdout(output):
+				self.assertEqual( entry.build(folder, self.cache, True, False, **options), 0 )
+			self.assertNotIn( "Failed", output.getvalue() )
+		with open(entry.output_base(os.path.join(folder, "comment.cclr"), self.cache, False) + "h") as file:
+			self.assertEqual( file.read(), "#pragma once\n" )
+
+	def test_diagnostics(self) -> None:
+		folder = os.path.join(self.folder.name, "scripts")
+		os.mkdir(folder)
+		scripts = {
+			"a": "alc v:int = 1;\n",
+			"b": "alc v int;\nalc w:int = 2;\nalc x:int = 1 $;\n",
+			"c": "alc y int;\n",
+			"d": "alc z:int = 4;\n",
+		}
+		for name, text in scripts.items():
+			with open(os.path.join(folder, name + ".cclr"), "w") as file:
+				file.write(text)
+		path = lambda name: os.path.join(folder, name + ".cclr")
+
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(folder, self.cache, True, False, jobs=2)
+		lines = output.getvalue().splitlines()
+
+		# Every error of every script is reported once, sorted, and the healthy scripts still compile
+		self.assertEqual( code, 1 )
+		start = lines.index("3 error(s) in 2 script(s):")
+		self.assertEqual( lines[start+1:start+4], [
+			"{}: Error in line 0 col 6 : Variable declaration expected a ':'".format(path("b")),
+			"{}: Error in line 2 col 14 : Invalid token '$'".format(path("b")),
+			"{}: Error in line 0 col 6 : Variable declaration expected a ':'".format(path("c")),
+		] )
+		for name in ("a", "d"):
+			self.assertTrue( os.path.isfile(entry.output_base(path(name), self.cache, False) + "cpp") )
+		self.assertEqual( lines[-1], "2 script(s) failed to compile" )
+
+	def test_pipeline(self) -> None:
+		folder = os.path.join(self.folder.name, "scripts")
+		os.mkdir(folder)
+		for i in range(8):
+			with open(os.path.join(folder, "s%s.cclr" % i), "w") as file:
+				file.write("alc v:int = %s;\n" % i if i != 5 else "alc v int;\n")
+
+		def build(**options) -> tuple:
+			output = io.StringIO()
+			with contextlib.redirect_stdout(output):
+				code = entry.build(folder, self.cache, True, False, force=True, **options)
+			outputs = {}
+			for path in entry.get_script_paths_r(folder):
+				out_path = entry.output_base(path, self.cache, False)
+				if os.path.isfile(out_path + "cpp"):
+					with open(out_path + "cpp") as cpp_file, open(out_path + "h") as h_file:
+						outputs[path] = (cpp_file.read(), h_file.read())
+			return code, output.getvalue(), outputs
+
+		# The same log, in the same order, and the same outputs as the serial driver
+		serial = build()
+		shutil.rmtree(self.cache)
+		self.assertEqual( build(pipeline=True), serial )
+		self.assertEqual( len(serial[2]), 7 )
+
+		# The stages overlap, but a slow stage holds back the ones before it
+		pending = []
+		most = [0]
+		lock = threading.Lock()
+		def read(item:int) -> int:
+			with lock:
+				pending.append(item)
+				most[0] = max(most[0], len(pending))
+			return item * 2
+		def write(item:int, value:int) -> int:
+			time.sleep(0.002)
+			with lock:
+				pending.remove(item)
+			return value + 1
+		results = Pipeline(read, lambda item, value: value, write, depth=2).run(range(40))
+		self.assertEqual( results, [i * 2 + 1 for i in range(40)] )
+		self.assertLessEqual( most[0], 2 * 2 + 4 )
+
+	def test_distributed(self) -> None:
+		folder = os.path.join(self.folder.name, "scripts")
+		os.mkdir(folder)
+		for i in range(8):
+			with open(os.path.join(folder, "s%s.cclr" % i), "w") as file:
+				file.write("alc v:int = %s;\n" % i if i != 5 else "alc v int;\n")
+		with open(os.path.join(folder, "s8.cclr"), "w") as file:
+			file.write("import s0;\nalc w:int = 8;\n")
+
+		def build(force=True, **options) -> tuple:
+			output = io.StringIO()
+			with contextlib.redirect_stdout(output):
+				code = entry.build(folder, self.cache, True, False, force=force, **options)
+			outputs = {}
+			for path in entry.get_script_paths_r(folder):
+				out_path = entry.output_base(path, self.cache, False)
+				if os.path.isfile(out_path + "cpp"):
+					with open(out_path + "cpp") as cpp_file, open(out_path + "h") as h_file:
+						outputs[path] = (cpp_file.read(), h_file.read())
+			return code, output.getvalue(), outputs
+
+		def start_workers(count:int, port:int) -> list:
+			compiled = []
+			workers = [threading.Thread(target=lambda: compiled.append(distributed.serve(("127.0.0.1", port), 10))) for _ in range(count)]
+			for worker in workers:
+				worker.start()
+			return workers, compiled
+
+		serial = build()
+		shutil.rmtree(self.cache)
+		with socket.socket() as probe: # A free port for the coordinator
+			probe.bind(("127.0.0.1", 0))
+			port = probe.getsockname()[1]
+
+		# A worker started before the coordinator keeps trying to connect, and stops with the build
+		workers, compiled = start_workers(1, port)
+		code, output, outputs = build(coordinator="127.0.0.1:%s" % port)
+		for worker in workers:
+			worker.join(10)
+		self.assertEqual( (code, output.split("\n", 1)[1], outputs), serial )
+		self.assertEqual( output.split("\n", 1)[0], "Waiting for workers on 127.0.0.1:%s" % port )
+		self.assertEqual( sum(compiled), 9 )
+
+		# Only the script that failed isn't in the ResultCache, unless the build is forced
+		os.remove(os.path.join(self.cache, "manifest.json"))
+		for force, count in ((False, 1), (True, 9)):
+			workers, compiled = start_workers(1, port)
+			self.assertEqual( build(force, coordinator="127.0.0.1:%s" % port)[2], serial[2] )
+			for worker in workers:
+				worker.join(10)
+			self.assertEqual( sum(compiled), count )
+
+		# Nor is anything built by another version of cclr
+		key = distributed.ResultCache.key("hash", {})
+		version = distributed.VERSION[0]
+		distributed.VERSION[0] = version + ".1"
+		try:
+			self.assertNotEqual( distributed.ResultCache.key("hash", {}), key )
+		finally:
+			distributed.VERSION[0] = version
+
+		def lost_worker(address:tuple) -> None:
+			with socket.create_connection(address) as sock:
+				distributed.send_message(sock, {"type": "hello", "version": distributed.VERSION})
+				distributed.recv_message(sock) # Lost while compiling its first script
+
+		slow = []
+		def slow_worker(address:tuple) -> None:
+			with socket.create_connection(address) as sock:
+				distributed.send_message(sock, {"type": "hello", "version": distributed.VERSION})
+				while True:
+					message = distributed.recv_message(sock)
+					if message["type"] != "compile":
+						break
+					time.sleep(0.05)
+					slow.append(message["path"])
+					cpp, h, errors = compile_source(message["script"], message["includes"])
+					distributed.send_message(sock, {"type": "result", "log": "", "errors": errors, "texts": [cpp, h]})
+
+		def run(coordinator, workers:list, count:int) -> list:
+			cache = tempfile.mkdtemp(dir=self.folder.name)
+			tasks = []
+			for i in range(count):
+				path = os.path.join(cache, "t%s.cclr" % i)
+				with open(path, "w") as file:
+					file.write("alc t%s:int = %s;\n" % (i, i))
+				tasks.append( (path, [path[:-4] + "cpp", path[:-4] + "h"], None, cache, {}) )
+			threads = [threading.Thread(target=worker, args=(coordinator.address,)) for worker in workers]
+			for thread in threads:
+				thread.start()
+			with coordinator.condition:
+				coordinator.condition.wait_for(lambda: len(coordinator.workers) == len(workers), 10)
+			output = io.StringIO()
+			with contextlib.redirect_stdout(output):
+				results = coordinator.run(tasks)
+			coordinator.close()
+			for thread in threads:
+				thread.join(10)
+			for i, (status, digest, log, written, errors) in enumerate(results):
+				self.assertEqual( (status, written, errors), (entry.BuildStatus.COMPILED, 2, []) )
+				with open(tasks[i][1][0]) as file:
+					self.assertEqual( file.read(), "int t%s = %s;\n" % (i, i) )
+			return output.getvalue()
+
+		# The script of the lost worker is sent again, its shard and the slow worker's are stolen
+		real = lambda address: distributed.serve(address, 10)
+		self.assertEqual( run(distributed.Coordinator(("127.0.0.1", 0), wait=10), [lost_worker, slow_worker, real], 30), "" )
+		self.assertLess( len(slow), 10 )
+
+		# Without retries left or workers, scripts are compiled by the coordinator
+		self.assertEqual( run(distributed.Coordinator(("127.0.0.1", 0), wait=10, retries=0), [lost_worker], 3),
+			"No worker is left, building 3 script(s) here\n" )
+
+	def test_parallel(self) -> None:
+		folder = os.path.join(self.folder.name, "scripts")
+		os.mkdir(folder)
+		for i in range(6):
+			with open(os.path.join(folder, "s%s.cclr" % i), "w") as file:
+				file.write("alc v:int = %s;\n" % i if i != 3 else "alc v int;\n")
+
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(folder, self.cache, True, False, jobs=3)
+		lines = output.getvalue().splitlines()
+
+		self.assertEqual( code, 1 )
+		self.assertEqual( lines[-1], "1 script(s) failed to compile" )
+		self.assertEqual( [line for line in lines if line.startswith("Compiled")],
+			["Compiled '{}' to '{}'".format(path, entry.output_base(path, self.cache, False)+"cpp/h")
+			for path in entry.get_script_paths_r(folder) if not path.endswith("s3.cclr")] )
+		self.assertIn( "{}: Error in line 0 col 6 : Variable declaration expected a ':'".format(os.path.join(folder, "s3.cclr")), lines )
+
+		with open(os.path.join(folder, "s3.cclr"), "w") as file:
+			file.write("alc v:int;\n")
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			code = entry.build(folder, self.cache, True, False, jobs=3)
+		self.assertEqual( code, 0 )
+		self.assertEqual( output.getvalue().splitlines()[-1], "Skipped 5 unchanged script(s)" )
+
+	def test_cold_start(self) -> None:
+		# Importing the CLI must not load what only some commands need, nor build the lexer's patterns
+		code = "import sys, cclr_py_scripts.entry\n"													\
+			"from cclr_py_scripts.lexer import Lexer\n"												\
+			"print(sorted(m for m in ('tqdm', 'concurrent.futures.process', 'cclr_py_scripts.watch',"	\
+			" 'cclr_py_scripts.profiling') if m in sys.modules))\n"									\
+			"print('codes' in Lexer.__dict__ and isinstance(Lexer.__dict__['codes'], dict))"
+		result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+			capture_output=True, text=True, check=True)
+		self.assertEqual( result.stdout.splitlines(), ["[]", "False"] )
+
+		# The patterns are still there once used
+		self.assertEqual( Lexer.codes[Lexer.RE_INDENT], TokenTypes.INDENT )
+		self.assertIsInstance( vars(Lexer)["codes"], dict )
+
+class TestWatch(unittest.TestCase):
+
+	def setUp(self) -> None:
+		self.folder = tempfile.TemporaryDirectory()
+		self.cache = os.path.join(self.folder.name, "__cclr__")
+		self.src = os.path.join(self.folder.name, "src")
+		os.mkdir(self.cache)
+		os.mkdir(self.src)
+		self.script = os.path.join(self.src, "a.cclr")
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 1;\n")
+
+	def tearDown(self) -> None:
+		self.folder.cleanup()
+
+	def test_rebuild(self) -> None:
+		w = watch.Watcher(self.src, self.cache, entry.output_base)
+		out_path = entry.output_base(self.script, self.cache, False)
+
+		self.assertEqual( [path for path, message in w.build([self.script])], [self.script] )
+		self.assertEqual( w.build([self.script]), [] )
+
+		with open(self.script, "w") as file:
+			file.write("alc a:int = 2;\n")
+		self.assertEqual( len(w.build([self.script])), 1 )
+		with open(out_path + "cpp") as file:
+			self.assertEqual( file.read(), "int a = 2;\n" )
+
+		# The parse tree in memory is reused when only the outputs are gone
+		tokens = w.scripts[self.script].tokens
+		os.remove(out_path + "h")
+		self.assertEqual( len(w.build([self.script])), 1 )
+		self.assertIs( w.scripts[self.script].tokens, tokens )
+
+		# Another watcher starts from the manifest without parsing
+		w2 = watch.Watcher(self.src, self.cache, entry.output_base)
+		self.assertEqual( w2.build([self.script]), [] )
+		self.assertEqual( w2.scripts[self.script].commands, None )
+
+	def test_unreadable(self) -> None:
+		w = watch.Watcher(self.src, self.cache, entry.output_base)
+		bad = os.path.join(self.src, "bad.cclr")
+		with open(bad, "wb") as file:
+			file.write(b"alc b:int = \xff;\n")
+
+		# The script that can't be read is reported and the others are still built
+		messages = w.build([bad, self.script])
+		self.assertEqual( [path for path, message in messages], [self.script, bad, bad] )
+		self.assertTrue( messages[1][1].startswith("UnicodeDecodeError: ") )
+		self.assertEqual( messages[2][1], "Failed to compile '{}'".format(bad) )
+		self.assertTrue( os.path.isfile(entry.output_base(self.script, self.cache, False) + "cpp") )
+
+	def test_imports(self) -> None:
+		os.mkdir(os.path.join(self.src, "lib"))
+		lib = os.path.join(self.src, "lib", "b.cclr")
+		with open(lib, "w") as file:
+			file.write("alc b:int = 2;\n")
+		with open(self.script, "w") as file:
+			file.write("import lib.b;\nalc a:int = 1;\n")
+
+		def built() -> tuple:
+			with open(entry.output_base(self.script, self.cache, False) + "cpp") as file:
+				cpp = file.read()
+			entries = manifest.Manifest(self.cache).entries
+			return cpp, {path: {name: value for name, value in entries[path].items() if name not in ("size", "mtime")}
+				for path in (os.path.abspath(lib), os.path.abspath(self.script))}
+
+		# The watcher includes the imported header and records the imports like a build
+		w = watch.Watcher(self.src, self.cache, entry.output_base)
+		self.assertEqual( len(w.build([self.script, lib])), 2 )
+		watched = built()
+		self.assertTrue( watched[0].startswith('#include "{}h"\n'.format(os.path.basename(entry.output_base(lib, self.cache, False)))) )
+		with contextlib.redirect_stdout(io.StringIO()):
+			self.assertEqual( entry.build(self.src, self.cache, True, False, force=True), 0 )
+		self.assertEqual( built(), watched )
+
+		# A missing import is reported
+		with open(self.script, "w") as file:
+			file.write("import lib.c;\n")
+		self.assertEqual( w.build([self.script]), [(self.script,
+			"Failed to compile '{}', can't find the imported script(s) 'lib.c'".format(self.script))] )
+
+	def test_errors(self) -> None:
+		w = watch.Watcher(self.src, self.cache, entry.output_base)
+		with open(self.script, "w") as file:
+			file.write("alc a:int = $;\nalc b:int = 2;\nalc c int;\n")
+
+		# Every error is reported with the lexer's or parser's own message
+		self.assertEqual( [message for path, message in w.build([self.script])], [
+			"{}: Error in line 0 col 12 : Invalid token '$'".format(self.script),
+			"{}: Error in line 2 col 6 : Variable declaration expected a ':'".format(self.script),
+			"Failed to compile '{}'".format(self.script)] )
+
+	def check_waiter(self, waiter) -> None:
+		try:
+			self.assertEqual( waiter.wait(0.01), set() )
+			time.sleep(0.01)
+			with open(self.script, "w") as file:
+				file.write("alc a:int = 3;\n")
+			added = os.path.join(self.src, "b.cclr")
+			with open(added, "w") as file:
+				file.write("alc b:int;\n")
+
+			changed = set()
+			end = time.monotonic() + 2
+			while changed != {self.script, added} and time.monotonic() < end:
+				changed |= waiter.wait(0.5)
+			self.assertEqual( changed, {self.script, added} )
+		finally:
+			waiter.close()
+
+	def test_poll(self) -> None:
+		self.check_waiter( watch.PollWaiter(self.src, 0.01) )
+
+	def test_inotify(self) -> None:
+		try:
+			waiter = watch.InotifyWaiter(self.src)
+		except (OSError, AttributeError, TypeError):
+			self.skipTest("inotify is not available")
+		self.check_waiter(waiter)
+
 if __name__ == "__main__":
 	unittest.main()